@@ -4,16 +4,24 @@ import logging
 
 import pandas
 
+from src.network.commercial_link import CommercialLink
+
 if TYPE_CHECKING:
     from src.network.sc_network import ScNetwork
     from src.network.transport_network import TransportNetwork
-    from src.network.commercial_link import CommercialLink
 
 
 EPSILON = 1e-6
+AGENT_SLOTS = ('agent_type', 'pid', 'od_point', 'name', 'long', 'lat', 'usd_per_ton')
 
 
 class Agent(object):
+    # No per-instance __dict__ at this level, so that the compact variants of the agents can be fully slotted
+    __slots__ = ()
+    commercial_link_class = CommercialLink
+    # Type of the records describing the clients of the agent, in its `clients` dict
+    client_info_class = dict
+
     def __init__(self, agent_type, pid, od_point=0, name=None,
                  long=None, lat=None):
         self.agent_type = agent_type
@@ -66,11 +74,11 @@ class Agent(object):
 
         # for each incoming link, receive product and pay
         # the way differs between service and shipment
-        for edge in sc_network.in_edges(self):
-            if sc_network[edge[0]][self]['object'].product_type in sectors_no_transport_network:
-                self.receive_service_and_pay(sc_network[edge[0]][self]['object'])
+        for _, commercial_link in sc_network.in_links(self):
+            if commercial_link.product_type in sectors_no_transport_network:
+                self.receive_service_and_pay(commercial_link)
             else:
-                self.receive_shipment_and_pay(sc_network[edge[0]][self]['object'], transport_network)
+                self.receive_shipment_and_pay(commercial_link, transport_network)
 
     def receive_service_and_pay(self, commercial_link):
         # Always available, same price
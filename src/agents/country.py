@@ -6,16 +6,20 @@ import geopandas as gpd
 import logging
 
 from src.model.basic_functions import calculate_distance_between_agents, rescale_values, \
-    generate_weights_from_list
-from src.agents.agent import Agent, Agents
-from src.network.commercial_link import CommercialLink
+    generate_weights_from_list, CompactStateMixin, ClientInfo, ExportSupplierInfo
+from src.agents.agent import Agent, Agents, AGENT_SLOTS
+from src.network.commercial_link import CommercialLink, CompactCommercialLink
 
 if TYPE_CHECKING:
     from src.network.transport_network import TransportNetwork
     from src.network.sc_network import ScNetwork
 
 
-class Country(Agent):
+class CountryBase(Agent):
+    """Methods of Country and CompactCountry, which store their attributes in a __dict__ and in slots respectively"""
+    __slots__ = ()
+    # Type of the records describing the exporting firms of the country, in its `qty_purchased_perfirm` dict
+    supplier_info_class = dict
 
     def __init__(self, pid=None, qty_sold=None, qty_purchased=None, od_point=None, long=None, lat=None,
                  purchase_plan=None, transit_from=None, transit_to=None, supply_importance=None,
@@ -51,8 +55,11 @@ class Country(Agent):
         self.tonkm_transported = 0
         self.extra_spending = 0
         self.consumption_loss = 0
+        self.loss_tracker = None
 
     def reset_variables(self):
+        if self.loss_tracker:
+            self.loss_tracker.remove(self)
         self.generalized_transport_cost = 0
         self.usd_transported = 0
         self.tons_transported = 0
@@ -61,19 +68,25 @@ class Country(Agent):
         self.consumption_loss = 0
 
     def reset_indicators(self):
+        if self.loss_tracker:
+            self.loss_tracker.remove(self)
         self.extra_spending = 0
         self.consumption_loss = 0
 
     def update_indicator(self, quantity_delivered: float, price: float, commercial_link: "CommercialLink"):
         super().update_indicator(quantity_delivered, price, commercial_link)
-        self.extra_spending += quantity_delivered * (price - commercial_link.eq_price)
-        self.consumption_loss += commercial_link.delivery - quantity_delivered
+        new_extra_spending = quantity_delivered * (price - commercial_link.eq_price)
+        new_consumption_loss = commercial_link.delivery - quantity_delivered
+        self.extra_spending += new_extra_spending
+        self.consumption_loss += new_consumption_loss
+        if self.loss_tracker:
+            self.loss_tracker.add(self, new_extra_spending, new_consumption_loss)
 
     def create_transit_links(self, graph, countries):
         for selling_country_pid, quantity in self.transit_from.items():
             selling_country_object = [country for pid, country in countries.items() if pid == selling_country_pid][0]
             graph.add_edge(selling_country_object, self,
-                           object=CommercialLink(
+                           object=self.commercial_link_class(
                                pid=str(selling_country_pid) + '->' + str(self.pid),
                                product='transit',
                                product_type="transit",  # suppose that transit type are non service, material stuff
@@ -82,13 +95,15 @@ class Country(Agent):
                                buyer_id=self.pid))
             graph[selling_country_object][self]['weight'] = 1
             self.purchase_plan[selling_country_pid] = quantity
-            selling_country_object.clients[self.pid] = {'sector': self.pid, 'share': 0, 'transport_share': 0}
+            selling_country_object.clients[self.pid] = selling_country_object.client_info_class(
+                sector=self.pid, share=0, transport_share=0)
 
-    def select_suppliers(self, graph, firms, country_list,
-                         sector_table: pd.DataFrame, transport_nodes: gpd.GeoDataFrame):
-        # Select other country as supplier: transit flows
-        self.create_transit_links(graph, country_list)
+    def choose_suppliers(self, firms, sector_table: pd.DataFrame, transport_nodes: gpd.GeoDataFrame,
+                         rng: np.random.Generator | None = None) -> list:
+        """Draw the exporting firms of each sector, without modifying the supply chain network
 
+        Returns a list of (sector, supplier ids, supplier weights), to be given to link_suppliers
+        """
         # Identify firms from each sector
         dic_sector_to_firm_id = identify_firms_in_each_sector(firms)
         share_exporting_firms = sector_table.set_index('sector')['share_exporting_firms'].to_dict()
@@ -99,6 +114,9 @@ class Country(Agent):
         present_sectors = list(set(list(dic_sector_to_firm_id.keys())))
         sectors_to_buy_from = list(self.qty_purchased.keys())
         present_sectors_to_buy_from = list(set(present_sectors) & set(sectors_to_buy_from))
+        if rng is not None:
+            # The draws of the country's own generator should not depend on the iteration order of the set
+            present_sectors_to_buy_from.sort()
         # For each one of these sectors, select suppliers
         supplier_selection_mode = {
             "importance_export": {
@@ -107,6 +125,7 @@ class Country(Agent):
                 # give more weight to firms located in transport node identified as "export points" (e.g., SEZs)
             }
         }
+        chosen_suppliers = []
         for sector in present_sectors_to_buy_from:  # only select suppliers from sectors that are present
             # Identify potential suppliers
             potential_supplier_pid = dic_sector_to_firm_id[sector]
@@ -124,13 +143,30 @@ class Country(Agent):
                 potential_supplier_pid,
                 nb_suppliers_to_select,
                 firms,
-                mode=supplier_selection_mode
+                mode=supplier_selection_mode,
+                rng=rng
             )
+            chosen_suppliers.append((sector, selected_supplier_ids, supplier_weights))
+        return chosen_suppliers
+
+    def select_suppliers(self, graph, firms, country_list,
+                         sector_table: pd.DataFrame, transport_nodes: gpd.GeoDataFrame,
+                         rng: np.random.Generator | None = None):
+        chosen_suppliers = self.choose_suppliers(firms, sector_table, transport_nodes, rng)
+        self.link_suppliers(graph, firms, country_list, chosen_suppliers)
+
+    def link_suppliers(self, graph, firms, country_list, chosen_suppliers: list):
+        """Create the transit links, and the export links with the firms drawn by choose_suppliers"""
+        # Select other country as supplier: transit flows
+        self.create_transit_links(graph, country_list)
+
+        for sector, selected_supplier_ids, supplier_weights in chosen_suppliers:
+            supplier_weights = list(supplier_weights)
             # Materialize the link
             for supplier_id in selected_supplier_ids:
                 # For each supplier, create an edge in the economic network
                 graph.add_edge(firms[supplier_id], self,
-                               object=CommercialLink(
+                               object=self.commercial_link_class(
                                    pid=str(supplier_id) + '->' + str(self.pid),
                                    product=sector,
                                    product_type=firms[supplier_id].sector_type,
@@ -141,27 +177,27 @@ class Country(Agent):
                 weight = supplier_weights.pop(0)
                 graph[firms[supplier_id]][self]['weight'] = weight
                 # Households save the name of the retailer, its sector, its weight, and adds it to its purchase plan
-                self.qty_purchased_perfirm[supplier_id] = {
-                    'sector': sector,
-                    'weight': weight,
-                    'amount': self.qty_purchased[sector] * weight
-                }
+                self.qty_purchased_perfirm[supplier_id] = self.supplier_info_class(
+                    sector=sector,
+                    weight=weight,
+                    amount=self.qty_purchased[sector] * weight
+                )
                 self.purchase_plan[supplier_id] = self.qty_purchased[sector] * weight
                 # The supplier saves the fact that it exports to this country.
                 # The share of sales cannot be calculated now, we put 0 for the moment
                 distance = calculate_distance_between_agents(self, firms[supplier_id])
-                firms[supplier_id].clients[self.pid] = {
-                    'sector': self.pid, 'share': 0, 'transport_share': 0, 'distance': distance
-                }
+                firms[supplier_id].clients[self.pid] = firms[supplier_id].client_info_class(
+                    sector=self.pid, share=0, transport_share=0, distance=distance
+                )
 
     def send_purchase_orders(self, graph):
-        for edge in graph.in_edges(self):
+        for supplier, commercial_link in graph.in_links(self):
             try:
-                quantity_to_buy = self.purchase_plan[edge[0].pid]
+                quantity_to_buy = self.purchase_plan[supplier.pid]
             except KeyError:
-                print("Country " + self.pid + ": No purchase plan for supplier", edge[0].pid)
+                print("Country " + self.pid + ": No purchase plan for supplier", supplier.pid)
                 quantity_to_buy = 0
-            graph[edge[0]][self]['object'].order = quantity_to_buy
+            commercial_link.order = quantity_to_buy
 
     def deliver_products(self, graph: "ScNetwork", transport_network: "TransportNetwork",
                          sectors_no_transport_network: list[str], rationing_mode: str, monetary_units_in_model: str,
@@ -186,34 +222,34 @@ class Country(Agent):
         self.tons_transported = 0
         self.tonkm_transported = 0
         self.qty_sold = 0
-        for edge in graph.out_edges(self):
-            if graph[self][edge[1]]['object'].order == 0:
-                logging.debug(f"{self.id_str()} - {edge[1].id_str()} is my client but did not order")
+        for client, commercial_link in graph.out_links(self):
+            if commercial_link.order == 0:
+                logging.debug(f"{self.id_str()} - {client.id_str()} is my client but did not order")
                 continue
-            graph[self][edge[1]]['object'].delivery = graph[self][edge[1]]['object'].order
-            graph[self][edge[1]]['object'].delivery_in_tons = \
-                Country.transformUSD_to_tons(graph[self][edge[1]]['object'].order, monetary_units_in_model,
+            commercial_link.delivery = commercial_link.order
+            commercial_link.delivery_in_tons = \
+                Country.transformUSD_to_tons(commercial_link.order, monetary_units_in_model,
                                              self.usd_per_ton)
 
             explicit_service_firm = True
             if explicit_service_firm:
                 # If send services, no use of transport network
-                if graph[self][edge[1]]['object'].product_type in sectors_no_transport_network:
-                    graph[self][edge[1]]['object'].price = graph[self][edge[1]]['object'].eq_price
-                    self.qty_sold += graph[self][edge[1]]['object'].delivery
+                if commercial_link.product_type in sectors_no_transport_network:
+                    commercial_link.price = commercial_link.eq_price
+                    self.qty_sold += commercial_link.delivery
                 # Otherwise, send shipment through transportation network
                 else:
-                    self.send_shipment(graph[self][edge[1]]['object'], transport_network, monetary_units_in_model,
+                    self.send_shipment(commercial_link, transport_network, monetary_units_in_model,
                                        cost_repercussion_mode, price_increase_threshold, capacity_constraint,
                                        transport_cost_noise_level)
             else:
-                if (edge[1].od_point != -1):  # to non-service firms, send shipment through transportation network
-                    self.send_shipment(graph[self][edge[1]]['object'], transport_network, monetary_units_in_model,
+                if (client.od_point != -1):  # to non-service firms, send shipment through transportation network
+                    self.send_shipment(commercial_link, transport_network, monetary_units_in_model,
                                        cost_repercussion_mode, price_increase_threshold, capacity_constraint,
                                        transport_cost_noise_level)
                 else:  # if it sends to service firms, nothing to do. price is equilibrium price
-                    graph[self][edge[1]]['object'].price = graph[self][edge[1]]['object'].eq_price
-                    self.qty_sold += graph[self][edge[1]]['object'].delivery
+                    commercial_link.price = commercial_link.eq_price
+                    self.qty_sold += commercial_link.delivery
 
     def send_shipment(self, commercial_link: "CommercialLink", transport_network: "TransportNetwork",
                       monetary_units_in_model: str, cost_repercussion_mode: str, price_increase_threshold: float,
@@ -354,12 +390,32 @@ class Country(Agent):
             # We do not pay the transporter, so we don't increment the transport cost
 
     def evaluate_commercial_balance(self, graph):
-        exports = sum([graph[self][edge[1]]['object'].payment for edge in graph.out_edges(self)])
-        imports = sum([graph[edge[0]][self]['object'].payment for edge in graph.in_edges(self)])
+        exports = sum([commercial_link.payment for _, commercial_link in graph.out_links(self)])
+        imports = sum([commercial_link.payment for _, commercial_link in graph.in_links(self)])
         print("Country " + self.pid + ": imports " + str(imports) + " from Tanzania and export " + str(
             exports) + " to Tanzania")
 
 
+class Country(CountryBase):
+    """Country, with its attributes in a per-instance __dict__"""
+
+
+class CompactCountry(CompactStateMixin, CountryBase):
+    """Slotted variant of Country, without per-instance __dict__
+
+    The exporting firms and the clients are described by slotted records, ExportSupplierInfo and ClientInfo,
+    instead of dicts.
+    """
+    __slots__ = AGENT_SLOTS + (
+        'sector', 'transit_from', 'transit_to', 'supply_importance', 'clients', 'purchase_plan', 'qty_sold',
+        'qty_purchased', 'qty_purchased_perfirm', 'generalized_transport_cost', 'usd_transported',
+        'tons_transported', 'tonkm_transported', 'extra_spending', 'consumption_loss', 'loss_tracker'
+    )
+    commercial_link_class = CompactCommercialLink
+    supplier_info_class = ExportSupplierInfo
+    client_info_class = ClientInfo
+
+
 class Countries(Agents):
     pass
 
@@ -376,7 +432,7 @@ def identify_firms_in_each_sector(firms):
 
 
 def determine_suppliers_and_weights(potential_supplier_pids,
-                                    nb_selected_suppliers, firms, mode):
+                                    nb_selected_suppliers, firms, mode, rng: np.random.Generator | None = None):
     # Get importance for each of them
     if "importance_export" in mode.keys():
         importance_of_each = rescale_values([
@@ -393,11 +449,11 @@ def determine_suppliers_and_weights(potential_supplier_pids,
 
     # Select supplier
     prob_to_be_selected = np.array(importance_of_each) / np.array(importance_of_each).sum()
-    selected_supplier_ids = np.random.choice(potential_supplier_pids,
-                                             p=prob_to_be_selected,
-                                             size=nb_selected_suppliers,
-                                             replace=False
-                                             ).tolist()
+    selected_supplier_ids = (rng or np.random).choice(potential_supplier_pids,
+                                                      p=prob_to_be_selected,
+                                                      size=nb_selected_suppliers,
+                                                      replace=False
+                                                      ).tolist()
 
     # Compute weights, based on importance only
     supplier_weights = generate_weights_from_list([
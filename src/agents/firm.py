@@ -1,3 +1,4 @@
+from collections.abc import MutableMapping
 from typing import TYPE_CHECKING
 
 import logging
@@ -10,8 +11,9 @@ from shapely.geometry import Point
 from src.model.basic_functions import generate_weights, \
     compute_distance_from_arcmin, rescale_values
 
-from src.agents.agent import Agent, Agents
-from src.network.commercial_link import CommercialLink
+from src.agents.agent import Agent, Agents, AGENT_SLOTS
+from src.model.basic_functions import CompactStateMixin, ClientInfo
+from src.network.commercial_link import CommercialLink, CompactCommercialLink
 from src.network.mrio import import_label
 
 if TYPE_CHECKING:
@@ -22,7 +24,9 @@ if TYPE_CHECKING:
 EPSILON = 1e-6
 
 
-class Firm(Agent):
+class FirmBase(Agent):
+    """Methods of Firm and CompactFirm, which store their attributes in a __dict__ and in slots respectively"""
+    __slots__ = ()
 
     def __init__(self, pid, od_point=0, sector=0, sector_type=None, main_sector=None, name=None, input_mix=None,
                  target_margin=0.2, utilization_rate=0.8,
@@ -190,7 +194,7 @@ class Firm(Agent):
             product_sector = inputed_supplier_link['product_sector']
             supplier_object = firm_list[supplier_id]
             graph.add_edge(supplier_object, self,
-                           object=CommercialLink(
+                           object=self.commercial_link_class(
                                pid=str(supplier_id) + "->" + str(self.pid),
                                product=product_sector,
                                product_type=supplier_object.sector_type,
@@ -212,7 +216,9 @@ class Firm(Agent):
 
     def identify_suppliers(self, sector: str, firms, countries,
                            nb_suppliers_per_input: float, weight_localization: float,
-                           firm_data_type: str, import_code: str):
+                           firm_data_type: str, import_code: str, rng: np.random.Generator | None = None):
+        # Without a random generator of its own, the firm draws from the global random state
+        random_state = rng or np.random
         if firm_data_type == "mrio":
             if import_label in sector:  # case of countries
                 supplier_type = "country"
@@ -230,9 +236,9 @@ class Firm(Agent):
                 prob_to_be_selected = np.array(rescale_values([firms[firm_pid].importance for firm_pid in
                                                                potential_supplier_pids]))
                 prob_to_be_selected /= prob_to_be_selected.sum()
-                selected_supplier_ids = np.random.choice(potential_supplier_pids,
-                                                         p=prob_to_be_selected, size=1,
-                                                         replace=False).tolist()
+                selected_supplier_ids = random_state.choice(potential_supplier_pids,
+                                                            p=prob_to_be_selected, size=1,
+                                                            replace=False).tolist()
                 supplier_weights = [1]
 
         else:
@@ -272,7 +278,8 @@ class Firm(Agent):
                 prob_to_be_selected /= prob_to_be_selected.sum()
 
             # Determine the number of supplier(s) to select. 1 or 2.
-            if random.uniform(0, 1) < nb_suppliers_per_input - 1:
+            draw = random.uniform(0, 1) if rng is None else rng.uniform(0, 1)
+            if draw < nb_suppliers_per_input - 1:
                 nb_suppliers_to_choose = 2
                 if nb_suppliers_to_choose > len(potential_supplier_pid):
                     nb_suppliers_to_choose = 1
@@ -281,19 +288,33 @@ class Firm(Agent):
 
             # Select the supplier(s). It there is 2 suppliers, then we generate
             # random weight. It determines how much is bought from each supplier.
-            selected_supplier_ids = np.random.choice(potential_supplier_pid,
-                                                     p=prob_to_be_selected, size=nb_suppliers_to_choose,
-                                                     replace=False).tolist()
+            selected_supplier_ids = random_state.choice(potential_supplier_pid,
+                                                        p=prob_to_be_selected, size=nb_suppliers_to_choose,
+                                                        replace=False).tolist()
             index_map = {supplier_id: position for position, supplier_id in enumerate(potential_supplier_pid)}
             selected_positions = [index_map[supplier_id] for supplier_id in selected_supplier_ids]
             selected_prob = [prob_to_be_selected[position] for position in selected_positions]
-            supplier_weights = generate_weights(nb_suppliers_to_choose, selected_prob)
+            supplier_weights = generate_weights(nb_suppliers_to_choose, selected_prob, rng)
 
         return supplier_type, selected_supplier_ids, supplier_weights
 
+    def choose_suppliers(self, firms: "Firms", countries: "Countries",
+                         nb_suppliers_per_input: float, weight_localization: float,
+                         firm_data_type: str, import_code: str, rng: np.random.Generator | None = None) -> list:
+        """Draw the suppliers of each input, without modifying the supply chain network
+
+        Returns a list of (input sector, supplier type, supplier ids, supplier weights), to be given to link_suppliers.
+        With its own generator, the firm goes through the inputs in sorted order, so that its draws do not depend
+        on the order in which the input mix was built.
+        """
+        sector_ids = list(self.input_mix.keys()) if rng is None else sorted(self.input_mix.keys())
+        return [(sector_id, *self.identify_suppliers(sector_id, firms, countries, nb_suppliers_per_input,
+                                                     weight_localization, firm_data_type, import_code, rng))
+                for sector_id in sector_ids]
+
     def select_suppliers(self, graph: "ScNetwork", firms: "Firms", countries: "Countries",
                          nb_suppliers_per_input: float, weight_localization: float,
-                         firm_data_type: str, import_code: str):
+                         firm_data_type: str, import_code: str, rng: np.random.Generator | None = None):
         """
         The firm selects its suppliers.
 
@@ -330,17 +351,15 @@ class Firm(Agent):
             0
 
         """
-        for sector_id, sector_weight in self.input_mix.items():
-
-            # If it is imports, identify international suppliers and calculate
-            # their probability to be chosen, which is based on importance.
-            supplier_type, selected_supplier_ids, supplier_weights = self.identify_suppliers(sector_id,
-                                                                                             firms, countries,
-                                                                                             nb_suppliers_per_input,
-                                                                                             weight_localization,
-                                                                                             firm_data_type,
-                                                                                             import_code)
-
+        chosen_suppliers = self.choose_suppliers(firms, countries, nb_suppliers_per_input, weight_localization,
+                                                 firm_data_type, import_code, rng)
+        self.link_suppliers(graph, firms, countries, chosen_suppliers)
+
+    def link_suppliers(self, graph: "ScNetwork", firms: "Firms", countries: "Countries", chosen_suppliers: list):
+        """Create the commercial links with the suppliers drawn by choose_suppliers"""
+        for sector_id, supplier_type, selected_supplier_ids, supplier_weights in chosen_suppliers:
+            sector_weight = self.input_mix[sector_id]
+            supplier_weights = list(supplier_weights)
             # For each new supplier, create a new CommercialLink in the supply chain network.
             # print(f"{self.id_str()}: for input {sector_id} I selected {len(selected_supplier_ids)} suppliers")
             for supplier_id in selected_supplier_ids:
@@ -357,7 +376,7 @@ class Firm(Agent):
                     product_type = firms[supplier_id].sector_type
                 # Create an edge in the graph
                 graph.add_edge(supplier_object, self,
-                               object=CommercialLink(
+                               object=self.commercial_link_class(
                                    pid=str(supplier_id) + "->" + str(self.pid),
                                    product=sector_id,
                                    product_type=product_type,
@@ -373,8 +392,8 @@ class Firm(Agent):
                 # The supplier saves the name of the client, its sector, and distance to it.
                 # The share of sales cannot be calculated now
                 distance = self.distance_to_other(supplier_object)
-                supplier_object.clients[self.pid] = {'sector': self.sector, 'share': 0, 'transport_share': 0,
-                                                     'distance': distance}
+                supplier_object.clients[self.pid] = supplier_object.client_info_class(
+                    sector=self.sector, share=0, transport_share=0, distance=distance)
 
     def calculate_client_share_in_sales(self):
         # Only works if the order book was computed
@@ -446,10 +465,9 @@ class Firm(Agent):
     def get_input_costs(self, graph):
         eq_unitary_input_cost = 0
         est_unitary_input_cost_at_current_price = 0
-        for edge in graph.in_edges(self):
-            eq_unitary_input_cost += graph[edge[0]][self]['object'].eq_price * graph[edge[0]][self]['weight']
-            est_unitary_input_cost_at_current_price += graph[edge[0]][self]['object'].price * graph[edge[0]][self][
-                'weight']
+        for supplier, commercial_link in graph.in_links(self):
+            eq_unitary_input_cost += commercial_link.eq_price * graph[supplier][self]['weight']
+            est_unitary_input_cost_at_current_price += commercial_link.price * graph[supplier][self]['weight']
         return eq_unitary_input_cost, est_unitary_input_cost_at_current_price
 
     def evaluate_input_needs(self):
@@ -522,9 +540,9 @@ class Firm(Agent):
             }
 
     def send_purchase_orders(self, sc_network: "ScNetwork"):
-        for edge in sc_network.in_edges(self):
-            supplier_id = edge[0].pid
-            input_sector = edge[0].sector
+        for supplier, commercial_link in sc_network.in_links(self):
+            supplier_id = supplier.pid
+            input_sector = supplier.sector
             if supplier_id in self.purchase_plan.keys():
                 quantity_to_buy = self.purchase_plan[supplier_id]
                 if quantity_to_buy == 0:
@@ -541,12 +559,11 @@ class Firm(Agent):
             else:
                 logging.error(f"{self.id_str()} - Supplier {supplier_id} is not in my purchase plan")
                 quantity_to_buy = 0
-            sc_network[edge[0]][self]['object'].order = quantity_to_buy
+            commercial_link.order = quantity_to_buy
 
     def retrieve_orders(self, sc_network: "ScNetwork"):
-        for edge in sc_network.out_edges(self):
-            quantity_ordered = sc_network[self][edge[1]]['object'].order
-            self.order_book[edge[1].pid] = quantity_ordered
+        for client, commercial_link in sc_network.out_links(self):
+            self.order_book[client.pid] = commercial_link.order
 
     def add_reconstruction_order_to_order_book(self):
         self.order_book["reconstruction"] = self.reconstruction_demand
@@ -607,8 +624,8 @@ class Firm(Agent):
         return relative_change * input_cost_share / (1 - self.target_margin)
 
     def check_if_supplier_changed_price(self, graph):  # firms could record the last price they paid their input
-        for edge in graph.in_edges(self):
-            if abs(graph[edge[0]][self]['object'].price - graph[edge[0]][self]['object'].eq_price) > 1e-6:
+        for _, commercial_link in graph.in_links(self):
+            if abs(commercial_link.price - commercial_link.eq_price) > 1e-6:
                 return True
         return False
 
@@ -673,24 +690,24 @@ class Firm(Agent):
         self.tonkm_transported = 0
 
         # For each client, we define the quantity to deliver then send the shipment
-        for edge in graph.out_edges(self):
-            if graph[self][edge[1]]['object'].order == 0:
-                logging.debug(f"{self.id_str()} - {graph[self][edge[1]]['object'].buyer_id} "
+        for client, commercial_link in graph.out_links(self):
+            if commercial_link.order == 0:
+                logging.debug(f"{self.id_str()} - {commercial_link.buyer_id} "
                               f"is my client but did not order")
                 continue
-            graph[self][edge[1]]['object'].delivery = quantity_to_deliver[edge[1].pid]
-            graph[self][edge[1]]['object'].delivery_in_tons = \
-                Firm.transformUSD_to_tons(quantity_to_deliver[edge[1].pid], monetary_units_in_model, self.usd_per_ton)
+            commercial_link.delivery = quantity_to_deliver[client.pid]
+            commercial_link.delivery_in_tons = \
+                Firm.transformUSD_to_tons(quantity_to_deliver[client.pid], monetary_units_in_model, self.usd_per_ton)
 
             # If the client is B2C (applied only we had one single representative agent for all households)
-            if edge[1].pid == -1:
-                self.deliver_without_infrastructure(graph[self][edge[1]]['object'])
+            if client.pid == -1:
+                self.deliver_without_infrastructure(commercial_link)
             # If this is service flow, deliver without infrastructure
             elif self.sector_type in sectors_no_transport_network:
-                self.deliver_without_infrastructure(graph[self][edge[1]]['object'])
+                self.deliver_without_infrastructure(commercial_link)
             # otherwise use infrastructure
             else:
-                self.send_shipment(graph[self][edge[1]]['object'], transport_network, monetary_units_in_model,
+                self.send_shipment(commercial_link, transport_network, monetary_units_in_model,
                                    cost_repercussion_mode, price_increase_threshold, capacity_constraint,
                                    transport_cost_noise_level)
 
@@ -898,13 +915,13 @@ class Firm(Agent):
     def evaluate_profit(self, graph):
         # Collect all payments received
         self.finance['sales'] = sum([
-            graph[self][edge[1]]['object'].payment
-            for edge in graph.out_edges(self)
+            commercial_link.payment
+            for _, commercial_link in graph.out_links(self)
         ])
         # Collect all payments made
         self.finance['costs']['input'] = sum([
-            graph[edge[0]][self]['object'].payment
-            for edge in graph.in_edges(self)
+            commercial_link.payment
+            for _, commercial_link in graph.in_links(self)
         ])
         # Compute profit
         self.profit = (self.finance['sales']
@@ -932,9 +949,129 @@ class Firm(Agent):
                           '{:.3f}'.format(realized_margin) + ' instead of ' + str(self.target_margin))
 
 
+class CostView(MutableMapping):
+    """Dict-like view on the flat cost fields of a CompactFirm, keyed by 'input', 'transport', 'other'"""
+    __slots__ = ('firm', 'prefix')
+    _keys = ('input', 'transport', 'other')
+
+    def __init__(self, firm: "CompactFirm", prefix: str):
+        self.firm = firm
+        self.prefix = prefix
+
+    def _field(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return f"{self.prefix}{key}_cost"
+
+    def __getitem__(self, key):
+        return getattr(self.firm, self._field(key))
+
+    def __setitem__(self, key, value):
+        setattr(self.firm, self._field(key), value)
+
+    def __delitem__(self, key):
+        raise TypeError("Cost items cannot be deleted")
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class FinanceView(MutableMapping):
+    """Dict-like view mimicking the nested {'sales': x, 'costs': {...}} finance dict of Firm"""
+    __slots__ = ('firm', 'prefix')
+    _keys = ('sales', 'costs')
+
+    def __init__(self, firm: "CompactFirm", prefix: str):
+        self.firm = firm
+        self.prefix = prefix
+
+    def __getitem__(self, key):
+        if key == 'sales':
+            return getattr(self.firm, self.prefix + 'sales')
+        if key == 'costs':
+            return CostView(self.firm, self.prefix)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'sales':
+            setattr(self.firm, self.prefix + 'sales', value)
+        elif key == 'costs':
+            CostView(self.firm, self.prefix).update(value)
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        raise TypeError("Finance items cannot be deleted")
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr({'sales': self['sales'], 'costs': dict(self['costs'])})
+
+
+class Firm(FirmBase):
+    """Firm, with its attributes in a per-instance __dict__"""
+
+
+class CompactFirm(CompactStateMixin, FirmBase):
+    """Slotted variant of Firm
+
+    The nested `finance` and `eq_finance` dicts are flattened into the fields
+    `sales`, `input_cost`, `transport_cost`, `other_cost` and their `eq_` counterparts.
+    They remain readable and writable through dict-like views, e.g.
+    `firm.finance['costs']['transport'] += x`. The clients are described by slotted ClientInfo records
+    instead of dicts.
+    """
+    __slots__ = AGENT_SLOTS + (
+        'geometry', 'importance', 'sector', 'sector_type', 'main_sector', 'input_mix',
+        'inventory_duration_target', 'inventory_restoration_time', 'eq_production_capacity',
+        'utilization_rate', 'target_margin', 'capital_to_value_added_ratio', 'suppliers', 'clients',
+        'eq_sales', 'eq_input_cost', 'eq_transport_cost', 'eq_other_cost', 'eq_profit', 'eq_price',
+        'eq_total_order', 'production', 'production_target', 'production_capacity',
+        'current_production_capacity', 'capital_initial', 'purchase_plan', 'purchase_plan_per_input',
+        'order_book', 'total_order', 'input_needs', 'rationing', 'eq_needs', 'current_inventory_duration',
+        'inventory', 'product_stock', 'profit', 'sales', 'input_cost', 'transport_cost', 'other_cost',
+        'delta_price_input', 'generalized_transport_cost', 'usd_transported', 'tons_transported',
+        'tonkm_transported', 'capital_destroyed', 'remaining_disrupted_time', 'production_capacity_reduction',
+        'capital_demanded', 'reconstruction_demand', 'reconstruction_produced'
+    )
+    commercial_link_class = CompactCommercialLink
+    client_info_class = ClientInfo
+
+    @property
+    def finance(self):
+        return FinanceView(self, "")
+
+    @finance.setter
+    def finance(self, value):
+        FinanceView(self, "").update(value)
+
+    @property
+    def eq_finance(self):
+        return FinanceView(self, "eq_")
+
+    @eq_finance.setter
+    def eq_finance(self, value):
+        FinanceView(self, "eq_").update(value)
+
+
 class Firms(Agents):
     def __init__(self, agent_list=None):
         super().__init__(agent_list)
+        # Sparse firm x input sector matrix of the inventory duration targets, rows following the order of the firms,
+        # and its input sectors. Set by load_inventories
+        self.inventory_duration_targets = None
+        self.inventory_input_sectors = []
 
     def filter_by_sector(self, sector):
         filtered_agents = Firms()
@@ -7,8 +7,9 @@ from src.model.basic_functions import calculate_distance_between_agents, rescale
 
 import logging
 
-from src.agents.agent import Agent, Agents
-from src.network.commercial_link import CommercialLink
+from src.agents.agent import Agent, Agents, AGENT_SLOTS
+from src.model.basic_functions import CompactStateMixin, RetailerInfo
+from src.network.commercial_link import CommercialLink, CompactCommercialLink
 from src.network.mrio import import_label
 
 if TYPE_CHECKING:
@@ -17,7 +18,11 @@ if TYPE_CHECKING:
     from src.agents.country import Countries
 
 
-class Household(Agent):
+class HouseholdBase(Agent):
+    """Methods of Household and CompactHousehold, which store their attributes in a __dict__ and in slots respectively"""
+    __slots__ = ()
+    # Type of the records describing the retailers of the household, in its `retailers` dict
+    retailer_info_class = dict
 
     def __init__(self, pid, od_point, name, long, lat, population, sector_consumption):
         super().__init__(
@@ -46,8 +51,11 @@ class Household(Agent):
         # Cumulated variables reset at beginning and updated at each time step
         self.consumption_loss = 0
         self.extra_spending = 0
+        self.loss_tracker = None
 
     def reset_variables(self):
+        if self.loss_tracker:
+            self.loss_tracker.remove(self)
         self.consumption_per_retailer = {}
         self.tot_consumption = 0
         self.spending_per_retailer = {}
@@ -58,6 +66,8 @@ class Household(Agent):
         self.consumption_loss_per_sector = {}
 
     def reset_indicators(self):
+        if self.loss_tracker:
+            self.loss_tracker.remove(self)
         self.consumption_per_retailer = {}
         self.tot_consumption = 0
         self.spending_per_retailer = {}
@@ -80,6 +90,8 @@ class Household(Agent):
                                * commercial_link.eq_price
         self.consumption_loss += new_consumption_loss
         add_or_increment_dict_key(self.consumption_loss_per_sector, commercial_link.product, new_consumption_loss)
+        if self.loss_tracker:
+            self.loss_tracker.add(self, new_extra_spending, new_consumption_loss)
 
     def initialize_var_on_purchase_plan(self):
         if len(self.purchase_plan) == 0:
@@ -94,7 +106,9 @@ class Household(Agent):
 
     def identify_suppliers(self, sector: str, firms: "Firms", countries: "Countries",
                            nb_suppliers_per_input: float, weight_localization: float, force_local: bool,
-                           firm_data_type: str):
+                           firm_data_type: str, rng: np.random.Generator | None = None):
+        # Without a random generator of its own, the household draws from the global random state
+        random_state = rng or np.random
         if firm_data_type == "mrio":
             # if len(sector_id) == 3:  # case of countries
             if import_label in sector:  # case of countries
@@ -111,9 +125,9 @@ class Household(Agent):
                 prob_to_be_selected = np.array(rescale_values([firms[firm_pid].importance for firm_pid in
                                                                potential_supplier_pids]))
                 prob_to_be_selected /= prob_to_be_selected.sum()
-                selected_supplier_ids = np.random.choice(potential_supplier_pids,
-                                                         p=prob_to_be_selected, size=1,
-                                                         replace=False).tolist()
+                selected_supplier_ids = random_state.choice(potential_supplier_pids,
+                                                            p=prob_to_be_selected, size=1,
+                                                            replace=False).tolist()
                 supplier_weights = [1]
 
         else:
@@ -165,27 +179,41 @@ class Household(Agent):
 
             # Select the supplier(s). It there is 2 suppliers, then we generate
             # random weight. It determines how much is bought from each supplier.
-            selected_supplier_ids = np.random.choice(potential_suppliers,
-                                                     p=prob_to_be_selected, size=nb_suppliers_to_choose,
-                                                     replace=False).tolist()
+            selected_supplier_ids = random_state.choice(potential_suppliers,
+                                                        p=prob_to_be_selected, size=nb_suppliers_to_choose,
+                                                        replace=False).tolist()
             index_map = {supplier_id: position for position, supplier_id in enumerate(potential_suppliers)}
             selected_positions = [index_map[supplier_id] for supplier_id in selected_supplier_ids]
             selected_prob = [prob_to_be_selected[position] for position in selected_positions]
-            supplier_weights = generate_weights(nb_suppliers_to_choose, selected_prob)
+            supplier_weights = generate_weights(nb_suppliers_to_choose, selected_prob, rng)
 
         return supplier_type, selected_supplier_ids, supplier_weights
 
+    def choose_suppliers(self, firms: "Firms", countries: "Countries", nb_retailers: float, force_local: bool,
+                         weight_localization: float, firm_data_type: str,
+                         rng: np.random.Generator | None = None) -> list:
+        """Draw the retailers of each sector, without modifying the supply chain network
+
+        Returns a list of (sector, supplier type, retailer ids, retailer weights), to be given to link_suppliers.
+        With its own generator, the household goes through the sectors in sorted order.
+        """
+        sectors = list(self.sector_consumption.keys()) if rng is None else sorted(self.sector_consumption.keys())
+        return [(sector, *self.identify_suppliers(sector, firms, countries, nb_retailers, weight_localization,
+                                                  force_local, firm_data_type, rng))
+                for sector in sectors]
+
     def select_suppliers(self, graph: "ScNetwork", firms: "Firms", countries: "Countries",
                          nb_retailers: float, force_local: bool,
-                         weight_localization: float, firm_data_type: str):
+                         weight_localization: float, firm_data_type: str, rng: np.random.Generator | None = None):
         # print(f"{self.id_str()}: consumption {self.sector_consumption}")
-        for sector, amount in self.sector_consumption.items():
-            supplier_type, retailers, retailer_weights = self.identify_suppliers(sector, firms, countries,
-                                                                                 nb_retailers,
-                                                                                 weight_localization,
-                                                                                 force_local,
-                                                                                 firm_data_type)
-
+        chosen_suppliers = self.choose_suppliers(firms, countries, nb_retailers, force_local, weight_localization,
+                                                 firm_data_type, rng)
+        self.link_suppliers(graph, firms, countries, chosen_suppliers)
+
+    def link_suppliers(self, graph: "ScNetwork", firms: "Firms", countries: "Countries", chosen_suppliers: list):
+        """Create the commercial links with the retailers drawn by choose_suppliers"""
+        for sector, supplier_type, retailers, retailer_weights in chosen_suppliers:
+            retailer_weights = list(retailer_weights)
             # For each of them, create commercial link
             for retailer_id in retailers:
                 # Retrieve the appropriate supplier object from the id
@@ -202,7 +230,7 @@ class Household(Agent):
 
                 # For each retailer, create an edge in the economic network
                 graph.add_edge(supplier_object, self,
-                               object=CommercialLink(
+                               object=self.commercial_link_class(
                                    pid=str(retailer_id) + '->' + str(self.pid),
                                    product=sector,
                                    product_type=product_type,
@@ -214,20 +242,20 @@ class Household(Agent):
                 weight = retailer_weights.pop()
                 graph[supplier_object][self]['weight'] = weight
                 self.purchase_plan[retailer_id] = weight * self.sector_consumption[sector]
-                self.retailers[retailer_id] = {'sector': sector, 'weight': weight}
+                self.retailers[retailer_id] = self.retailer_info_class(sector=sector, weight=weight)
                 distance = calculate_distance_between_agents(self, supplier_object)
-                supplier_object.clients[self.pid] = {
-                    'sector': "households", 'share': 0, 'transport_share': 0, "distance": distance
-                }  # The share of sales cannot be calculated now.
+                supplier_object.clients[self.pid] = supplier_object.client_info_class(
+                    sector="households", share=0, transport_share=0, distance=distance
+                )  # The share of sales cannot be calculated now.
 
     def send_purchase_orders(self, graph):
-        for edge in graph.in_edges(self):
+        for supplier, commercial_link in graph.in_links(self):
             try:
-                quantity_to_buy = self.purchase_plan[edge[0].pid]
+                quantity_to_buy = self.purchase_plan[supplier.pid]
             except KeyError:
-                print("Households: No purchase plan for supplier", edge[0].pid)
+                print("Households: No purchase plan for supplier", supplier.pid)
                 quantity_to_buy = 0
-            graph[edge[0]][self]['object'].order = quantity_to_buy
+            commercial_link.order = quantity_to_buy
 
     def select_supplier_from_list(self, firm_list: "Firms",
                                   nb_suppliers_to_choose: int, potential_firm_ids: list,
@@ -286,5 +314,24 @@ class Household(Agent):
         return selected_supplier_ids, supplier_weights
 
 
+class Household(HouseholdBase):
+    """Household, with its attributes in a per-instance __dict__"""
+
+
+class CompactHousehold(CompactStateMixin, HouseholdBase):
+    """Slotted variant of Household, without per-instance __dict__
+
+    The retailers are described by slotted RetailerInfo records instead of dicts.
+    """
+    __slots__ = AGENT_SLOTS + (
+        'sector_consumption', 'population', 'purchase_plan', 'retailers', 'consumption_per_retailer',
+        'tot_consumption', 'consumption_per_sector', 'consumption_loss_per_sector', 'spending_per_retailer',
+        'tot_spending', 'spending_per_sector', 'extra_spending_per_sector', 'consumption_loss', 'extra_spending',
+        'loss_tracker'
+    )
+    commercial_link_class = CompactCommercialLink
+    retailer_info_class = RetailerInfo
+
+
 class Households(Agents):
     pass
@@ -5,6 +5,7 @@ from collections import UserList
 from pathlib import Path
 
 import geopandas
+import numpy as np
 import pandas
 import pandas as pd
 
@@ -17,63 +18,99 @@ if TYPE_CHECKING:
 
 
 class ReconstructionMarket:
+    """Market on which the firms which lost capital buy its reconstruction from the sectors of the capital input mix
+
+    The firms are indexed by position, with the positions of the firms of each sector of the capital input mix,
+    so that the demand, its rationing and the distribution of new capital are computed on arrays. They are indexed
+    again only if different firm objects are given.
+    """
     def __init__(self, reconstruction_target_time: int, capital_input_mix: dict):
         self.reconstruction_target_time = reconstruction_target_time
         self.capital_input_mix = capital_input_mix
         self.aggregate_demand = 0
         self.aggregate_demand_per_sector = {}
         self.demand_to_firm_per_sector = {}
+        self.firm_list = None
+        self.firm_identities = None
+        self.sector_positions = {}
+        self.capital_demanded = None
+
+    def index_firms(self, firms: "Firms"):
+        """Index the firms and the positions of the firms of each sector supplying capital, unless already done"""
+        firm_identities = tuple(id(firm) for firm in firms.values())
+        if firm_identities == self.firm_identities:
+            return
+        self.firm_identities = firm_identities
+        self.firm_list = list(firms.values())
+        sectors = np.array([firm.sector for firm in self.firm_list], dtype=object)
+        self.sector_positions = {sector: np.flatnonzero(sectors == sector)
+                                 for sector in self.capital_input_mix.keys() if sector != import_code}
+
+    def get_participating_firms(self, firms: "Firms") -> "Firms":
+        """Firms of the sectors supplying capital, in a collection of the same type as firms"""
+        self.index_firms(firms)
+        participating_firms = type(firms)()
+        for positions in self.sector_positions.values():
+            for i in positions:
+                participating_firms[self.firm_list[i].pid] = self.firm_list[i]
+        return participating_firms
 
     def send_orders(self, firms: "Firms"):
         for sector, demand_to_firm_this_sector in self.demand_to_firm_per_sector.items():
-            for pid, reconstruction_demand in demand_to_firm_this_sector.items():
-                firms[pid].reconstruction_demand = reconstruction_demand
-                firms[pid].add_reconstruction_order_to_order_book()
+            for i, reconstruction_demand in zip(self.sector_positions.get(sector, []),
+                                                demand_to_firm_this_sector.tolist()):
+                self.firm_list[i].reconstruction_demand = reconstruction_demand
+                self.firm_list[i].add_reconstruction_order_to_order_book()
 
     def distribute_new_capital(self, firms: "Firms"):
+        self.index_firms(firms)
         # Retrieve production
-        print("total capital demanded:", self.aggregate_demand)
         amount_produced_per_sector = {}
         for sector in self.capital_input_mix.keys():
             if sector == import_code:
                 amount_produced_per_sector[sector] = self.aggregate_demand_per_sector[sector]
             else:
-                amount_produced_per_sector[sector] = sum([firm.reconstruction_produced
-                                                          for firm in firms.filter_by_sector(sector).values()])
-        print("amount_produced_per_sector:", amount_produced_per_sector)
+                amount_produced_per_sector[sector] = np.sum([self.firm_list[i].reconstruction_produced
+                                                             for i in self.sector_positions[sector]])
         # Produce (we suppose that what is not used disappear, no stock of unfinished capital)
         new_capital_produced = min([amount_produced_per_sector[sector] / weight
                                     for sector, weight in self.capital_input_mix.items()])
-        print("new_capital_produced:", new_capital_produced)
         # Send new capital to firm
-        for firm in firms.values():
-            firm.capital_destroyed -= (firm.capital_demanded / self.aggregate_demand) * new_capital_produced
-        print("total capital destroyed:", firms.sum("capital_destroyed"))
-        print("average production capacity:", firms.mean("current_production_capacity"))
+        capital_destroyed = np.array([firm.capital_destroyed for firm in self.firm_list], dtype=float)
+        if self.aggregate_demand > 0:
+            capital_destroyed -= (self.capital_demanded / self.aggregate_demand) * new_capital_produced
+            for firm, firm_capital_destroyed in zip(self.firm_list, capital_destroyed.tolist()):
+                firm.capital_destroyed = firm_capital_destroyed
+        logging.debug(f"Reconstruction market: capital demanded {self.aggregate_demand}, "
+                      f"produced per sector {amount_produced_per_sector}, new capital {new_capital_produced}, "
+                      f"capital destroyed {capital_destroyed.sum()}")
 
     def evaluate_demand_to_firm(self, firms: "Firms"):
+        self.index_firms(firms)
         # Retrieve the demand of each firm, and translate it into a demand for certain inputs (sectors)
-        for firm in firms.values():
-            firm.capital_demanded = firm.capital_destroyed / self.reconstruction_target_time
-        self.aggregate_demand = sum([firm.capital_demanded for firm in firms.values()])
+        self.capital_demanded = np.array([firm.capital_destroyed for firm in self.firm_list], dtype=float) \
+            / self.reconstruction_target_time
+        for firm, capital_demanded in zip(self.firm_list, self.capital_demanded.tolist()):
+            firm.capital_demanded = capital_demanded
+        self.aggregate_demand = self.capital_demanded.sum()
         self.aggregate_demand_per_sector = {sector: weight * self.aggregate_demand
                                             for sector, weight in self.capital_input_mix.items()}
 
         # Get potential supply per sector and evaluate whether demand needs to be rationed
         rationing_per_sector = {}
-        total_supply_per_sector = {}
-        potential_supply_per_firm_per_sector = {}
+        potential_supply_per_sector = {}
         for sector in self.capital_input_mix.keys():
             if sector == import_code:  # No constraints for imported products
-                total_supply_per_sector[sector] = self.aggregate_demand_per_sector[sector]
                 rationing_per_sector[sector] = 1
             else:
-                potential_supply_per_firm_per_sector[sector] = {pid: firm.get_spare_production_potential()
-                                                                for pid, firm in firms.items()
-                                                                if firm.sector == sector}
-                total_supply_per_sector[sector] = sum(potential_supply_per_firm_per_sector[sector].values())
-                rationing_per_sector[sector] = min(1, total_supply_per_sector[sector]
-                                                   / self.aggregate_demand_per_sector[sector])
+                potential_supply_per_sector[sector] = np.array([
+                    self.firm_list[i].get_spare_production_potential() for i in self.sector_positions[sector]
+                ], dtype=float)
+                if self.aggregate_demand_per_sector[sector] > 0:
+                    rationing_per_sector[sector] = min(1, potential_supply_per_sector[sector].sum()
+                                                       / self.aggregate_demand_per_sector[sector])
+                else:
+                    rationing_per_sector[sector] = 1
         rationing = min(list(rationing_per_sector.values()))
         if rationing > 1 - EPSILON:
             logging.info("Reconstruction market: There is no rationing")
@@ -81,19 +118,14 @@ class ReconstructionMarket:
             logging.info(f"Reconstruction market: Due to limited capacity, "
                          f"supply for reconstruction is {rationing:.2%} of demand")
 
-        # Evaluate actual demand per firm
-        for sector in self.capital_input_mix.keys():
-            if sector == import_code:
-                self.demand_to_firm_per_sector[sector] = {}
-            else:
-                if rationing < EPSILON:
-                    self.demand_to_firm_per_sector[sector] = {}
-                else:
-                    adjusted_demand_this_sector = self.aggregate_demand_per_sector[sector] * rationing
-                    firm_weight = {pid: potential_supply / total_supply_per_sector[sector]
-                                   for pid, potential_supply in potential_supply_per_firm_per_sector[sector].items()}
-                    self.demand_to_firm_per_sector[sector] = {pid: weight * adjusted_demand_this_sector
-                                                              for pid, weight in firm_weight.items()}
+        # Evaluate actual demand per firm, proportionally to its potential supply
+        self.demand_to_firm_per_sector = {}
+        if rationing >= EPSILON:
+            for sector, potential_supply in potential_supply_per_sector.items():
+                total_supply = potential_supply.sum()
+                if total_supply > 0:
+                    self.demand_to_firm_per_sector[sector] = \
+                        potential_supply / total_supply * (self.aggregate_demand_per_sector[sector] * rationing)
 
 
 class Recovery:
@@ -147,9 +179,8 @@ class TransportDisruption(dict):
         )
 
     def implement(self, transport_network: "TransportNetwork"):
-        for edge in transport_network.edges:
-            edge_id = transport_network[edge[0]][edge[1]]['id']
-            if edge_id in self.keys():
+        for edge_id, edge in transport_network.get_edges_by_id(self.keys()).items():
+            if edge is not None:
                 transport_network.disrupt_one_edge(edge, self.recovery.duration, self[edge_id])
 
 
@@ -185,31 +216,63 @@ class CapitalDestruction(dict):
     @classmethod
     def from_region_sector_file(cls, filepath: Path, firm_table: pd.DataFrame, firm_list: "Firms",
                                 input_units: str, target_units: str):
-        df = pd.read_csv(filepath, dtype={'region': str, 'sector': str, 'destroyed_capital': float})
+        return cls.from_region_sector_files([filepath], firm_table, firm_list, input_units, target_units)[0]
+
+    @staticmethod
+    def get_firm_capital(firm_table: pd.DataFrame, firm_list: "Firms") -> pd.DataFrame:
+        """Region, sector, id and initial capital of the firms, with the total capital of their region_sector"""
+        firm_capital = firm_table[['region', 'sector', 'id']].copy()
+        capital = np.array([firm_list[firm_id].capital_initial for firm_id in firm_capital['id'].tolist()],
+                           dtype=float)
+        # Summed in the order of the firm table, as a sum over the firms of each region_sector
+        region_sector_codes = firm_capital.groupby(['region', 'sector'], sort=False).ngroup().to_numpy()
+        total_capital = np.zeros(region_sector_codes.max() + 1 if len(region_sector_codes) > 0 else 0)
+        np.add.at(total_capital, region_sector_codes, capital)
+        firm_capital['capital_initial'] = capital
+        firm_capital['total_capital'] = total_capital[region_sector_codes]
+        return firm_capital
+
+    @classmethod
+    def from_region_sector_files(cls, filepaths: list[Path], firm_table: pd.DataFrame, firm_list: "Firms",
+                                 input_units: str, target_units: str) -> list["CapitalDestruction"]:
+        """Read the destroyed capital per region and sector of each file and allocate it to the firms, in one pass
+
+        The destroyed capital of each region_sector is shared among its firms proportionally to their capital.
+        Returns one CapitalDestruction per file, in the order of the files.
+        """
+        unique_filepaths = list(dict.fromkeys(filepaths))
         units = {"USD": 1, "kUSD": 1e3, "mUSD": 1e6}
-        df['destroyed_capital'] = df['destroyed_capital'] * units[input_units] / units[target_units]
-        result = {}
-        dic_destroyed_capital_per_region_sector = df.set_index(['region', 'sector'])['destroyed_capital'].to_dict()
-        for region_sector, destroyed_capital in dic_destroyed_capital_per_region_sector.items():
-            region, sector = region_sector
-            firms = firm_table.loc[(firm_table['region'] == region) & (firm_table['sector'] == sector), "id"].to_list()
-            if len(firms) == 0:
-                logging.warning(f"In {region_sector}, destroyed capital is {destroyed_capital} {input_units} "
-                                f"but there are no firm modeled")
-            else:
-                total_capital = sum([firm_list[firm_id].capital_initial for firm_id in firms])
-                for firm_id in firms:
-                    weight = firm_list[firm_id].capital_initial / total_capital
-                    result[firm_id] = weight * destroyed_capital
-        df = pd.merge(df, firm_table[['region', 'sector', 'id']], how='left', on=['region', 'sector'])
-        total_destroyed_capital_in_data = df['destroyed_capital'].sum()
-        total_destroyed_capital_in_model = sum(result.values())
-        logging.info(f"Destroyed capital in data: {total_destroyed_capital_in_data}, "
-                     f"Destroyed capital in model: {total_destroyed_capital_in_model}")
-        return cls(
-            description=result,
-            recovery=None
-        )
+        damages = pd.concat([
+            pd.read_csv(filepath, dtype={'region': str, 'sector': str, 'destroyed_capital': float}).assign(file=i)
+            for i, filepath in enumerate(unique_filepaths)
+        ], ignore_index=True)
+        damages['destroyed_capital'] = damages['destroyed_capital'] * units[input_units] / units[target_units]
+        # As in a dict, the last value given to a region_sector is kept
+        damages = damages.drop_duplicates(['file', 'region', 'sector'], keep='last')
+
+        allocation = damages.merge(cls.get_firm_capital(firm_table, firm_list), how='left', on=['region', 'sector'],
+                                   indicator=True)
+        for row in allocation[allocation['_merge'] == "left_only"].itertuples():
+            logging.warning(f"In {(row.region, row.sector)}, destroyed capital is {row.destroyed_capital} "
+                            f"{input_units} but there are no firm modeled")
+        allocation = allocation[allocation['_merge'] == "both"]
+        has_no_capital = allocation['total_capital'] <= 0
+        for row in allocation[has_no_capital].drop_duplicates(['file', 'region', 'sector']).itertuples():
+            logging.warning(f"In {(row.region, row.sector)}, destroyed capital is {row.destroyed_capital} "
+                            f"{input_units} but the firms modeled have no capital, it is not allocated")
+        allocation = allocation[~has_no_capital].assign(
+            firm_destroyed_capital=lambda df: df['capital_initial'] / df['total_capital'] * df['destroyed_capital'])
+
+        descriptions = {i: {} for i in range(len(unique_filepaths))}
+        for i, file_allocation in allocation.groupby('file'):
+            descriptions[i] = dict(zip(file_allocation['id'].astype(int).tolist(),
+                                       file_allocation['firm_destroyed_capital'].tolist()))
+        total_destroyed_capital_in_data = damages.groupby('file')['destroyed_capital'].sum()
+        for i, filepath in enumerate(unique_filepaths):
+            logging.info(f"{filepath}: destroyed capital in data: {total_destroyed_capital_in_data.get(i, 0)}, "
+                         f"Destroyed capital in model: {sum(descriptions[i].values())}")
+        file_positions = {filepath: i for i, filepath in enumerate(unique_filepaths)}
+        return [cls(description=descriptions[file_positions[filepath]], recovery=None) for filepath in filepaths]
 
     def implement(self, firm_list: "Firms", model: "Model"):
         for firm_id, destroyed_capital in self.items():
@@ -225,6 +288,7 @@ class DisruptionList(UserList):
                          if isinstance(disruption, CapitalDestruction) or isinstance(disruption, TransportDisruption))
         if len(disruption_list) > 0:
             self.start_time = min([disruption.start_time for disruption in disruption_list])
+            self.last_start_time = max([disruption.start_time for disruption in disruption_list])
             self.end_time = 0
             # self.end_time = max([disruption.start_time + disruption.duration for disruption in disruption_list])
             # self.transport_nodes = [
@@ -244,6 +308,7 @@ class DisruptionList(UserList):
             # ]
         else:
             self.start_time = 0
+            self.last_start_time = 0
             self.end_time = 0
 
     @classmethod
@@ -256,14 +321,11 @@ class DisruptionList(UserList):
             firm_list: "Firms"
     ):
         event_list = []
-        for event in events:
+        capital_destructions = cls.load_capital_destructions(events, model_unit, firm_table, firm_list)
+        for i, event in enumerate(events):
             if event['type'] == "capital_destruction":
                 if event['description_type'] == "region_sector_file":
-                    disruption_object = CapitalDestruction.from_region_sector_file(event['region_sector_filepath'],
-                                                                                   firm_table,
-                                                                                   firm_list,
-                                                                                   input_units=event['unit'],
-                                                                                   target_units=model_unit)
+                    disruption_object = capital_destructions[i]
                     disruption_object.start_time = event["start_time"]
                     if "reconstruction_market" in event.keys():
                         disruption_object.reconstruction_market = event["reconstruction_market"]
@@ -280,6 +342,28 @@ class DisruptionList(UserList):
                     event_list += [disruption_object]
         return cls(event_list)
 
+    @staticmethod
+    def load_capital_destructions(events: list, model_unit: str, firm_table: pandas.DataFrame,
+                                  firm_list: "Firms") -> dict:
+        """Capital destruction of each "region_sector_file" event, by position in the events
+
+        The files of all events with the same unit are read and allocated in one pass. Events which already hold
+        their allocation, in "destroyed_capital_per_firm", e.g., given by an ensemble runner, are not read again.
+        """
+        capital_destructions = {}
+        positions_per_unit = {}
+        for i, event in enumerate(events):
+            if (event['type'] == "capital_destruction") and (event['description_type'] == "region_sector_file"):
+                if "destroyed_capital_per_firm" in event.keys():
+                    capital_destructions[i] = CapitalDestruction(description=event['destroyed_capital_per_firm'])
+                else:
+                    positions_per_unit.setdefault(event['unit'], []).append(i)
+        for unit, positions in positions_per_unit.items():
+            capital_destructions.update(zip(positions, CapitalDestruction.from_region_sector_files(
+                [events[i]['region_sector_filepath'] for i in positions], firm_table, firm_list,
+                input_units=unit, target_units=model_unit)))
+        return capital_destructions
+
     def log_info(self):
         logging.info(f'There are {len(self)} disruptions')
         for disruption in self:
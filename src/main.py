@@ -5,6 +5,7 @@ import time
 import paths
 from src.model.caching_functions import generate_cache_parameters_from_command_line_argument
 from src.parameters import Parameters
+from src.simulation.criticality import CriticalityAnalysis
 from src.simulation.handling_functions import check_script_call
 from model.model import Model
 
@@ -51,13 +52,30 @@ if parameters.simulation_type == "initial_state":
 elif parameters.simulation_type == "disruption":
     simulation = model.run_disruption()
 
+elif parameters.simulation_type == "criticality":
+    if parameters.criticality_file:
+        criticality_filepath = parameters.criticality_file
+    elif parameters.export_files:
+        criticality_filepath = parameters.export_folder / "criticality.csv"
+    else:
+        raise ValueError('The criticality simulation needs export_files to be True or a criticality_file')
+    criticality_analysis = CriticalityAnalysis(model, parameters.criticality_disruption_duration,
+                                               parameters.nodeedge_tested_topn, parameters.nodeedge_tested_skipn,
+                                               parameters.ensemble_nb_workers, parameters.ensemble_seed,
+                                               parameters.criticality_ranking)
+    criticality_analysis.run(criticality_filepath)
+    simulation = None
+
 else:
     raise ValueError('Unimplemented simulation type chosen')
 
-if parameters.export_files:
-    simulation.export_agent_data(parameters.export_folder)
-    simulation.export_transport_network_data(model.transport_edges, parameters.export_folder)
-    simulation.calculate_and_export_summary_result(model.sc_network, model.household_table,
-                                                   parameters.monetary_units_in_model, parameters.export_folder)
+if parameters.export_files and simulation:
+    model.export_queue.submit(simulation.export_agent_data, parameters.export_folder)
+    model.export_queue.submit(simulation.export_diagnostic_data, parameters.export_folder)
+    model.export_queue.submit(simulation.export_transport_network_data, model.transport_edges,
+                              parameters.export_folder)
+    model.export_queue.submit(simulation.calculate_and_export_summary_result, model.sc_network,
+                              model.household_table, parameters.monetary_units_in_model, parameters.export_folder)
+model.export_queue.close()
 
 logging.info("End of simulation")
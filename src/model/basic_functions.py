@@ -1,11 +1,12 @@
 import logging
 import math
+from collections.abc import MutableMapping
 
 import numpy as np
 import pandas as pd
 
 
-def generate_weights(nb_suppliers: int, importance_of_each: list or None):
+def generate_weights(nb_suppliers: int, importance_of_each: list or None, rng: np.random.Generator | None = None):
     # if there is only one supplier, return 1
     if nb_suppliers == 1:
         return [1]
@@ -16,7 +17,7 @@ def generate_weights(nb_suppliers: int, importance_of_each: list or None):
 
     # otherwise choose random values
     else:
-        rdm_values = np.random.uniform(0, 1, size=nb_suppliers)
+        rdm_values = (rng or np.random).uniform(0, 1, size=nb_suppliers)
         return list(rdm_values / sum(rdm_values))
 
 
@@ -104,3 +105,98 @@ def add_or_append_to_dict(dictionary, key, value_to_add):
         dictionary[key] += value_to_add
     else:
         dictionary[key] = value_to_add
+
+
+class CompactRecord(MutableMapping):
+    """Dict-like record with a fixed set of keys, given by `__slots__`, stored without per-instance __dict__
+
+    Used by the compact agents in place of the small dicts describing their clients, retailers or suppliers.
+    Keys not set yet are missing, as in a dict, and keys outside the slots cannot be set.
+    """
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for key, value in values.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError("Record items cannot be deleted")
+
+    def __iter__(self):
+        return (key for key in self.__slots__ if hasattr(self, key))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __getstate__(self):
+        # The values, in the order of the slots, if all keys are set
+        if len(self) == len(self.__slots__):
+            return tuple(getattr(self, key) for key in self.__slots__)
+        return {key: self[key] for key in self}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = dict(zip(self.__slots__, state))
+        for key, value in state.items():
+            self[key] = value
+
+
+class ClientInfo(CompactRecord):
+    __slots__ = ('sector', 'share', 'transport_share', 'distance')
+
+
+class RetailerInfo(CompactRecord):
+    __slots__ = ('sector', 'weight')
+
+
+class ExportSupplierInfo(CompactRecord):
+    __slots__ = ('sector', 'weight', 'amount')
+
+
+class CompactStateMixin(object):
+    """Mixin for the slotted, memory-compact variants of agents and commercial links
+
+    Subclasses declare every attribute in `__slots__`, so that instances do not carry a
+    per-instance `__dict__`. The pickled state is the tuple of slot values, in the order
+    given by `_compact_fields`, which is collected once per class over the whole MRO.
+    A subclass whose instances would still have a `__dict__`, e.g., because one of its bases has no `__slots__`,
+    is rejected when it is defined: setting an attribute without a slot then fails, instead of the attribute being
+    silently lost when the object is pickled.
+    """
+    __slots__ = ()
+    _compact_fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get('__slots__', ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            fields += [slot for slot in slots if slot not in fields]
+        if '__dict__' in fields or any('__dict__' in klass.__dict__ for klass in cls.__mro__):
+            raise TypeError(f"{cls.__name__} instances have a __dict__, all its bases should define __slots__")
+        cls._compact_fields = tuple(fields)
+
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self._compact_fields)
+
+    def __setstate__(self, state):
+        for field, value in zip(self._compact_fields, state):
+            setattr(self, field, value)
@@ -4,6 +4,7 @@ import logging
 from pathlib import Path
 
 import geopandas
+import numpy as np
 import pandas
 import pandas as pd
 import geopandas as gpd
@@ -165,6 +166,66 @@ def get_index_closest_point(point, df_with_points):
     return df_with_points.index[distance_list.index(min(distance_list))]
 
 
+def read_columns(table: pd.DataFrame, columns: list[str]) -> dict[str, np.ndarray]:
+    """Read each column once, as an array, to create agents row by row without scalar lookups"""
+    return {column: table[column].to_numpy() for column in columns}
+
+
+def get_country_od_points(countries: list, transport_nodes: geopandas.GeoDataFrame) -> dict:
+    """Find, in one pass, the transport node of each country, i.e., the node whose 'special' attribute is the country"""
+    country_nodes = transport_nodes.loc[transport_nodes['special'].isin(countries), ['special', 'id']]
+    nb_nodes_per_country = country_nodes['special'].value_counts()
+    for country in countries:
+        if country not in nb_nodes_per_country.index:
+            raise ValueError('No od_point found for ' + country)
+        elif nb_nodes_per_country[country] > 2:
+            raise ValueError('More than 1 od_point for ' + country)
+    return country_nodes.drop_duplicates('special').set_index('special')['id'].to_dict()
+
+
+def get_positive_values(table: pd.DataFrame, axis: int = 1) -> dict:
+    """For each row (axis=1) or column (axis=0) of the table, the dict of its positive values"""
+    if axis == 0:
+        table = table.transpose()
+    labels = table.columns.tolist()
+    return {
+        key: {label: value for label, value in zip(labels, row) if value > 0}
+        for key, row in zip(table.index.tolist(), table.to_numpy().tolist())
+    }
+
+
+def build_agent_table(firm_table: pd.DataFrame, household_table: pd.DataFrame, countries: "Countries") -> pd.DataFrame:
+    """Columnar table of the agents, one row per agent, built from the firm and household tables
+
+    The pids are those of the agent collections: the firm ids, 'hh_' followed by the household id,
+    and the country codes. Households and countries have no sector, and countries have no importance.
+    """
+    firm_rows = pd.DataFrame({
+        "agent_type": "firm",
+        "pid": firm_table['id'].to_numpy(),
+        "od_point": firm_table['od_point'].to_numpy(),
+        "long": firm_table['long'].to_numpy(dtype=float),
+        "lat": firm_table['lat'].to_numpy(dtype=float),
+        "sector": firm_table['sector'].to_numpy(),
+        "importance": firm_table['importance'].to_numpy(dtype=float)
+    })
+    household_rows = pd.DataFrame({
+        "agent_type": "household",
+        "pid": ['hh_' + str(i) for i in household_table['id'].tolist()],
+        "od_point": household_table['od_point'].to_numpy(),
+        "long": household_table['long'].to_numpy(dtype=float),
+        "lat": household_table['lat'].to_numpy(dtype=float)
+    })
+    country_rows = pd.DataFrame({
+        "agent_type": "country",
+        "pid": list(countries.keys()),
+        "od_point": [country.od_point for country in countries.values()],
+        "long": [country.long for country in countries.values()],
+        "lat": [country.lat for country in countries.values()]
+    })
+    return pd.concat([firm_rows, household_rows, country_rows], ignore_index=True)
+
+
 def extract_final_list_of_sector(firms: "Firms"):
     n = len(firms)
     present_sectors = list(set([firm.main_sector for firm in firms.values()]))
@@ -1,70 +1,88 @@
 import logging
+from typing import TYPE_CHECKING
 
+import numpy as np
 import pandas as pd
 
+if TYPE_CHECKING:
+    from src.network.sc_network import ScNetwork
+    from src.simulation.simulation import Simulation
 
-def compare_production_purchase_plans(firms, countries, households):
-    # Create dictionary to map firm id and country id into sector
-    dic_agent_id_to_sector = {pid: firm.sector for pid, firm in firms.items()}
-    for pid, country in countries.items():
-        dic_agent_id_to_sector[pid] = "IMP"
 
-    # Evaluate purchase plans of firms
-    df = pd.DataFrame({pid: firm.purchase_plan for pid, firm in firms.items()})
-    df["tot_purchase_planned_by_firms"] = df.sum(axis=1)
-    df['input_sector'] = df.index.map(dic_agent_id_to_sector)
-    df_firms = df.groupby('input_sector')["tot_purchase_planned_by_firms"].sum()
+class SectorBalanceDiagnostics:
+    """Compare, per sector, the purchases planned by all buyers with the production of the suppliers
 
-    # of countries
-    if len(countries) == 1:
-        country_id = list(countries.keys())[0]
-        df = pd.DataFrame(pd.Series(countries[country_id].purchase_plan, name=country_id))
-    df = pd.DataFrame({pid: country.purchase_plan for pid, country in countries.items()})
-    df["tot_purchase_planned_by_countries"] = df.sum(axis=1)
-    df['input_sector'] = df.index.map(dic_agent_id_to_sector)
-    df_countries = df.groupby('input_sector')["tot_purchase_planned_by_countries"].sum()
-    # of households
-    df = pd.DataFrame({pid: household.purchase_plan for pid, household in households.items()})
-    df["tot_purchase_planned_by_households"] = df.sum(axis=1)
-    # df = pd.DataFrame({"tot_purchase_planned_by_households": households.purchase_plan})
-    df['input_sector'] = df.index.map(dic_agent_id_to_sector)
-    df_households = df.groupby('input_sector')["tot_purchase_planned_by_households"].sum()
+    Run at a configurable frequency:
+    - "never"
+    - "first_step": only at time step 0
+    - "on_anomaly": evaluated at each time step, recorded only if purchases exceed production in a sector
+    - an integer k: every k time steps
 
-    # concat
-    df_purchase_plan = pd.concat([df_firms, df_countries, df_households], axis=1, sort=True)
+    The planned purchases are read from the orders of the commercial links, which buyers set to their purchase
+    plan. They are aggregated using the CSR index of the supply chain network, which needs to be built beforehand.
+    The resulting rows are stored in the `diagnostic_data` of the simulation.
+    """
+    frequencies = ["never", "first_step", "on_anomaly"]
+    buyer_types = {"firm": "planned_by_firms", "household": "planned_by_households",
+                   "country": "planned_by_countries"}
 
-    # Evalute productions/sales
-    # of firms
-    df = pd.DataFrame({
-        "tot_production_per_firm": {pid: firm.production for pid, firm in firms.items()}
-    }
-    )
-    df['sector'] = df.index.map(dic_agent_id_to_sector)
-    df_firms = df.groupby('sector')["tot_production_per_firm"].sum()
+    def __init__(self, sc_network: "ScNetwork", frequency: str | int, threshold: float = 1e-6):
+        if frequency not in self.frequencies and not (isinstance(frequency, int) and frequency > 0):
+            raise ValueError(f"Diagnostics frequency should be one of {self.frequencies} or a positive integer, "
+                             f"got {frequency}")
+        self.sc_network = sc_network
+        self.frequency = frequency
+        self.threshold = threshold
 
-    # of countries
-    df = pd.DataFrame(
-        {
-            "tot_production_per_country":
-                {pid: country.qty_sold for pid, country in countries.items()}
-        }
-    )
-    df['sector'] = df.index.map(dic_agent_id_to_sector)
-    df_countries = df.groupby('sector')["tot_production_per_country"].sum()
+        # Sector of each agent, as seen by its clients: countries sell imports
+        agent_sectors = [agent.sector if agent.agent_type == "firm" else "IMP"
+                         for agent in sc_network.index_to_agent]
+        self.sectors, sector_codes = np.unique(agent_sectors, return_inverse=True)
+        self.firm_slice = sc_network.type_slice("firm")
+        self.country_slice = sc_network.type_slice("country")
+        self.firm_sector_codes = sector_codes[self.firm_slice]
+        self.imp_code = int(np.searchsorted(self.sectors, "IMP"))
+        self.supplier_sector_codes = sector_codes[sc_network.in_indices]
+        buyer_type_codes = np.searchsorted([self.sc_network.index_offsets[agent_type]
+                                            for agent_type in sc_network.agent_types[1:]],
+                                           sc_network.in_buyer_indices(), side="right")
+        self.link_bins = buyer_type_codes * len(self.sectors) + self.supplier_sector_codes
 
-    # concat
-    df_sales = pd.concat([df_firms, df_countries], axis=1, sort=True)
+    def is_due(self, time_step: int) -> bool:
+        if self.frequency == "never":
+            return False
+        if self.frequency == "first_step":
+            return time_step == 0
+        if self.frequency == "on_anomaly":
+            return True
+        return time_step % self.frequency == 0
 
-    # Compare
-    res = pd.concat([df_purchase_plan, df_sales], axis=1, sort=True)
-    res['dif'] = (res["tot_purchase_planned_by_firms"]
-                  + res["tot_purchase_planned_by_countries"]
-                  + res["tot_purchase_planned_by_households"]
-                  - res['tot_production_per_firm'] - res['tot_production_per_country'])
-    boolindex_unbalanced = res['dif'] > 1e-6
-    if boolindex_unbalanced.sum() > 0:
-        logging.warning("Sales does not equate purchases for sectors: " +
-                        str(res.index[boolindex_unbalanced].tolist()))
+    def evaluate(self, time_step: int) -> pd.DataFrame:
+        nb_sectors = len(self.sectors)
+        orders = np.fromiter((commercial_link.order for commercial_link in self.sc_network.in_commercial_links),
+                             dtype=float, count=len(self.sc_network.in_commercial_links))
+        planned = np.bincount(self.link_bins, weights=orders, minlength=3 * nb_sectors).reshape(3, nb_sectors)
+        firm_production = np.fromiter((firm.production for firm in
+                                       self.sc_network.index_to_agent[self.firm_slice]), dtype=float)
+        country_production = np.zeros(nb_sectors)
+        country_production[self.imp_code] = sum(country.qty_sold for country in
+                                                self.sc_network.index_to_agent[self.country_slice])
+        balance = pd.DataFrame({"time_step": time_step, "sector": self.sectors})
+        for row, column in enumerate(self.buyer_types.values()):
+            balance[column] = planned[row]
+        balance["production_by_firms"] = np.bincount(self.firm_sector_codes, weights=firm_production,
+                                                     minlength=nb_sectors)
+        balance["production_by_countries"] = country_production
+        balance["difference"] = planned.sum(axis=0) - balance["production_by_firms"] \
+                                - balance["production_by_countries"]
+        return balance
+
+    def record(self, time_step: int, simulation: "Simulation"):
+        balance = self.evaluate(time_step)
+        if self.frequency == "on_anomaly" and not (balance["difference"] > self.threshold).any():
+            return
+        logging.debug(f"Sector balance evaluated at time step {time_step}")
+        simulation.diagnostic_data += balance.to_dict("records")
 
 
 # def compareDeliveredVsReceived(firm_list=None, households=None, G=None):
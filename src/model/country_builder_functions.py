@@ -5,15 +5,16 @@ import geopandas
 import pandas
 import pandas as pd
 
-from src.agents.country import Country, Countries
+from src.agents.country import Country, Countries, CompactCountry
 from src.model.basic_functions import rescale_monetary_values
+from src.model.builder_functions import get_country_od_points, get_positive_values
 from src.network.mrio import Mrio
 
 
 def create_countries(filepath_imports: Path, filepath_exports: Path, filepath_transit: Path,
                      transport_nodes: geopandas.GeoDataFrame, present_sectors: list,
                      countries_to_include: list | str = 'all', time_resolution: str = "week",
-                     target_units: str = "mUSD", input_units: str = "USD") -> Countries:
+                     target_units: str = "mUSD", input_units: str = "USD", compact: bool = False) -> Countries:
     """Create the countries
 
     Parameters
@@ -39,6 +40,8 @@ def create_countries(filepath_imports: Path, filepath_exports: Path, filepath_tr
     time_resolution : see rescaleMonetaryValues
     target_units : see rescaleMonetaryValues
     input_units : see rescaleMonetaryValues
+    compact : bool
+        If True, create slotted CompactCountry objects instead of Country objects
 
     Returns
     -------
@@ -88,50 +91,37 @@ def create_countries(filepath_imports: Path, filepath_exports: Path, filepath_tr
     logging.info("Total transit per " + time_resolution + " is " +
                  "{:.01f} ".format(transit_matrix.sum().sum()) + target_units)
 
+    country_class = CompactCountry if compact else Country
     country_list = []
     total_imports = import_table.sum().sum()
-    for country in import_table.index.tolist():
-        cond_country = transport_nodes['special'] == country
-        od_point = transport_nodes.loc[cond_country, "id"]
-        lon = transport_nodes.geometry.x
-        lat = transport_nodes.geometry.y
-        if len(od_point) == 0:
-            raise ValueError('No od_point found for ' + country)
-        elif len(od_point) > 2:
-            raise ValueError('More than 1 od_point for ' + country)
-        else:
-            od_point = od_point.iloc[0]
-            lon = lon.iloc[0]
-            lat = lat.iloc[0]
-
-        # imports, i.e., sales of countries
-        qty_sold = import_table.loc[country, :]
-        qty_sold = qty_sold[qty_sold > 0].to_dict()
+    country_pids = import_table.index.tolist()
+    od_points = get_country_od_points(country_pids, transport_nodes)
+    # As when each country searched for its node, the coordinates are those of the first transport node
+    lon = transport_nodes.geometry.x.iloc[0]
+    lat = transport_nodes.geometry.y.iloc[0]
+    # imports, i.e., sales of countries, and exports, i.e., purchases from countries
+    qty_sold_per_country = get_positive_values(import_table)
+    qty_purchased_per_country = get_positive_values(export_table)
+    # transits
+    # Note that transit are not given per sector, so, if we only consider a few sector,
+    # the full transit flows will still be used
+    transit_from_per_country = get_positive_values(transit_matrix, axis=0)
+    transit_to_per_country = get_positive_values(transit_matrix)
+    for country in country_pids:
+        qty_sold = qty_sold_per_country[country]
         supply_importance = sum(qty_sold.values()) / total_imports
 
-        # exports, i.e., purchases from countries
-        qty_purchased = export_table.loc[country, :]
-        qty_purchased = qty_purchased[qty_purchased > 0].to_dict()
-
-        # transits
-        # Note that transit are not given per sector, so, if we only consider a few sector,
-        # the full transit flows will still be used
-        transit_from = transit_matrix.loc[:, country]
-        transit_from = transit_from[transit_from > 0].to_dict()
-        transit_to = transit_matrix.loc[country, :]
-        transit_to = transit_to[transit_to > 0].to_dict()
-
         # create the list of Country object
-        country_list += [Country(pid=country,
-                                 qty_sold=qty_sold,
-                                 qty_purchased=qty_purchased,
-                                 od_point=od_point,
-                                 long=lon,
-                                 lat=lat,
-                                 transit_from=transit_from,
-                                 transit_to=transit_to,
-                                 supply_importance=supply_importance
-                                 )]
+        country_list += [country_class(pid=country,
+                                       qty_sold=qty_sold,
+                                       qty_purchased=qty_purchased_per_country[country],
+                                       od_point=od_points[country],
+                                       long=lon,
+                                       lat=lat,
+                                       transit_from=transit_from_per_country[country],
+                                       transit_to=transit_to_per_country[country],
+                                       supply_importance=supply_importance
+                                       )]
     countries = Countries(country_list)
 
     logging.info('Country_list created: ' + str([country.pid for country in country_list]))
@@ -141,7 +131,7 @@ def create_countries(filepath_imports: Path, filepath_exports: Path, filepath_tr
 
 def create_countries_from_mrio(filepath_mrio: Path,
                                transport_nodes: geopandas.GeoDataFrame, time_resolution: str,
-                               target_units: str, input_units: str) -> Countries:
+                               target_units: str, input_units: str, compact: bool = False) -> Countries:
     logging.info('Creating countries.')
 
     # Load mrio
@@ -193,25 +183,20 @@ def create_countries_from_mrio(filepath_mrio: Path,
                  "{:.01f} ".format(transit_matrix.sum().sum()) + target_units)
 
     total_imports = import_table.sum().sum()
+    country_class = CompactCountry if compact else Country
     countries = Countries()
+    od_points = get_country_od_points(country_list, transport_nodes)
+    # As when each country searched for its node, the coordinates are those of the first transport node
+    lon = transport_nodes.geometry.x.iloc[0]
+    lat = transport_nodes.geometry.y.iloc[0]
+    qty_sold_per_country = get_positive_values(import_table) if total_imports > 0 else {}
+    qty_purchased_per_country = get_positive_values(export_table, axis=0)
+    transit_from_per_country = get_positive_values(transit_matrix, axis=0)
+    transit_to_per_country = get_positive_values(transit_matrix)
     for country in country_list:
-        cond_country = transport_nodes['special'] == country
-        od_point = transport_nodes.loc[cond_country, "id"]
-        lon = transport_nodes.geometry.x
-        lat = transport_nodes.geometry.y
-        if len(od_point) == 0:
-            raise ValueError('No od_point found for ' + country)
-        elif len(od_point) > 2:
-            raise ValueError('More than 1 od_point for ' + country)
-        else:
-            od_point = od_point.iloc[0]
-            lon = lon.iloc[0]
-            lat = lat.iloc[0]
-
         # imports, i.e., sales of countries
         if country in selling_countries and total_imports > 0:
-            qty_sold = import_table.loc[country, :]
-            qty_sold = qty_sold[qty_sold > 0].to_dict()
+            qty_sold = qty_sold_per_country[country]
             supply_importance = sum(qty_sold.values()) / total_imports
         else:
             qty_sold = {}
@@ -219,35 +204,26 @@ def create_countries_from_mrio(filepath_mrio: Path,
 
         # exports, i.e., purchases from countries
         if country in buying_countries:
-            qty_purchased = export_table.loc[:, country]
-            qty_purchased = qty_purchased[qty_purchased > 0].to_dict()
+            qty_purchased = qty_purchased_per_country[country]
         else:
             qty_purchased = {}
 
         # transits
         # Note that transit are not given per sector, so, if we only consider a few sector,
         # the full transit flows will still be used
-        if country in transit_matrix.columns:
-            transit_from = transit_matrix.loc[:, country]
-            transit_from = transit_from[transit_from > 0].to_dict()
-        else:
-            transit_from = {}
-        if country in transit_matrix.index:
-            transit_to = transit_matrix.loc[country, :]
-            transit_to = transit_to[transit_to > 0].to_dict()
-        else:
-            transit_to = {}
+        transit_from = transit_from_per_country.get(country, {})
+        transit_to = transit_to_per_country.get(country, {})
 
         # Populate countries
-        countries[country] = Country(pid=country,
-                                     qty_sold=qty_sold,
-                                     qty_purchased=qty_purchased,
-                                     od_point=od_point,
-                                     long=lon,
-                                     lat=lat,
-                                     transit_from=transit_from,
-                                     transit_to=transit_to,
-                                     supply_importance=supply_importance)
+        countries[country] = country_class(pid=country,
+                                           qty_sold=qty_sold,
+                                           qty_purchased=qty_purchased,
+                                           od_point=od_points[country],
+                                           long=lon,
+                                           lat=lat,
+                                           transit_from=transit_from,
+                                           transit_to=transit_to,
+                                           supply_importance=supply_importance)
     print(len(countries))
     logging.info('Countries created: ' + str(countries.get_properties('pid')))
 
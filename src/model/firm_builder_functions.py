@@ -3,13 +3,16 @@ import logging
 from pathlib import Path
 
 import geopandas
+import numpy as np
 import pandas
 import pandas as pd
 import geopandas as gpd
+from scipy import sparse
 
-from src.agents.firm import Firm, Firms
+from src.agents.firm import Firm, Firms, CompactFirm
 from src.network.mrio import Mrio
-from src.model.builder_functions import get_index_closest_point, get_closest_road_nodes, get_long_lat
+from src.model.builder_functions import get_index_closest_point, get_closest_road_nodes, get_long_lat, \
+    read_columns
 
 
 def create_firms(
@@ -17,7 +20,8 @@ def create_firms(
         keep_top_n_firms: object = None,
         inventory_restoration_time: float = 4,
         utilization_rate: float = 0.8,
-        capital_to_value_added_ratio: float = 4
+        capital_to_value_added_ratio: float = 4,
+        compact: bool = False
 ) -> Firms:
     """Create the firms
 
@@ -34,6 +38,8 @@ def create_firms(
         Determines the speed at which firms try to reach their inventory duration target
     utilization_rate: float
         Set the utilization rate, which determines the production capacity at the input-output equilibrium.
+    compact: bool
+        If True, create slotted CompactFirm objects instead of Firm objects
 
     Returns
     -------
@@ -50,22 +56,25 @@ def create_firms(
         firm_table['main_sector'] = firm_table['sector']
     # print(firm_table.head())
     # print(firm_table.iloc[0])
+    firm_class = CompactFirm if compact else Firm
+    columns = read_columns(firm_table, ["sector", "sector_type", "main_sector", "od_point", "importance", "name",
+                                        "long", "lat"])
     firms = Firms([
-        Firm(i,
-             sector=firm_table.loc[i, "sector"],
-             sector_type=firm_table.loc[i, "sector_type"],
-             main_sector=firm_table.loc[i, "main_sector"],
-             od_point=firm_table.loc[i, "od_point"],
-             importance=firm_table.loc[i, 'importance'],
-             name=firm_table.loc[i, 'name'],
-             # geometry=firm_table.loc[i, 'geometry'],
-             long=float(firm_table.loc[i, 'long']),
-             lat=float(firm_table.loc[i, 'lat']),
-             utilization_rate=utilization_rate,
-             inventory_restoration_time=inventory_restoration_time,
-             capital_to_value_added_ratio=capital_to_value_added_ratio
-             )
-        for i in ids
+        firm_class(i,
+                   sector=sector,
+                   sector_type=sector_type,
+                   main_sector=main_sector,
+                   od_point=od_point,
+                   importance=importance,
+                   name=name,
+                   long=float(long),
+                   lat=float(lat),
+                   utilization_rate=utilization_rate,
+                   inventory_restoration_time=inventory_restoration_time,
+                   capital_to_value_added_ratio=capital_to_value_added_ratio
+                   )
+        for i, sector, sector_type, main_sector, od_point, importance, name, long, lat
+        in zip(ids, *columns.values())
     ])
     # We add a bit of noise to the long and lat coordinates
     # It allows to visually disentangle firms located at the same od-point when plotting the map.
@@ -472,18 +481,63 @@ def load_mrio_tech_coefs(
     # matrix_output = pd.concat([tot_outputs] * len(mrio.index), axis=1).transpose()
     # matrix_output.index = mrio.index
     # tech_coef_matrix = mrio[region_sectors] / matrix_output
-    tech_coef_dict = mrio.get_tech_coef_dict(threshold=io_cutoff)
+    tech_coefs = mrio.get_sparse_tech_coefs(threshold=io_cutoff)
+    input_names = ['_'.join(tup) for tup in mrio.index]
+    region_sector_positions = {region_sector_name: j for j, region_sector_name in enumerate(mrio.region_sector_names)}
 
-    # Load into firms
+    # Load into firms, reading only the column of their sector
     for firm in firms.values():
-        if firm.sector in tech_coef_dict.keys():
-            firm.input_mix = tech_coef_dict[firm.sector]
+        if firm.sector in region_sector_positions.keys():
+            column = tech_coefs[:, [region_sector_positions[firm.sector]]]
+            firm.input_mix = {input_names[i]: value for i, value in zip(column.indices.tolist(), column.data.tolist())}
         else:
             firm.input_mix = {}
 
     logging.info('Technical coefficient loaded.')
 
 
+def compute_input_mix_from_transactions(transaction_table: pd.DataFrame, firm_table: pd.DataFrame) \
+        -> tuple[pd.Series, pd.DataFrame]:
+    """Compute the input mix of all buyers of the transaction table at once
+
+    Parameters
+    ----------
+    transaction_table : pandas.DataFrame
+        Transactions, with the buyer_id, the transaction, the product_sector and whether it is_essential
+    firm_table : pandas.DataFrame
+        Firms, with their id and output
+
+    Returns
+    -------
+    essential_input_mix : pandas.Series
+        Sparse buyer x product sector matrix, indexed by (buyer_id, product_sector): the essential inputs bought
+        from each sector per unit of output of the buyer. Only the pairs with transactions are present.
+    other_input_mix : pandas.DataFrame
+        Per buyer, the non-essential inputs per unit of output, 'non_essential',
+        and the output which can be produced with the essential inputs only, 'max_output_with_essential_only'
+    """
+    output = firm_table.set_index('id')['output']
+    is_essential = transaction_table['is_essential'].astype(bool)
+    total_inputs = transaction_table.groupby('buyer_id')['transaction'].sum()
+    buyer_output = output.reindex(total_inputs.index)
+
+    essential_input_mix = transaction_table[is_essential] \
+        .groupby(['buyer_id', 'product_sector'])['transaction'].sum()
+    essential_input_mix = essential_input_mix / output.reindex(
+        essential_input_mix.index.get_level_values('buyer_id')).to_numpy()
+
+    non_essential_inputs = transaction_table[~is_essential].groupby('buyer_id')['transaction'].sum() \
+        .reindex(total_inputs.index, fill_value=0)
+    # share of the inputs which is essential, giving how much can be produced with essential inputs only
+    share_essential = essential_input_mix.groupby(level='buyer_id').sum() \
+        .reindex(total_inputs.index, fill_value=0) / total_inputs
+    other_input_mix = pd.DataFrame({
+        'non_essential': non_essential_inputs / buyer_output,
+        'max_output_with_essential_only': share_essential * buyer_output
+    })
+    return essential_input_mix, other_input_mix
+
+
 def calibrate_input_mix(
         firms: Firms,
         firm_table: pd.DataFrame,
@@ -502,33 +556,87 @@ def calibrate_input_mix(
         sector_table.set_index('sector')['essential'])
 
     # Get input mix from this data
-    def get_input_mix(transaction_from_unique_buyer, firm_tab):
-        output = firm_tab.set_index('id').loc[transaction_from_unique_buyer.name, 'output']
-        print(output)
-        cond_essential = transaction_from_unique_buyer['is_essential']
-        # for essential inputs, get total input per product type
-        input_essential = transaction_from_unique_buyer[cond_essential].groupby('product_sector')[
-                              'transaction'].sum() / output
-        # for non essential inputs, get total input
-        input_nonessential = transaction_from_unique_buyer.loc[~cond_essential, 'transaction'].sum() / output
-        # get share how much is essential and evaluate how much can be produce with essential input only (beta)
-        share_essential = input_essential.sum() / transaction_from_unique_buyer['transaction'].sum()
-        max_output_with_essential_only = share_essential * output
-        # shape results
-        dic_res = input_essential.to_dict()
-        dic_res['non_essential'] = input_nonessential
-        dic_res['max_output_with_essential_only'] = max_output_with_essential_only
-        return dic_res
-
-    input_mix = transaction_table.groupby('buyer_id').apply(get_input_mix, firm_table)
+    essential_input_mix, other_input_mix = compute_input_mix_from_transactions(transaction_table, firm_table)
+    essential_input_mix_per_buyer = {
+        buyer_id: dict(zip(buyer_input_mix.index.get_level_values('product_sector').tolist(),
+                           buyer_input_mix.tolist()))
+        for buyer_id, buyer_input_mix in essential_input_mix.groupby(level='buyer_id')
+    }
 
     # Load input mix into Firms
     for firm in firms.values():
-        firm.input_mix = input_mix[firm.pid]
+        firm.input_mix = essential_input_mix_per_buyer.get(firm.pid, {})
+        firm.input_mix['non_essential'] = other_input_mix.loc[firm.pid, 'non_essential']
+        firm.input_mix['max_output_with_essential_only'] = \
+            other_input_mix.loc[firm.pid, 'max_output_with_essential_only']
 
     return firms, transaction_table
 
 
+def build_inventory_duration_targets(firms: Firms, inventory_duration_target: int | str, time_adjustment: float,
+                                     filepath_inventory_duration_targets: Path,
+                                     extra_inventory_target: int | None = None,
+                                     inputs_with_extra_inventories: None | list | str = None,
+                                     buying_sectors_with_extra_inventories: None | list | str = None,
+                                     min_inventory: int = 1) -> tuple[sparse.csr_matrix, list]:
+    """Inventory duration targets of all firms, as a sparse firm x input sector matrix, and its input sectors
+
+    The matrix holds one entry per firm and input it uses, each row following the order of the input mix of the firm.
+    The base targets are either uniform or given per buying sector and input sector, in which case the
+    buying sector x input sector table is read at the sector of the firm of each entry.
+    The extra inventories and the minimum inventory are then applied with masks over the entries.
+    """
+    firm_sectors = [firm.sector for firm in firms.values()]
+    input_sectors = list(dict.fromkeys(input_sector for firm in firms.values() for input_sector in firm.input_mix))
+    input_positions = {input_sector: j for j, input_sector in enumerate(input_sectors)}
+    indptr = np.cumsum([0] + [len(firm.input_mix) for firm in firms.values()])
+    columns = np.array([input_positions[input_sector] for firm in firms.values() for input_sector in firm.input_mix],
+                       dtype=int)
+    rows = np.repeat(np.arange(len(firm_sectors)), np.diff(indptr))
+
+    if isinstance(inventory_duration_target, int):
+        targets = np.full(len(columns), time_adjustment * inventory_duration_target)
+
+    elif inventory_duration_target == 'inputed':
+        sector_targets = pd.read_csv(filepath_inventory_duration_targets) \
+            .pivot(index='buying_sector', columns='input_sector', values='inventory_duration_target') \
+            .reindex(index=list(dict.fromkeys(firm_sectors)), columns=input_sectors)
+        buying_sector_positions = np.array(sector_targets.index.get_indexer(firm_sectors), dtype=int)
+        targets = time_adjustment * sector_targets.to_numpy(dtype=float)[buying_sector_positions[rows], columns]
+        missing = np.isnan(targets)
+        if missing.any():
+            k = np.flatnonzero(missing)[0]
+            raise KeyError((firm_sectors[rows[k]], input_sectors[columns[k]]))
+
+    else:
+        raise ValueError("Unknown value entered for 'inventory_duration_target'")
+
+    # Add extra inventories if needed
+    if isinstance(extra_inventory_target, int):
+        if inputs_with_extra_inventories == 'all':
+            has_extra_input = np.ones(len(input_sectors), dtype=bool)
+        elif isinstance(inputs_with_extra_inventories, list):
+            has_extra_input = np.isin(input_sectors, inputs_with_extra_inventories)
+        else:
+            has_extra_input = None
+        if buying_sectors_with_extra_inventories == 'all':
+            has_extra_buyer = np.ones(len(firm_sectors), dtype=bool)
+        elif isinstance(buying_sectors_with_extra_inventories, list):
+            has_extra_buyer = np.isin(firm_sectors, buying_sectors_with_extra_inventories)
+        else:
+            has_extra_buyer = None
+        if (has_extra_input is None) or (has_extra_buyer is None):
+            raise ValueError("Unknown value given for 'inputs_with_extra_inventories' or "
+                             "'buying_sectors_with_extra_inventories'. Should be a list of string or 'all'")
+        has_extra = has_extra_buyer[rows] & has_extra_input[columns]
+        targets[has_extra] = targets[has_extra] + extra_inventory_target * time_adjustment
+
+    if min_inventory > 0:
+        targets = np.maximum(min_inventory * time_adjustment, targets)
+
+    return sparse.csr_matrix((targets, columns, indptr), shape=(len(firm_sectors), len(input_sectors))), input_sectors
+
+
 def load_inventories(firms: Firms, inventory_duration_target: int | str, given_time_unit: str, model_time_unit: str,
                      filepath_inventory_duration_targets: Path, extra_inventory_target: int | None = None,
                      inputs_with_extra_inventories: None | list = None,
@@ -545,6 +653,8 @@ def load_inventories(firms: Firms, inventory_duration_target: int | str, given_t
     - to specific buying firms, e.g., all manufacturing firms have more of all inputs,
     - to a combination of both. e.g., all manufacturing firms have more of agricultural inputs.
     We can also add some noise on the distribution of inventories. Not yet implemented.
+    The targets are stored on firms, as a sparse firm x input sector matrix with its input sectors,
+    and each firm gets its own row as its inventory_duration_target dictionary.
 
     Parameters
     ----------
@@ -579,82 +689,18 @@ def load_inventories(firms: Firms, inventory_duration_target: int | str, given_t
     }
     time_adjustment = time_unit_in_days[given_time_unit] / time_unit_in_days[model_time_unit]
 
-    if isinstance(inventory_duration_target, int):
-        for firm in firms.values():
-            firm.inventory_duration_target = {input_sector: time_adjustment * inventory_duration_target
-                                              for input_sector in firm.input_mix.keys()}
-
-    elif inventory_duration_target == 'inputed':
-        dic_sector_inventory = pd.read_csv(filepath_inventory_duration_targets) \
-                               .set_index(['buying_sector', 'input_sector'])['inventory_duration_target'].to_dict()
-        for firm in firms.values():
-            firm.inventory_duration_target = {
-                input_sector: time_adjustment * dic_sector_inventory[(firm.sector, input_sector)]
-                for input_sector in firm.input_mix.keys()
-            }
-
-    else:
-        raise ValueError("Unknown value entered for 'inventory_duration_target'")
-
-    # if random_mean_sd:
-    #     if random_draw:
-    #         for firm in firms:
-    #             firm.inventory_duration_target = {}
-    #             for input_sector in firm.input_mix.keys():
-    #                 mean = dic_sector_inventory[(firm.sector, input_sector)]['mean']
-    #                 sd = dic_sector_inventory[(firm.sector, input_sector)]['sd']
-    #                 mu = math.log(mean/math.sqrt(1+sd**2/mean**2))
-    #                 sigma = math.sqrt(math.log(1+sd**2/mean**2))
-    #                 safety_day = np.random.log(mu, sigma)
-    #                 firm.inventory_duration_target[input_sector] = safety_day
-
-    # Add extra inventories if needed. Not the best programming maybe...
-    if isinstance(extra_inventory_target, int):
-        if isinstance(inputs_with_extra_inventories, list) and (buying_sectors_with_extra_inventories == 'all'):
-            for firm in firms.values():
-                firm.inventory_duration_target = {
-                    input_sector: firm.inventory_duration_target[input_sector] + extra_inventory_target*time_adjustment
-                    if (input_sector in inputs_with_extra_inventories) else firm.inventory_duration_target[input_sector]
-                    for input_sector in firm.input_mix.keys()
-                }
-
-        elif (inputs_with_extra_inventories == 'all') and isinstance(buying_sectors_with_extra_inventories, list):
-            for firm in firms.values():
-                firm.inventory_duration_target = {
-                    input_sector: firm.inventory_duration_target[input_sector] + extra_inventory_target*time_adjustment
-                    if (firm.sector in buying_sectors_with_extra_inventories) else firm.inventory_duration_target[
-                        input_sector]
-                    for input_sector in firm.input_mix.keys()
-                }
-
-        elif isinstance(inputs_with_extra_inventories, list) and isinstance(buying_sectors_with_extra_inventories,
-                                                                            list):
-            for firm in firms.values():
-                firm.inventory_duration_target = {
-                    input_sector: firm.inventory_duration_target[input_sector] + extra_inventory_target*time_adjustment
-                    if ((input_sector in inputs_with_extra_inventories) and (
-                            firm.sector in buying_sectors_with_extra_inventories)) else
-                    firm.inventory_duration_target[input_sector]
-                    for input_sector in firm.input_mix.keys()
-                }
-
-        elif (inputs_with_extra_inventories == 'all') and (buying_sectors_with_extra_inventories == 'all'):
-            for firm in firms.values():
-                firm.inventory_duration_target = {
-                    input_sector: firm.inventory_duration_target[input_sector] + extra_inventory_target*time_adjustment
-                    for input_sector in firm.input_mix.keys()
-                }
-
-        else:
-            raise ValueError("Unknown value given for 'inputs_with_extra_inventories' or "
-                             "'buying_sectors_with_extra_inventories'. Should be a list of string or 'all'")
-
-    if min_inventory > 0:
-        for firm in firms.values():
-            firm.inventory_duration_target = {
-                input_sector: max(min_inventory * time_adjustment, inventory)
-                for input_sector, inventory in firm.inventory_duration_target.items()
-            }
+    targets, input_sectors = build_inventory_duration_targets(firms, inventory_duration_target, time_adjustment,
+                                                              filepath_inventory_duration_targets,
+                                                              extra_inventory_target, inputs_with_extra_inventories,
+                                                              buying_sectors_with_extra_inventories, min_inventory)
+    # The matrix is kept on the firms, for the computations over all firms
+    firms.inventory_duration_targets = targets
+    firms.inventory_input_sectors = input_sectors
+
+    # Each firm receives the entries of its row, which follow the order of its input mix
+    values = targets.data.tolist()
+    for firm, start, end in zip(firms.values(), targets.indptr[:-1].tolist(), targets.indptr[1:].tolist()):
+        firm.inventory_duration_target = dict(zip(firm.input_mix.keys(), values[start:end]))
 
     logging.info('Inventory duration targets loaded')
     if extra_inventory_target:
@@ -5,17 +5,19 @@ import pandas
 import pandas as pd
 import geopandas as gpd
 import numpy as np
+from scipy import sparse
 
-from src.agents.household import Household, Households
+from src.agents.household import Household, Households, CompactHousehold
 from src.model.builder_functions import get_index_closest_point, get_long_lat, \
-    get_closest_road_nodes
+    get_closest_road_nodes, read_columns
 from src.model.basic_functions import rescale_monetary_values
 from src.network.mrio import Mrio
 
 
 def create_households(
         household_table: pd.DataFrame,
-        household_sector_consumption: dict
+        household_sector_consumption: dict,
+        compact: bool = False
 ):
     """Create the households
 
@@ -27,6 +29,8 @@ def create_households(
         household_table
     household_sector_consumption: dic
         {<household_id>: {<sector>: <amount>}}
+    compact: bool
+        If True, create slotted CompactHousehold objects instead of Household objects
 
     Returns
     -------
@@ -35,22 +39,55 @@ def create_households(
 
     logging.debug('Creating households')
     household_table = household_table.set_index('id')
+    household_class = CompactHousehold if compact else Household
+    columns = read_columns(household_table, ["name", "od_point", "long", "lat", "population"])
     households = Households([
-        Household('hh_' + str(i),
-                  name=household_table.loc[i, "name"],
-                  od_point=household_table.loc[i, "od_point"],
-                  long=float(household_table.loc[i, 'long']),
-                  lat=float(household_table.loc[i, 'lat']),
-                  population=household_table.loc[i, "population"],
-                  sector_consumption=household_sector_consumption[i]
-                  )
-        for i in household_table.index.tolist()
+        household_class('hh_' + str(i),
+                        name=name,
+                        od_point=od_point,
+                        long=float(long),
+                        lat=float(lat),
+                        population=population,
+                        sector_consumption=household_sector_consumption[i]
+                        )
+        for i, name, od_point, long, lat, population in zip(household_table.index.tolist(), *columns.values())
     ])
     logging.info('Households generated')
 
     return households
 
 
+def allocate_final_demand(final_demand: pd.Series, weights: pd.Series) -> pd.DataFrame:
+    """Final demand of each household per sector, as the outer product of the household weights, e.g., their share
+    of the population, and the final demand per sector"""
+    return pd.DataFrame(np.outer(weights.to_numpy(dtype=float), final_demand.to_numpy(dtype=float)),
+                        index=weights.index, columns=final_demand.index.tolist())
+
+
+def build_sector_consumption_matrix(household_table: pd.DataFrame, sectors: list) -> sparse.csr_matrix:
+    """Sparse household x sector matrix of consumption, in the order of the rows of the household table
+
+    The entries which are not NaN, i.e., the sectors from which a household buys, are stored, even if null.
+    """
+    consumption = household_table[sectors].to_numpy(dtype=float)
+    is_bought = ~np.isnan(consumption)
+    indptr = np.concatenate([[0], np.cumsum(is_bought.sum(axis=1))])
+    return sparse.csr_matrix((consumption[is_bought], np.nonzero(is_bought)[1], indptr), shape=consumption.shape)
+
+
+def get_household_sector_consumption(household_table: pd.DataFrame, sectors: list) -> dict:
+    """Consumption per sector of each household, {<household_id>: {<sector>: <amount>}}, without the NaN values"""
+    matrix = build_sector_consumption_matrix(household_table, sectors)
+    sector_positions = matrix.indices.tolist()
+    amounts = matrix.data.tolist()
+    indptr = matrix.indptr.tolist()
+    return {
+        i: {sectors[j]: amount for j, amount in zip(sector_positions[indptr[k]:indptr[k + 1]],
+                                                     amounts[indptr[k]:indptr[k + 1]])}
+        for k, i in enumerate(household_table['id'].tolist())
+    }
+
+
 def define_households_from_mrio_data(
         sector_table: pd.DataFrame,
         filepath_region_table: Path,
@@ -148,17 +185,8 @@ def define_households_from_mrio_data(
         target_units=target_units,
         input_units=input_units
     )
-    # to dict
-    household_sector_consumption = household_table.set_index('id')[filtered_sectors].to_dict(orient='index')
-    # remove nan values
-    household_sector_consumption = {
-        i: {
-            sector: amount
-            for sector, amount in purchase_plan.items()
-            if ~np.isnan(amount)
-        }
-        for i, purchase_plan in household_sector_consumption.items()
-    }
+    # to dict, without nan values
+    household_sector_consumption = get_household_sector_consumption(household_table, filtered_sectors)
 
     return household_table, household_sector_consumption
 
@@ -298,15 +326,9 @@ def define_households(
     # get final demand for the selected sector
     final_demand = sector_table.loc[sector_table['sector'].isin(sectors_to_buy_from), ['sector', 'final_demand']]
 
-    # put as single row
-    final_demand_as_row = final_demand.set_index('sector').transpose()
-    # duplicates rows
-    final_demand_each_household = pd.concat([final_demand_as_row for i in range(household_table.shape[0])])
-    # align index and concat
-    final_demand_each_household.index = household_table.index
-    # compute final demand per region
+    # compute final demand per region, proportionally to its population
     rel_pop = household_table['population'] / region_data['population'].sum()
-    final_demand_each_household = final_demand_each_household.multiply(rel_pop, axis='index')
+    final_demand_each_household = allocate_final_demand(final_demand.set_index('sector')['final_demand'], rel_pop)
     # add to household table
     household_table = pd.concat([household_table, final_demand_each_household], axis=1)
 
@@ -367,17 +389,8 @@ def define_households(
         target_units=target_units,
         input_units=input_units
     )
-    # to dict
-    household_sector_consumption = household_table.set_index('id')[sectors_to_buy_from].to_dict(orient='index')
-    # remove nan values
-    household_sector_consumption = {
-        i: {
-            sector: amount
-            for sector, amount in purchase_plan.items()
-            if ~np.isnan(amount)
-        }
-        for i, purchase_plan in household_sector_consumption.items()
-    }
+    # to dict, without nan values
+    household_sector_consumption = get_household_sector_consumption(household_table, sectors_to_buy_from)
 
     return household_table, household_sector_consumption
 
@@ -418,15 +431,9 @@ def add_households_for_firms(
     final_demand = sector_table.loc[sector_table['sector'].isin(filtered_sectors), ['sector', 'final_demand']]
 
     # B3. Add final demand per sector per new household
-    # put as single row
-    final_demand_as_row = final_demand.set_index('sector').transpose()
-    # duplicates rows
-    final_demand_each_household = pd.concat([final_demand_as_row for i in range(added_household_table.shape[0])])
-    # align index and concat
-    final_demand_each_household.index = added_household_table.index
-    # compute final demand per commune
+    # compute final demand per commune, proportionally to its population
     rel_pop = added_household_table['population'] / tot_pop
-    final_demand_each_household = final_demand_each_household.multiply(rel_pop, axis='index')
+    final_demand_each_household = allocate_final_demand(final_demand.set_index('sector')['final_demand'], rel_pop)
     # keep demand only for firm that are there
     cond_to_reject = (
         firm_table[cond_no_household].groupby(['od_point', 'sector'])['population'].sum().isnull()).unstack('sector')
@@ -466,17 +473,7 @@ def add_households_for_firms(
     if (household_table[filtered_sectors].sum(axis=1) == 0).any():
         logging.warning('Some households have no purchase plan!')
 
-    # E. Create household_sector_consumption dic
-    # create dic
-    household_sector_consumption = household_table.set_index('id')[filtered_sectors].to_dict(orient='index')
-    # remove nan values
-    household_sector_consumption = {
-        i: {
-            sector: amount
-            for sector, amount in purchase_plan.items()
-            if ~np.isnan(amount)
-        }
-        for i, purchase_plan in household_sector_consumption.items()
-    }
+    # E. Create household_sector_consumption dic, without nan values
+    household_sector_consumption = get_household_sector_consumption(household_table, filtered_sectors)
 
     return household_table, household_sector_consumption
@@ -0,0 +1,41 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.agents.agent import Agent
+
+
+class LossTracker:
+    """Running totals of the extra spending and consumption loss of households and countries
+
+    Agents report to the tracker when they reset their indicators and each time they receive a delivery,
+    so that the totals, and the set of agents incurring losses, are known without summing over all agents.
+    """
+
+    def __init__(self, epsilon: float):
+        self.epsilon = epsilon or 0
+        self.extra_spending = {"household": 0, "country": 0}
+        self.consumption_loss = {"household": 0, "country": 0}
+        self.deviating_agents = set()
+
+    def track(self, agent: "Agent"):
+        agent.loss_tracker = self
+        self.add(agent, agent.extra_spending, agent.consumption_loss)
+
+    def remove(self, agent: "Agent"):
+        """To be called before the agent resets its indicators"""
+        self.extra_spending[agent.agent_type] -= agent.extra_spending
+        self.consumption_loss[agent.agent_type] -= agent.consumption_loss
+        self.deviating_agents.discard((agent.agent_type, agent.pid))
+
+    def add(self, agent: "Agent", new_extra_spending: float, new_consumption_loss: float):
+        """To be called after the agent incremented its indicators by the new values"""
+        self.extra_spending[agent.agent_type] += new_extra_spending
+        self.consumption_loss[agent.agent_type] += new_consumption_loss
+        if (agent.extra_spending > self.epsilon) or (agent.consumption_loss > self.epsilon):
+            self.deviating_agents.add((agent.agent_type, agent.pid))
+        else:
+            self.deviating_agents.discard((agent.agent_type, agent.pid))
+
+    def is_back_to_equilibrium(self) -> bool:
+        return all(total <= self.epsilon
+                   for total in list(self.extra_spending.values()) + list(self.consumption_loss.values()))
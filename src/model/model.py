@@ -1,6 +1,5 @@
 from typing import TYPE_CHECKING
 
-import networkx as nx
 import numpy as np
 import pandas as pd
 import logging
@@ -10,7 +9,7 @@ from .caching_functions import \
     load_cached_transaction_table, \
     cache_transport_network, \
     cache_agent_data, load_cached_sc_network, cache_sc_network, load_cached_logistic_routes, cache_logistic_routes
-from src.model.check_functions import compare_production_purchase_plans
+from src.model.check_functions import SectorBalanceDiagnostics
 from src.model.country_builder_functions import create_countries_from_mrio, create_countries
 from src.model.firm_builder_functions import define_firms_from_local_economic_data, define_firms_from_network_data, \
     define_firms_from_mrio, create_firms, load_technical_coefficients, calibrate_input_mix, load_mrio_tech_coefs, \
@@ -22,12 +21,21 @@ from src.model.transport_network_builder_functions import \
     create_transport_network
 from src.model.builder_functions import \
     filter_sector, \
-    extract_final_list_of_sector, \
+    extract_final_list_of_sector, build_agent_table, \
     load_ton_usd_equivalence
 from src.parameters import Parameters
 from src.disruption.disruption import DisruptionList, TransportDisruption, CapitalDestruction
 from src.simulation.simulation import Simulation
+from src.simulation.agent_data_recorder import AgentDataRecorder, household_sector_losses
+from src.simulation.loss_summarizer import RegionalLossSummarizer
+from src.simulation.transport_flow_recorder import TransportFlowRecorder
+from src.simulation.export_queue import ExportQueue
 from src.network.sc_network import ScNetwork
+from src.network.leontief_system import LeontiefSystem
+from src.model.scheduler import ActiveSetScheduler
+from src.model.loss_tracker import LossTracker
+from src.model.supplier_selection import SupplierSelection
+from src.model.snapshot import ModelSnapshot
 
 if TYPE_CHECKING:
     from src.agents.country import Countries
@@ -57,11 +65,26 @@ class Model(object):
         self.household_table = None
         self.countries = None
         self.transaction_table = None
+        self.agent_table = None
         # Supply-chain network variables
         self.sc_network = None
         # Disruption variable
         self.disruption_list = None
         self.reconstruction_market = None
+        self.scheduler = None
+        self.loss_tracker = None
+        self.diagnostics = None
+        self.export_queue = ExportQueue(asynchronous=self.parameters.asynchronous_export)
+
+    def __getstate__(self):
+        # The export queue may hold a writer thread, which cannot be copied
+        state = self.__dict__.copy()
+        state['export_queue'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.export_queue = ExportQueue(asynchronous=False)
 
     def is_initialized(self):
         if all([self.transport_network_initialized, self.agents_initialized,
@@ -169,7 +192,8 @@ class Model(object):
                 keep_top_n_firms=nb_firms,
                 inventory_restoration_time=self.parameters.inventory_restoration_time,
                 utilization_rate=self.parameters.utilization_rate,
-                capital_to_value_added_ratio=self.parameters.capital_to_value_added_ratio
+                capital_to_value_added_ratio=self.parameters.capital_to_value_added_ratio,
+                compact=self.parameters.compact_agents
             )
 
             n, present_sectors, flow_types_to_export = extract_final_list_of_sector(self.firms)
@@ -213,7 +237,8 @@ class Model(object):
                     )
             self.households = create_households(
                 household_table=self.household_table,
-                household_sector_consumption=household_sector_consumption
+                household_sector_consumption=household_sector_consumption,
+                compact=self.parameters.compact_agents
             )
 
             # Loading the technical coefficients
@@ -266,7 +291,8 @@ class Model(object):
                     transport_nodes=self.transport_nodes,
                     time_resolution=self.parameters.time_resolution,
                     target_units=self.parameters.monetary_units_in_model,
-                    input_units=self.parameters.monetary_units_inputed
+                    input_units=self.parameters.monetary_units_inputed,
+                    compact=self.parameters.compact_agents
                 )
             else:
                 self.countries = create_countries(
@@ -278,7 +304,8 @@ class Model(object):
                     countries_to_include=self.parameters.countries_to_include,
                     time_resolution=self.parameters.time_resolution,
                     target_units=self.parameters.monetary_units_in_model,
-                    input_units=self.parameters.monetary_units_inputed
+                    input_units=self.parameters.monetary_units_inputed,
+                    compact=self.parameters.compact_agents
                 )
 
             # Specify the weight of a unit worth of good, which may differ according to sector, or even to each
@@ -309,11 +336,14 @@ class Model(object):
         # Locate firms and households on transport network
         self.transport_network.locate_firms_on_nodes(self.firms, self.transport_nodes)
         self.transport_network.locate_households_on_nodes(self.households, self.transport_nodes)
+        if self.parameters.build_agent_table:
+            self.agent_table = build_agent_table(self.firm_table, self.household_table, self.countries)
         self.agents_initialized = True
 
     def setup_sc_network(self, cached: bool):
         if cached:
             self.sc_network, self.firms, self.households, self.countries = load_cached_sc_network()
+            self.sc_network.build_node_index(self.firms, self.households, self.countries)
 
         else:
             logging.info(
@@ -321,34 +351,29 @@ class Model(object):
                 f'{self.parameters.nb_suppliers_per_input}')
             self.sc_network = ScNetwork()
 
-            logging.info('Households are selecting their retailers (domestic B2C flows and import B2C flows)')
-            for household in self.households.values():
-                household.select_suppliers(self.sc_network, self.firms, self.countries,
-                                           self.parameters.nb_suppliers_per_input, self.parameters.force_local_retailer,
-                                           self.parameters.weight_localization_household,
-                                           self.parameters.firm_data_type)
+            import_code_from_table = self.sector_table.loc[self.sector_table['type'] == 'imports', 'sector'].iloc[0]
+            supplier_selection = SupplierSelection(self.firms, self.households, self.countries,
+                                                   self.sector_table, self.transport_nodes,
+                                                   self.parameters.nb_suppliers_per_input,
+                                                   self.parameters.force_local_retailer,
+                                                   self.parameters.weight_localization_household,
+                                                   self.parameters.weight_localization_firm,
+                                                   self.parameters.firm_data_type, import_code_from_table,
+                                                   self.parameters.supplier_selection_seed,
+                                                   self.parameters.supplier_selection_nb_workers)
 
+            logging.info('Households are selecting their retailers (domestic B2C flows and import B2C flows)')
             logging.info('Exporters are being selected by purchasing countries (export B2B flows)')
             logging.info('and trading countries are being connected (transit flows)')
-            for country in self.countries.values():
-                country.select_suppliers(self.sc_network, self.firms, self.countries,
-                                         self.sector_table, self.transport_nodes)
-
             logging.info(
                 f'Firms are selecting their domestic and international suppliers (import B2B flows) '
                 f'(domestic B2B flows). Weight localisation is {self.parameters.weight_localization_firm}'
             )
-            import_code_from_table = self.sector_table.loc[self.sector_table['type'] == 'imports', 'sector'].iloc[0]
-
             if self.parameters.firm_data_type in ["disaggregating IO", 'mrio']:
-                for firm in self.firms.values():
-                    firm.select_suppliers(self.sc_network, self.firms, self.countries,
-                                          self.parameters.nb_suppliers_per_input,
-                                          self.parameters.weight_localization_firm,
-                                          self.parameters.firm_data_type,
-                                          import_code=import_code_from_table)
+                supplier_selection.select_suppliers(self.sc_network, agent_types=("household", "country", "firm"))
 
             elif self.parameters.firm_data_type == "supplier-buyer network":
+                supplier_selection.select_suppliers(self.sc_network, agent_types=("household", "country"))
                 for firm in self.firms.values():
                     inputed_supplier_links = self.transaction_table[self.transaction_table['buyer_id'] == firm.pid]
                     output = self.firm_table.set_index('id').loc[firm.pid, "output"]
@@ -369,6 +394,7 @@ class Model(object):
                 raise ValueError('Some firms are not in the sc network')
 
             self.sc_network.remove_useless_commercial_links()
+            self.sc_network.build_node_index(self.firms, self.households, self.countries)
 
             logging.info('The nodes and edges of the supplier--buyer have been created')
             # Save to tmp folder
@@ -386,6 +412,7 @@ class Model(object):
         if cached:
             self.sc_network, self.transport_network, self.firms, self.households, \
                 self.countries = load_cached_logistic_routes()
+            self.sc_network.build_node_index(self.firms, self.households, self.countries)
 
         else:
             logging.info('The supplier--buyer graph is being connected to the transport network')
@@ -415,23 +442,14 @@ class Model(object):
 
             self.logistic_routes_initialized = True
 
-    def reset_variables(self):
-        logging.info("Resetting variables on transport network")
-        self.transport_network.reinitialize_flows_and_disruptions()
+    def take_snapshot(self) -> ModelSnapshot:
+        """Copy the variables of the agents, commercial links and transport network, e.g., at equilibrium"""
+        return ModelSnapshot(self)
 
-        logging.info("Resetting agents and commercial links variables")
-        for household in self.households.values():
-            household.reset_variables()
-            for edge in self.sc_network.in_edges(household):
-                self.sc_network[edge[0]][household]['object'].reset_variables()
-        for firm in self.firms.values():
-            firm.reset_variables()
-            for edge in self.sc_network.in_edges(firm):
-                self.sc_network[edge[0]][firm]['object'].reset_variables()
-        for country in self.countries.values():
-            country.reset_variables()
-            for edge in self.sc_network.in_edges(country):
-                self.sc_network[edge[0]][country]['object'].reset_variables()
+    def restore_snapshot(self, snapshot: ModelSnapshot):
+        """Bring the model back to the state of the snapshot, without setting the initial conditions again"""
+        logging.info("Restoring agents, commercial links and transport network variables")
+        snapshot.restore(self)
 
     def set_initial_conditions(self):
         logging.info("Setting initial conditions to input-output equilibrium")
@@ -453,23 +471,15 @@ class Model(object):
         # Weight is the sectoral technical coefficient, if there is only one supplier for the input
         # It there are several, the technical coefficient is multiplied by the share of input of
         # this type that the firm buys to this supplier.
-        # l1 = [firm.pid for firm in self.sc_network.nodes if isinstance(firm.pid, int) ]
-        # l1.sort()
-        # print(l1)
-        # print([firm.pid for firm in self.firms])
-        firm_connectivity_matrix = nx.adjacency_matrix(
-            self.sc_network,
-            # graph.subgraph(list(graph.nodes)[:-1]),
-            weight='weight',
-            nodelist=self.firms.values()
-        ).todense()
+        # Firms occupy the first len(self.firms) positions of the node index of the sc network
+        firm_connectivity_matrix = self.sc_network.sparse_firm_connectivity_matrix()
         # Imports are considered as "a sector". We get the weight per firm for these inputs.
         # TODO !!! aren't I computing the same thing as the IMP tech coef? To check
         import_weight_per_firm = [
             sum([
-                self.sc_network[supply_edge[0]][supply_edge[1]]['weight']
-                for supply_edge in self.sc_network.in_edges(firm)
-                if self.sc_network[supply_edge[0]][supply_edge[1]]['object'].category == 'import'
+                self.sc_network[supplier][firm]['weight']
+                for supplier, commercial_link in self.sc_network.in_links(firm)
+                if commercial_link.category == 'import'
             ])
             for firm in self.firms.values()
         ]
@@ -477,13 +487,11 @@ class Model(object):
 
         # Build final demand vector per firm, of length n
         # Exports are considered as final demand
-        final_demand_vector = self.build_final_demand_vector(self.households, self.countries, self.firms)
+        final_demand_vector = self.build_final_demand_vector(self.households, self.countries, self.firms,
+                                                             self.sc_network)
 
-        # Solve the input--output equation
-        eq_production_vector = np.linalg.solve(
-            np.eye(n) - firm_connectivity_matrix,
-            final_demand_vector  # + 0.01
-        )
+        # Solve the input--output equation, with the factorization of I - A cached for this sc network
+        eq_production_vector = LeontiefSystem.from_sc_network(self.sc_network).solve(final_demand_vector)
 
         # Initialize households variables
         for household in self.households.values():
@@ -492,7 +500,7 @@ class Model(object):
         # Compute costs
         # 1. Input costs
         domestic_input_cost_vector = np.multiply(
-            firm_connectivity_matrix.sum(axis=0).reshape((n, 1)),
+            np.asarray(firm_connectivity_matrix.sum(axis=0)).reshape((n, 1)),
             eq_production_vector
         )
         import_input_cost_vector = np.multiply(
@@ -511,15 +519,16 @@ class Model(object):
         # 1. Firm operational variables
         for firm in self.firms.values():  # TODO make it a FirmCollection method
             firm.initialize_operational_variables(
-                eq_production=eq_production_vector[(firm.pid, 0)]
+                eq_production=eq_production_vector[(self.sc_network.index_of(firm), 0)]
             )
         # 2. Firm financial variables
         for firm in self.firms.values():
+            firm_index = self.sc_network.index_of(firm)
             firm.initialize_financial_variables(
-                eq_production=eq_production_vector[(firm.pid, 0)],
-                eq_input_cost=input_cost_vector[(firm.pid, 0)],
-                eq_transport_cost=transport_cost_vector[(firm.pid, 0)],
-                eq_other_cost=other_cost_vector[(firm.pid, 0)]
+                eq_production=eq_production_vector[(firm_index, 0)],
+                eq_input_cost=input_cost_vector[(firm_index, 0)],
+                eq_transport_cost=transport_cost_vector[(firm_index, 0)],
+                eq_other_cost=other_cost_vector[(firm_index, 0)]
             )
         # 3. Commercial links: agents set their order
         for household in self.households.values():
@@ -544,11 +553,13 @@ class Model(object):
             self.sc_network[edge[0]][edge[1]]['object'].price = 1
 
     @staticmethod
-    def build_final_demand_vector(households: "Households", countries: "Countries", firms: "Firms") -> np.array:
+    def build_final_demand_vector(households: "Households", countries: "Countries", firms: "Firms",
+                                  sc_network: "ScNetwork") -> np.array:
         """
         Create a numpy.Array of the final demand per firm, including exports
 
         Households and countries should already have set their purchase plan
+        Firms are positioned according to the node index of the sc_network
 
         Returns
         -------
@@ -560,29 +571,59 @@ class Model(object):
         for household in households.values():
             for retailer_id, quantity in household.purchase_plan.items():
                 if isinstance(retailer_id, int):  # we only consider purchase from firms, not from other countries
-                    final_demand_vector[(retailer_id, 0)] += quantity
+                    final_demand_vector[(sc_network.node_index[("firm", retailer_id)], 0)] += quantity
 
         # Collect country final demand. They buy from firms and countries.
         # We need to filter the demand directed to firms only.
         for country in countries.values():
             for supplier_id, quantity in country.purchase_plan.items():
                 if isinstance(supplier_id, int):  # we only consider purchase from firms, not from other countries
-                    final_demand_vector[(supplier_id, 0)] += quantity
+                    final_demand_vector[(sc_network.node_index[("firm", supplier_id)], 0)] += quantity
 
         return final_demand_vector
 
+    def initialize_simulation(self, simulation_type: str) -> Simulation:
+        simulation = Simulation(simulation_type)
+        if simulation_type == "event":
+            simulation.loss_summarizer = RegionalLossSummarizer(self.household_table)
+            simulation.country_losses = []
+        self.track_losses()
+        self.diagnostics = SectorBalanceDiagnostics(self.sc_network, self.parameters.diagnostics_frequency)
+        if self.parameters.agent_data_storage != "memory":
+            if self.parameters.export_files:
+                simulation.recorder = AgentDataRecorder(self.parameters.export_folder / "agent_data",
+                                                        self.parameters.agent_data_storage,
+                                                        export_queue=self.export_queue)
+            else:
+                logging.warning("Agent data can only be streamed to files if export_files is True, "
+                                "it is kept in memory instead")
+        if self.parameters.transport_flow_export != "geojson":
+            if self.parameters.export_files:
+                simulation.flow_recorder = TransportFlowRecorder(self.parameters.export_folder / "transport_flows",
+                                                                 self.parameters.transport_flow_export,
+                                                                 self.transport_edges,
+                                                                 export_queue=self.export_queue)
+            else:
+                logging.warning("Transport flows can only be streamed to files if export_files is True, "
+                                "they are kept in memory instead")
+        return simulation
+
     def run_static(self):
-        simulation = Simulation("initial_state")
+        simulation = self.initialize_simulation("initial_state")
         logging.info("Simulating the initial state")
         self.run_one_time_step(time_step=0, current_simulation=simulation)
+        simulation.close_recorder()
         return simulation
 
     def run_disruption(self):
         # Initialize the model
-        simulation = Simulation("event")
+        simulation = self.initialize_simulation("event")
         logging.info("Simulating the initial state")
         self.run_one_time_step(time_step=0, current_simulation=simulation)
+        return self.run_disruption_after_initial_state(simulation)
 
+    def run_disruption_after_initial_state(self, simulation: Simulation) -> Simulation:
+        """Simulate the events of the parameters, the initial time step being already in the simulation"""
         # Get disruptions
         self.disruption_list = DisruptionList.from_events_parameter(self.parameters.events,
                                                                     self.parameters.monetary_units_in_model,
@@ -593,20 +634,34 @@ class Model(object):
         logging.info(f"{len(self.disruption_list)} disruption(s) will occur")
         self.disruption_list.log_info()
 
+        # Record the equilibrium, to only update the agents affected by the disruptions
+        self.scheduler = None
+        if self.parameters.active_set_scheduling:
+            if self.parameters.capacity_constraint:
+                logging.warning("Active set scheduling is not compatible with capacity constraints, "
+                                "all agents are updated at each time step")
+            else:
+                self.scheduler = ActiveSetScheduler(self.sc_network, self.parameters.epsilon_stop_condition)
+
         # Adjust t_final
         t_final = self.parameters.duration_dic[self.disruption_list.end_time]
         logging.info('Simulation will last at max ' + str(t_final) + ' time steps.')
 
         logging.info("Starting time loop")
+        nb_steps_at_equilibrium = 0
         for t in range(1, t_final + 1):
             logging.info(f'Time t={t}')
             self.run_one_time_step(time_step=t, current_simulation=simulation)
 
-            if (t > max([disruption.start_time for disruption in
-                         self.disruption_list])) and self.parameters.epsilon_stop_condition:
+            if (t > self.disruption_list.last_start_time) and self.parameters.epsilon_stop_condition:
                 if self.is_back_to_equilibrium:
-                    logging.info("Simulation stops")
-                    break
+                    nb_steps_at_equilibrium += 1
+                    if nb_steps_at_equilibrium >= self.parameters.quiescence_window:
+                        logging.info("Simulation stops")
+                        break
+                else:
+                    nb_steps_at_equilibrium = 0
+        simulation.close_recorder()
         return simulation
 
     def run_one_time_step(self, time_step: int, current_simulation: Simulation):
@@ -615,24 +670,36 @@ class Model(object):
         if self.disruption_list:
             self.apply_disruption(time_step)
 
-        self.firms.retrieve_orders(self.sc_network)
+        # When transport flows are computed, all agents need to send their shipments
+        export_flows = (self.parameters.transport_flow_time_steps == "all") \
+            or (time_step in self.parameters.transport_flow_time_steps)
+        if self.scheduler and not export_flows:
+            firms, households, countries = self.scheduler.get_active_agents()
+        else:
+            firms, households, countries = self.firms, self.households, self.countries
+
+        firms.retrieve_orders(self.sc_network)
         if self.reconstruction_market:
             self.reconstruction_market.evaluate_demand_to_firm(self.firms)
             self.reconstruction_market.send_orders(self.firms)
-        self.firms.plan_production(self.sc_network, self.parameters.propagate_input_price_change)
-        self.firms.plan_purchase(self.parameters.adaptive_inventories, self.parameters.adaptive_supplier_weight)
-        self.households.send_purchase_orders(self.sc_network)
-        self.countries.send_purchase_orders(self.sc_network)
-        self.firms.send_purchase_orders(self.sc_network)
-        self.firms.produce()
-        self.countries.deliver(self.sc_network, self.transport_network, self.parameters.sectors_no_transport_network,
-                               self.parameters.rationing_mode, self.parameters.capacity_constraint,
-                               self.parameters.monetary_units_in_model, self.parameters.cost_repercussion_mode,
-                               self.parameters.price_increase_threshold, self.parameters.transport_cost_noise_level)
-        self.firms.deliver(self.sc_network, self.transport_network, self.parameters.sectors_no_transport_network,
-                           self.parameters.rationing_mode, self.parameters.capacity_constraint,
-                           self.parameters.monetary_units_in_model, self.parameters.cost_repercussion_mode,
-                           self.parameters.price_increase_threshold, self.parameters.transport_cost_noise_level)
+        firms.plan_production(self.sc_network, self.parameters.propagate_input_price_change)
+        firms.plan_purchase(self.parameters.adaptive_inventories, self.parameters.adaptive_supplier_weight)
+        households.send_purchase_orders(self.sc_network)
+        countries.send_purchase_orders(self.sc_network)
+        firms.send_purchase_orders(self.sc_network)
+        firms.produce()
+        countries.deliver(self.sc_network, self.transport_network, self.parameters.sectors_no_transport_network,
+                          self.parameters.rationing_mode, self.parameters.capacity_constraint,
+                          self.parameters.monetary_units_in_model, self.parameters.cost_repercussion_mode,
+                          self.parameters.price_increase_threshold, self.parameters.transport_cost_noise_level)
+        firms.deliver(self.sc_network, self.transport_network, self.parameters.sectors_no_transport_network,
+                      self.parameters.rationing_mode, self.parameters.capacity_constraint,
+                      self.parameters.monetary_units_in_model, self.parameters.cost_repercussion_mode,
+                      self.parameters.price_increase_threshold, self.parameters.transport_cost_noise_level)
+        if self.scheduler and not export_flows:
+            self.scheduler.replay_passive_deliveries(self.transport_network,
+                                                     self.parameters.sectors_no_transport_network,
+                                                     self.parameters.capacity_constraint)
         if self.reconstruction_market:
             self.reconstruction_market.distribute_new_capital(self.firms)
         # if congestion: TODO reevaluate modeling of congestion
@@ -648,8 +715,8 @@ class Model(object):
         #     for country in countries:
         #         country.add_congestion_malus2(sc_network, transport_network)
         #
-        if time_step in [0, 1]:
-            current_simulation.transport_network_data += self.transport_network.compute_flow_per_segment(time_step)
+        if export_flows:
+            current_simulation.store_transport_flows(self.transport_network.compute_flow_per_segment(time_step))
         # TODO: store transport data, depending on current_simulation type and time step
         # TODO: store supply chain data, depending on current_simulation type and time step
         # if (time_step in [0, 1, 2]) and (
@@ -673,28 +740,44 @@ class Model(object):
         # export_sc_flow_analysis):  # should be done at this stage, while the goods are on their way
         #     analyzeSupplyChainFlows(sc_network, firms, export_folder)
         #
-        self.households.receive_products(self.sc_network, self.transport_network,
-                                         self.parameters.sectors_no_transport_network)
-        self.countries.receive_products(self.sc_network, self.transport_network,
-                                        self.parameters.sectors_no_transport_network)
-        self.firms.receive_products(self.sc_network, self.transport_network,
+        households.receive_products(self.sc_network, self.transport_network,
                                     self.parameters.sectors_no_transport_network)
-        self.firms.evaluate_profit(self.sc_network)
-
-        self.transport_network.update_road_disruption_state()
-        self.firms.update_disrupted_production_capacity()
+        countries.receive_products(self.sc_network, self.transport_network,
+                                   self.parameters.sectors_no_transport_network)
+        firms.receive_products(self.sc_network, self.transport_network,
+                               self.parameters.sectors_no_transport_network)
+        firms.evaluate_profit(self.sc_network)
+
+        recovered_edge_ids = self.transport_network.update_road_disruption_state()
+        firms.update_disrupted_production_capacity()
+        if self.scheduler:
+            self.scheduler.update_deviations(firms, households, countries)
+            # Agents which settled on alternative routes or reduced capacities need to adjust to the recovery
+            self.scheduler.add_transport_edge_seeds(recovered_edge_ids)
+            self.scheduler.add_capital_recovery_seeds()
         #
-        self.store_agent_data(time_step, current_simulation)
+        # Losses are summed at each time step, only the agent data is recorded every k time steps
+        household_losses = self.store_losses(time_step, current_simulation)
+        if time_step % self.parameters.agent_data_recording_frequency == 0:
+            self.store_agent_data(time_step, current_simulation, household_losses)
 
-        compare_production_purchase_plans(self.firms, self.countries, self.households)
+        if self.diagnostics and self.diagnostics.is_due(time_step):
+            self.diagnostics.record(time_step, current_simulation)
 
     def apply_disruption(self, time_step: int):
         disruptions_starting_now = self.disruption_list.filter_start_time(time_step)
         for disruption in disruptions_starting_now:
             if isinstance(disruption, TransportDisruption):
                 disruption.implement(self.transport_network)
+                if self.scheduler:
+                    self.scheduler.add_transport_disruption_seeds(disruption)
             if isinstance(disruption, CapitalDestruction):
                 disruption.implement(self.firms, self)
+                if self.scheduler:
+                    self.scheduler.add_capital_destruction_seeds(disruption)
+                    if self.reconstruction_market:
+                        self.scheduler.add_permanent_seeds(
+                            self.reconstruction_market.get_participating_firms(self.firms))
         # edge_disruptions_starting_now = disruptions_starting_now.filter_type('transport_edge')
         # if len(edge_disruptions_starting_now) > 0:
         #     self.transport_network.disrupt_edges(
@@ -705,22 +788,44 @@ class Model(object):
         #     self.firms.get_disrupted(firm_disruptions_starting_now.get_item_id_duration_reduction_dict())
         # node disruption not implemented
 
+    def track_losses(self):
+        """Let households and countries report their extra spending and consumption loss to a shared tracker"""
+        self.loss_tracker = LossTracker(self.parameters.epsilon_stop_condition)
+        for household in self.households.values():
+            self.loss_tracker.track(household)
+        for country in self.countries.values():
+            self.loss_tracker.track(country)
+
     @property
     def is_back_to_equilibrium(self):
-        household_extra_spending = sum([household.extra_spending for household in self.households.values()])
-        household_consumption_loss = sum([household.consumption_loss for household in self.households.values()])
-        country_extra_spending = sum([country.extra_spending for country in self.countries.values()])
-        country_consumption_loss = sum([country.consumption_loss for country in self.countries.values()])
-        if (household_extra_spending <= self.parameters.epsilon_stop_condition) & \
-                (household_consumption_loss <= self.parameters.epsilon_stop_condition) & \
-                (country_extra_spending <= self.parameters.epsilon_stop_condition) & \
-                (country_consumption_loss <= self.parameters.epsilon_stop_condition):
+        if self.loss_tracker is None:
+            self.track_losses()
+        if self.loss_tracker.is_back_to_equilibrium():
             logging.info('Household and country extra spending and consumption loss are at pre-disruption values.')
             return True
         else:
             return False
 
-    def store_agent_data(self, time_step: int, simulation: Simulation):
+    def store_losses(self, time_step: int, simulation: Simulation) -> dict | None:
+        """Feed the loss accumulators of the simulation, if any, and return the household losses per sector"""
+        if simulation.loss_summarizer is None:
+            return None
+        household_losses = household_sector_losses(time_step, self.households)
+        simulation.loss_summarizer.add(pd.DataFrame(household_losses))
+        simulation.country_losses += [
+            {
+                'time_step': time_step,
+                'country': country.pid,
+                'loss': country.extra_spending + country.consumption_loss
+            }
+            for country in self.countries.values()
+        ]
+        return household_losses
+
+    def store_agent_data(self, time_step: int, simulation: Simulation, household_losses: dict | None = None):
+        if simulation.recorder:
+            simulation.recorder.record(time_step, self.firms, self.households, self.countries, household_losses)
+            return
         # TODO: could create agent-level method to export stuff
         simulation.firm_data += [
             {
@@ -768,13 +873,20 @@ class Model(object):
         ]
 
     def export_transport_nodes_edges(self):
-        self.transport_nodes.to_file(
-            self.parameters.export_folder / 'transport_nodes.geojson',
-            driver="GeoJSON", index=False)
-        self.transport_edges.to_file(
-            self.parameters.export_folder / 'transport_edges.geojson',
-            driver="GeoJSON", index=False)
+        # Copies are exported, since the tables are enriched during the setup of the agents
+        transport_nodes = self.transport_nodes.copy()
+        if 'firms_there' in transport_nodes.columns:  # lists cannot be written in GeoJSON
+            transport_nodes['firms_there'] = transport_nodes['firms_there'].map(
+                lambda pids: ','.join(str(pid) for pid in pids))
+        self.export_queue.submit(transport_nodes.to_file,
+                                 self.parameters.export_folder / 'transport_nodes.geojson',
+                                 driver="GeoJSON", index=False)
+        self.export_queue.submit(self.transport_edges.copy().to_file,
+                                 self.parameters.export_folder / 'transport_edges.geojson',
+                                 driver="GeoJSON", index=False)
 
     def export_agent_tables(self):
-        self.firm_table.to_csv(self.parameters.export_folder / 'firm_table.csv', index=False)
-        self.household_table.to_csv(self.parameters.export_folder / 'household_table.csv', index=False)
+        self.export_queue.submit(self.firm_table.copy().to_csv, self.parameters.export_folder / 'firm_table.csv',
+                                 index=False)
+        self.export_queue.submit(self.household_table.copy().to_csv,
+                                 self.parameters.export_folder / 'household_table.csv', index=False)
@@ -0,0 +1,173 @@
+from typing import TYPE_CHECKING
+
+import logging
+from itertools import chain
+
+from src.agents.firm import Firms, EPSILON
+from src.agents.household import Households
+from src.agents.country import Countries
+
+if TYPE_CHECKING:
+    from src.agents.agent import Agent
+    from src.network.commercial_link import CommercialLink
+    from src.network.sc_network import ScNetwork
+    from src.network.transport_network import TransportNetwork
+    from src.disruption.disruption import TransportDisruption, CapitalDestruction
+
+
+def get_agent_state(agent: "Agent") -> tuple:
+    """Variables which, if unchanged between two time steps, mean that the agent has reached a steady state
+
+    Cumulated losses are included, so that agents still incurring losses are not considered steady.
+    """
+    if agent.agent_type == "firm":
+        return (agent.production, agent.product_stock, agent.capital_destroyed, agent.remaining_disrupted_time,
+                agent.reconstruction_demand, agent.delta_price_input) + tuple(agent.inventory.values())
+    elif agent.agent_type == "household":
+        return agent.tot_consumption, agent.tot_spending, agent.extra_spending, agent.consumption_loss
+    elif agent.agent_type == "country":
+        return agent.qty_sold, agent.generalized_transport_cost, agent.extra_spending, agent.consumption_loss
+    else:
+        raise ValueError(f"Unknown agent type {agent.agent_type}")
+
+
+def get_commercial_link_state(commercial_link: "CommercialLink") -> tuple:
+    return (commercial_link.order, commercial_link.delivery, commercial_link.payment, commercial_link.price,
+            commercial_link.fulfilment_rate, commercial_link.current_route)
+
+
+def states_are_close(state: tuple, reference_state: tuple, epsilon: float) -> bool:
+    if len(state) != len(reference_state):
+        return False
+    for value, reference_value in zip(state, reference_state):
+        if isinstance(value, str) or isinstance(reference_value, str):
+            if value != reference_value:
+                return False
+        elif abs(value - reference_value) > epsilon:
+            return False
+    return True
+
+
+class ActiveSetScheduler:
+    """Restrict the update of agents to the cone affected by the disruptions
+
+    The state of each agent and commercial link is recorded when the scheduler is created,
+    which should be right after the initial time step, and updated each time the agent is updated.
+    Since the economy may still be adjusting after the initial time step, all agents start as deviating.
+    At each time step, the active agents are the seeds (agents touched by disruptions starting or ending now,
+    or participating to the reconstruction market), the deviating agents, and all their suppliers and clients.
+    Passive suppliers of active buyers are not updated: they replay their last shipment,
+    which is what they would deliver again, since they and their clients' orders are steady.
+    An agent deviates if one of its state variables, or of its commercial links, changed by more than epsilon
+    during the last time step. Other agents are in a steady state, with steady neighbors:
+    updating them would leave them unchanged, so they are skipped.
+    Agents thus return to the passive set once their state is back within epsilon of a steady state.
+    """
+
+    def __init__(self, sc_network: "ScNetwork", epsilon: float):
+        self.sc_network = sc_network
+        self.epsilon = epsilon or 0
+        self.agent_states = [get_agent_state(agent) for agent in sc_network.index_to_agent]
+        self.commercial_link_states = {
+            commercial_link: get_commercial_link_state(commercial_link)
+            for commercial_link in sc_network.in_commercial_links
+        }
+        self.links_per_transport_edge = self.index_commercial_links_per_transport_edge()
+        self.deviating = set(range(len(sc_network.index_to_agent)))
+        self.seeds = set()
+        self.permanent_seeds = set()
+        self.firms_with_destroyed_capital = set()
+        self.active = set()
+        self.nb_active_agents = []
+
+    def index_commercial_links_per_transport_edge(self) -> dict:
+        """For each transport edge id, the (supplier, buyer) indices of the commercial links routed through it"""
+        links_per_transport_edge = {}
+        for supplier_index, buyer_index, commercial_link in zip(self.sc_network.in_indices.tolist(),
+                                                                self.sc_network.in_buyer_indices().tolist(),
+                                                                self.sc_network.in_commercial_links):
+            for edge_id in getattr(commercial_link.route, "transport_edge_ids", []):
+                links_per_transport_edge.setdefault(edge_id, []).append((supplier_index, buyer_index))
+        return links_per_transport_edge
+
+    def add_transport_edge_seeds(self, edge_ids):
+        """Suppliers and buyers of the commercial links whose main route crosses one of the edges"""
+        for edge_id in edge_ids:
+            for supplier_index, buyer_index in self.links_per_transport_edge.get(edge_id, []):
+                self.seeds.update((supplier_index, buyer_index))
+
+    def add_transport_disruption_seeds(self, transport_disruption: "TransportDisruption"):
+        self.add_transport_edge_seeds(transport_disruption.keys())
+
+    def add_capital_destruction_seeds(self, capital_destruction: "CapitalDestruction"):
+        for firm_id in capital_destruction.keys():
+            i = self.sc_network.node_index[("firm", firm_id)]
+            self.seeds.add(i)
+            self.firms_with_destroyed_capital.add(i)
+
+    def add_capital_recovery_seeds(self):
+        """Firms whose destroyed capital has been rebuilt, so that their production capacity is restored"""
+        recovered = {i for i in self.firms_with_destroyed_capital
+                     if self.sc_network.index_to_agent[i].capital_destroyed <= EPSILON}
+        self.seeds |= recovered
+        self.firms_with_destroyed_capital -= recovered
+
+    def add_permanent_seeds(self, firms: "Firms"):
+        """Agents which are kept active, e.g., the firms participating to the reconstruction market"""
+        self.permanent_seeds |= {self.sc_network.index_of(firm) for firm in firms.values()}
+
+    def get_active_agents(self) -> tuple[Firms, Households, Countries]:
+        """Active agents, in the same order as in the full agent collections"""
+        core = self.deviating | self.seeds | self.permanent_seeds
+        self.seeds = set()
+        active = set(core)
+        for i in core:
+            agent = self.sc_network.index_to_agent[i]
+            active.update(self.sc_network.index_of(neighbor) for neighbor, _ in
+                          chain(self.sc_network.in_links(agent), self.sc_network.out_links(agent)))
+        self.active = active
+        self.nb_active_agents.append(len(active))
+        active_agents = [self.sc_network.index_to_agent[i] for i in sorted(active)]
+        logging.info(f"{len(active_agents)} active agents out of {len(self.sc_network.index_to_agent)}")
+        return (Firms([agent for agent in active_agents if agent.agent_type == "firm"]),
+                Households([agent for agent in active_agents if agent.agent_type == "household"]),
+                Countries([agent for agent in active_agents if agent.agent_type == "country"]))
+
+    def replay_passive_deliveries(self, transport_network: "TransportNetwork", sectors_no_transport_network: list,
+                                  capacity_constraint: bool):
+        """Ship again the last delivery of the passive suppliers to the active buyers
+
+        Services do not go through the transport network, the buyer reads the last delivery from the link.
+        """
+        in_indptr = self.sc_network.in_indptr.tolist()
+        in_indices = self.sc_network.in_indices.tolist()
+        for i in self.active:
+            for k in range(in_indptr[i], in_indptr[i + 1]):
+                commercial_link = self.sc_network.in_commercial_links[k]
+                if (in_indices[k] not in self.active) and (commercial_link.order > 0) \
+                        and (commercial_link.product_type not in sectors_no_transport_network):
+                    transport_network.transport_shipment(commercial_link, capacity_constraint)
+
+    def update_deviations(self, *updated_agents):
+        """Evaluate which agents deviate, among those updated during this time step, and record their new state
+
+        The two ends of a deviating commercial link are flagged, since the passive end may be affected next.
+        """
+        deviating = set()
+        link_states = {}
+        for agents in updated_agents:
+            for agent in agents.values():
+                i = self.sc_network.index_of(agent)
+                state = get_agent_state(agent)
+                if not states_are_close(state, self.agent_states[i], self.epsilon):
+                    deviating.add(i)
+                self.agent_states[i] = state
+                for neighbor, commercial_link in chain(self.sc_network.in_links(agent),
+                                                       self.sc_network.out_links(agent)):
+                    link_state = get_commercial_link_state(commercial_link)
+                    if not states_are_close(link_state, self.commercial_link_states[commercial_link], self.epsilon):
+                        deviating.add(i)
+                        deviating.add(self.sc_network.index_of(neighbor))
+                    link_states[commercial_link] = link_state
+        self.commercial_link_states.update(link_states)
+        self.deviating = deviating
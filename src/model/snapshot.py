@@ -0,0 +1,173 @@
+import io
+import logging
+import pickle
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.model.basic_functions import CompactStateMixin
+
+if TYPE_CHECKING:
+    from src.model.model import Model
+
+
+# Numeric types whose values are stored as contiguous arrays
+ARRAY_TYPES = {bool: bool, int: np.int64, float: np.float64,
+               np.bool_: np.bool_, np.int32: np.int32, np.int64: np.int64, np.float64: np.float64}
+# Keys of the transport network data that change during a simulation
+TRANSPORT_EDGE_KEYS = ['shipments', 'disruption_duration', 'current_load', 'overused', 'current_capacity',
+                       'weight', 'capacity_weight']
+TRANSPORT_NODE_KEYS = ['shipments', 'disruption_duration']
+
+
+def get_attributes(obj) -> dict:
+    attributes = dict(vars(obj)) if hasattr(obj, '__dict__') else {}
+    if isinstance(obj, CompactStateMixin):
+        for field in obj._compact_fields:
+            if hasattr(obj, field):
+                attributes[field] = getattr(obj, field)
+    return attributes
+
+
+def set_attribute(obj, key: str, value):
+    setattr(obj, key, value)
+
+
+def set_item(obj: dict, key: str, value):
+    obj[key] = value
+
+
+class SharedObjectPickler(pickle.Pickler):
+    """Pickle references to the shared objects, e.g., agents or networks, by their position in a list"""
+
+    def __init__(self, file, shared_objects: list):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shared_ids = {id(obj): i for i, obj in enumerate(shared_objects)}
+
+    def persistent_id(self, obj):
+        return self.shared_ids.get(id(obj))
+
+
+class SharedObjectUnpickler(pickle.Unpickler):
+    def __init__(self, file, shared_objects: list):
+        super().__init__(file)
+        self.shared_objects = shared_objects
+
+    def persistent_load(self, pid):
+        return self.shared_objects[pid]
+
+
+class ModelSnapshot:
+    """Copy of the variables of a model, which can be restored any number of times
+
+    It covers the agents, the commercial links, the weights of the supply chain network,
+    the loads, shipments and disruption states of the transport network, the disruptions and the loss tracker.
+    The objects are kept in fixed groups: for each group and each numeric attribute holding a value of the same type
+    for all objects, the values are stored as one contiguous array. The other values, e.g., dictionaries or routes,
+    are pickled together, in a single blob, so that every restoration gets fresh copies of them.
+    References to the agents, the networks and the loss tracker are kept as references, not copied.
+    The structure of the model, i.e., agents, commercial links and transport network, should not change
+    between the snapshot and its restoration.
+    """
+
+    def __init__(self, model: "Model"):
+        self.groups = self.get_groups(model)
+        self.loss_tracker = model.loss_tracker
+        self.shared_objects = self.get_shared_objects(model)
+        self.arrays = {}
+        other_values = {}
+        for group, (objects, keys, _) in self.groups.items():
+            states = [self.get_state(obj, keys) for obj in objects]
+            other_values[group] = [{} for _ in objects]
+            common_keys = set.intersection(*[set(state) for state in states]) if states else set()
+            for key in {key for state in states for key in state}:
+                values = [state[key] for state in states] if key in common_keys else None
+                value_types = {type(value) for value in values} if values else set()
+                if (len(value_types) == 1) and (next(iter(value_types)) in ARRAY_TYPES):
+                    value_type = next(iter(value_types))
+                    try:
+                        self.arrays[(group, key)] = (np.array(values, dtype=ARRAY_TYPES[value_type]), value_type)
+                        continue
+                    except OverflowError:
+                        pass
+                for i, state in enumerate(states):
+                    if key in state:
+                        other_values[group][i][key] = state[key]
+        model_values = {
+            "disruption_list": model.disruption_list,
+            "reconstruction_market": model.reconstruction_market,
+            "loss_tracker_state": self.get_loss_tracker_state(model.loss_tracker)
+        }
+        self.blob = self.dumps((other_values, model_values))
+        logging.info(f"Snapshot taken: {len(self.arrays)} arrays and {len(self.blob) / 1e6:.1f} MB of other values")
+
+    @staticmethod
+    def get_groups(model: "Model") -> dict:
+        """Objects of each group, the keys to capture (all attributes if None) and how to set them"""
+        sc_network = model.sc_network
+        sc_edges = [sc_network[supplier][sc_network.index_to_agent[buyer]]
+                    for supplier, buyer in zip(sc_network.in_agents, sc_network.in_buyer_indices())]
+        transport_network = model.transport_network
+        return {
+            "agents": (sc_network.index_to_agent, None, set_attribute),
+            "commercial_links": (sc_network.in_commercial_links, None, set_attribute),
+            "sc_edges": (sc_edges, ['weight'], set_item),
+            "transport_edges": ([transport_network[u][v] for u, v in transport_network.edges],
+                                TRANSPORT_EDGE_KEYS, set_item),
+            "transport_nodes": ([transport_network.nodes[node] for node in transport_network.nodes],
+                                TRANSPORT_NODE_KEYS, set_item)
+        }
+
+    @staticmethod
+    def get_shared_objects(model: "Model") -> list:
+        return list(model.sc_network.index_to_agent) + [model.sc_network, model.transport_network,
+                                                        model.firms, model.households, model.countries]
+
+    @staticmethod
+    def get_state(obj, keys: list | None) -> dict:
+        if keys is None:
+            state = get_attributes(obj)
+            state.pop('loss_tracker', None)  # restored with the model
+            return state
+        return {key: obj[key] for key in keys if key in obj}
+
+    @staticmethod
+    def get_loss_tracker_state(loss_tracker) -> tuple | None:
+        if loss_tracker is None:
+            return None
+        return (dict(loss_tracker.extra_spending), dict(loss_tracker.consumption_loss),
+                set(loss_tracker.deviating_agents))
+
+    def dumps(self, values) -> bytes:
+        file = io.BytesIO()
+        SharedObjectPickler(file, self.shared_objects).dump(values)
+        return file.getvalue()
+
+    def loads(self):
+        return SharedObjectUnpickler(io.BytesIO(self.blob), self.shared_objects).load()
+
+    def restore(self, model: "Model"):
+        other_values, model_values = self.loads()
+        for (group, key), (array, value_type) in self.arrays.items():
+            objects, _, setter = self.groups[group]
+            values = array.tolist() if value_type in (bool, int, float) else list(array)
+            for obj, value in zip(objects, values):
+                setter(obj, key, value)
+        for group, (objects, _, setter) in self.groups.items():
+            for obj, state in zip(objects, other_values[group]):
+                for key, value in state.items():
+                    setter(obj, key, value)
+
+        model.disruption_list = model_values["disruption_list"]
+        model.reconstruction_market = model_values["reconstruction_market"]
+        model.scheduler = None
+        model.loss_tracker = self.loss_tracker
+        if model.loss_tracker:
+            extra_spending, consumption_loss, deviating_agents = model_values["loss_tracker_state"]
+            model.loss_tracker.extra_spending = extra_spending
+            model.loss_tracker.consumption_loss = consumption_loss
+            model.loss_tracker.deviating_agents = deviating_agents
+        for agent in model.households.values():
+            agent.loss_tracker = model.loss_tracker
+        for agent in model.countries.values():
+            agent.loss_tracker = model.loss_tracker
@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import multiprocessing
+from typing import TYPE_CHECKING
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from src.agents.agent import Agent
+    from src.agents.country import Countries
+    from src.agents.firm import Firms
+    from src.agents.household import Households
+    from src.network.sc_network import ScNetwork
+
+
+# Selection inherited by the forked workers
+_selection = None
+
+
+def agent_rng(seed: int, agent: "Agent") -> np.random.Generator:
+    """Random generator of the agent, derived from the master seed and the identity of the agent only"""
+    agent_key = int.from_bytes(hashlib.sha1(f"{agent.agent_type}:{agent.pid}".encode()).digest()[:8], "little")
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(agent_key,)))
+
+
+def choose_suppliers_in_forked_worker(buyer_keys: list) -> list:
+    return [_selection.choose_suppliers(*buyer_key) for buyer_key in buyer_keys]
+
+
+class SupplierSelection:
+    """Draw the suppliers of households, countries and firms, possibly in parallel, and create the commercial links
+
+    Without seed, buyers draw from the global random state, one after the other, as in the sequential model.
+    With a seed, each buyer draws from its own generator, derived from the seed and its identity,
+    so that buyers can be split among worker processes, each forked with the agents.
+    The drawn suppliers are then linked, in the main process and in the order of the buyers, which makes
+    the supply chain network identical whatever the number of workers.
+    """
+
+    def __init__(self, firms: "Firms", households: "Households", countries: "Countries",
+                 sector_table: pd.DataFrame, transport_nodes: gpd.GeoDataFrame,
+                 nb_suppliers_per_input: float, force_local_retailer: bool, weight_localization_household: float,
+                 weight_localization_firm: float, firm_data_type: str, import_code: str,
+                 seed: int | None = None, nb_workers: int = 1):
+        self.agents = {"household": households, "country": countries, "firm": firms}
+        self.firms = firms
+        self.households = households
+        self.countries = countries
+        self.sector_table = sector_table
+        self.transport_nodes = transport_nodes
+        self.nb_suppliers_per_input = nb_suppliers_per_input
+        self.force_local_retailer = force_local_retailer
+        self.weight_localization_household = weight_localization_household
+        self.weight_localization_firm = weight_localization_firm
+        self.firm_data_type = firm_data_type
+        self.import_code = import_code
+        self.seed = seed
+        self.nb_workers = nb_workers
+
+    def choose_suppliers(self, agent_type: str, pid) -> list:
+        agent = self.agents[agent_type][pid]
+        rng = None if self.seed is None else agent_rng(self.seed, agent)
+        if agent_type == "household":
+            return agent.choose_suppliers(self.firms, self.countries, self.nb_suppliers_per_input,
+                                          self.force_local_retailer, self.weight_localization_household,
+                                          self.firm_data_type, rng)
+        if agent_type == "country":
+            return agent.choose_suppliers(self.firms, self.sector_table, self.transport_nodes, rng)
+        return agent.choose_suppliers(self.firms, self.countries, self.nb_suppliers_per_input,
+                                      self.weight_localization_firm, self.firm_data_type, self.import_code, rng)
+
+    def choose_all_suppliers(self, buyer_keys: list) -> list:
+        global _selection
+        if (self.seed is None) or (self.nb_workers <= 1):
+            return [self.choose_suppliers(*buyer_key) for buyer_key in buyer_keys]
+        if "fork" not in multiprocessing.get_all_start_methods():
+            logging.warning("Processes cannot be forked on this platform, suppliers are selected sequentially")
+            return [self.choose_suppliers(*buyer_key) for buyer_key in buyer_keys]
+        chunk_size = max(1, -(-len(buyer_keys) // (4 * self.nb_workers)))
+        chunks = [buyer_keys[i:i + chunk_size] for i in range(0, len(buyer_keys), chunk_size)]
+        _selection = self
+        try:
+            with multiprocessing.get_context("fork").Pool(self.nb_workers) as pool:
+                chosen_suppliers_per_chunk = pool.map(choose_suppliers_in_forked_worker, chunks, chunksize=1)
+        finally:
+            _selection = None
+        return [chosen_suppliers for chunk in chosen_suppliers_per_chunk for chosen_suppliers in chunk]
+
+    def select_suppliers(self, graph: "ScNetwork", agent_types: tuple = ("household", "country", "firm")):
+        """The buyers of the given types select their suppliers, by type, in the order of the types"""
+        buyer_keys = [(agent_type, pid) for agent_type in agent_types for pid in self.agents[agent_type].keys()]
+        logging.info(f"Drawing the suppliers of {len(buyer_keys)} buyers with {self.nb_workers} worker(s)")
+        for (agent_type, pid), chosen_suppliers in zip(buyer_keys, self.choose_all_suppliers(buyer_keys)):
+            self.agents[agent_type][pid].link_suppliers(graph, self.firms, self.countries, chosen_suppliers)
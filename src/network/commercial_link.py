@@ -1,10 +1,13 @@
 import pandas as pd
 
+from src.model.basic_functions import CompactStateMixin
 from src.network.route import Route
 from src.parameters import EPSILON
 
 
-class CommercialLink(object):
+class CommercialLinkBase(object):
+    """Methods of CommercialLink and CompactCommercialLink, which store their attributes in a __dict__ and in slots respectively"""
+    __slots__ = ()
 
     def __init__(self, pid=None, supplier_id=None, buyer_id=None, product=None,
                  product_type=None, category=None, order=0, delivery=0, payment=0, essential=True,
@@ -87,3 +90,18 @@ class CommercialLink(object):
 
         else:
             raise ValueError("'main_or_alternative' is not in ['main', 'alternative']")
+
+
+class CommercialLink(CommercialLinkBase):
+    """Commercial link, with its attributes in a per-instance __dict__"""
+
+
+class CompactCommercialLink(CompactStateMixin, CommercialLinkBase):
+    """Slotted variant of CommercialLink, without per-instance __dict__"""
+    __slots__ = (
+        'pid', 'product', 'product_type', 'category', 'route', 'route_length', 'route_time_cost',
+        'route_cost_per_ton', 'supplier_id', 'buyer_id', 'eq_price', 'possible_transport_modes', 'essential',
+        'current_route', 'order', 'delivery', 'delivery_in_tons', 'realized_delivery', 'payment',
+        'alternative_route', 'alternative_route_length', 'alternative_route_time_cost',
+        'alternative_route_cost_per_ton', 'price', 'fulfilment_rate'
+    )
@@ -0,0 +1,45 @@
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+if TYPE_CHECKING:
+    from src.network.sc_network import ScNetwork
+
+
+class LeontiefSystem:
+    """Sparse LU factorization of I - A, where A is the firm connectivity matrix of a supply chain network
+
+    Once factorized, the system (I - A) X = D is solved by back-substitution, for one or many right-hand sides,
+    e.g., several final demand vectors. Factorizations are cached, in memory, by the cache key of the supply
+    chain network, so that runs and scenarios sharing the same network only factorize it once.
+    """
+    cache = OrderedDict()
+    cache_size = 4
+
+    def __init__(self, firm_connectivity_matrix: sparse.spmatrix):
+        self.size = firm_connectivity_matrix.shape[0]
+        self.lu = splu(sparse.identity(self.size, format="csc") - sparse.csc_matrix(firm_connectivity_matrix))
+
+    @classmethod
+    def from_sc_network(cls, sc_network: "ScNetwork") -> "LeontiefSystem":
+        key = sc_network.cache_key()
+        if key in cls.cache:
+            cls.cache.move_to_end(key)
+        else:
+            logging.info("Factorizing the input-output system of the supply chain network")
+            cls.cache[key] = cls(sc_network.sparse_firm_connectivity_matrix())
+            if len(cls.cache) > cls.cache_size:
+                cls.cache.popitem(last=False)
+        return cls.cache[key]
+
+    def solve(self, right_hand_sides: np.ndarray) -> np.ndarray:
+        """Solve (I - A) X = D, D being a vector or a matrix with one right-hand side per column"""
+        return self.lu.solve(np.asarray(right_hand_sides, dtype=float))
+
+    def solve_transposed(self, right_hand_sides: np.ndarray) -> np.ndarray:
+        """Solve (I - A)^T X = D, e.g., to get the backward output multipliers, with D a vector of ones"""
+        return self.lu.solve(np.asarray(right_hand_sides, dtype=float), trans='T')
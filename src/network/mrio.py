@@ -1,15 +1,44 @@
+import hashlib
 import logging
+import os
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
+from scipy import sparse
+
+from src.paths import TMP_FOLDER
 
 final_demand_label = "final_demand"
 export_label = "Exports"
 import_label = "Imports"
 EPSILON = 1e-6
+# Number of columns normalized at once when building the sparse technical coefficients
+BLOCK_SIZE = 1024
+
+
+# Hashes of the files already read, by path, modification time and size
+file_hashes = {}
+
+
+def get_file_hash(filepath: Path | str) -> str:
+    """SHA1 of the file, read again only if its path, modification time or size changed since it was last hashed"""
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    if key not in file_hashes:
+        file_hash = hashlib.sha1()
+        with open(filepath, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                file_hash.update(chunk)
+        file_hashes[key] = file_hash.hexdigest()
+    return file_hashes[key]
+
 
 class Mrio(pd.DataFrame):
     _metadata = ['region_sectors', "region_sector_names", "regions", "sectors", "external_buying_countries",
                  "external_selling_countries", "region_households"]
+    # Mrio of the current run, by hash of its file
+    loaded = {}
 
     def __init__(self, *args, **kwargs):
         super(Mrio, self).__init__(*args, **kwargs)
@@ -25,6 +54,25 @@ class Mrio(pd.DataFrame):
 
     @classmethod
     def load_mrio_from_filepath(cls, filepath_mrio):
+        """Load the mrio, parsing the file only if it was not loaded before
+
+        The builders of firms, households and countries all load the mrio: they share the same instance,
+        which should not be modified. Across runs, the cleaned table is cached in the tmp folder, in binary form,
+        under the hash of the file, so that the csv is parsed again only when the file changes.
+        """
+        file_hash = get_file_hash(filepath_mrio)
+        if file_hash not in cls.loaded:
+            table = cls.load_cached_table(file_hash)
+            if table is None:
+                table = cls.read_table(filepath_mrio)
+                cls.cache_table(table, file_hash)
+            cls.loaded.clear()  # only keep the mrio of the current run
+            cls.loaded[file_hash] = cls(table)
+        return cls.loaded[file_hash]
+
+    @staticmethod
+    def read_table(filepath_mrio) -> pd.DataFrame:
+        logging.info(f"Parsing mrio file {filepath_mrio}")
         table = pd.read_csv(filepath_mrio, header=[0, 1], index_col=[0, 1])
         # remove region_sectors with no flows
         zero_output = table.index[table.sum(axis=1) == 0].to_list()
@@ -32,7 +80,49 @@ class Mrio(pd.DataFrame):
         no_flow_region_sectors = list(set(zero_output) & set(zero_input))
         table.drop(index=no_flow_region_sectors, inplace=True)
         table.drop(columns=no_flow_region_sectors, inplace=True)
-        return cls(table)
+        return table
+
+    @staticmethod
+    def get_cache_filepath(file_hash: str) -> Path:
+        return TMP_FOLDER / f"mrio_{file_hash}.npz"
+
+    @classmethod
+    def cache_table(cls, table: pd.DataFrame, file_hash: str):
+        """Save the values, the column dtypes and the index and column labels, level by level, in a npz file"""
+        labels = {}
+        for axis, index in [("index", table.index), ("columns", table.columns)]:
+            for level in range(index.nlevels):
+                labels[f"{axis}_{level}"] = np.array(index.get_level_values(level).tolist())
+        filepath = cls.get_cache_filepath(file_hash)
+        tmp_filepath = filepath.with_suffix('.tmp.npz')
+        try:
+            np.savez(tmp_filepath, values=table.to_numpy(dtype=float),
+                     dtypes=np.array(table.dtypes.astype(str).tolist()), file_hash=np.array(file_hash), **labels)
+            os.replace(tmp_filepath, filepath)
+            logging.info(f"Mrio saved in tmp folder: {filepath}")
+        except OSError as error:
+            logging.warning(f"Mrio could not be cached: {error}")
+
+    @classmethod
+    def load_cached_table(cls, file_hash: str) -> pd.DataFrame | None:
+        filepath = cls.get_cache_filepath(file_hash)
+        if not filepath.exists():
+            return None
+        try:
+            with np.load(filepath) as data:
+                index = pd.MultiIndex.from_arrays([data["index_0"], data["index_1"]])
+                columns = pd.MultiIndex.from_arrays([data["columns_0"], data["columns_1"]])
+                values = data["values"]
+                dtypes = data["dtypes"].tolist()
+                if (str(data["file_hash"]) != file_hash) or (values.shape != (len(index), len(columns))) \
+                        or (len(dtypes) != len(columns)):
+                    raise ValueError("inconsistent content")
+        except (OSError, KeyError, ValueError) as error:
+            logging.warning(f"Cached mrio {filepath} is invalid, the file is parsed again: {error}")
+            return None
+        logging.info(f"Mrio loaded from tmp folder: {filepath}")
+        table = pd.DataFrame(values, index=index, columns=columns)
+        return table.astype({column: dtype for column, dtype in zip(columns, dtypes)})
 
     def get_total_output_per_region_sectors(self):
         return self.loc[self.region_sectors].sum(axis=1)
@@ -41,11 +131,11 @@ class Mrio(pd.DataFrame):
         return self[self.region_sectors].sum()
 
     def get_region_sectors_with_internal_flows(self, threshold: float = 0):
-        tot_outputs = self.get_total_output_per_region_sectors()
-        matrix_output = pd.concat([tot_outputs] * len(self.index), axis=1).transpose()
-        matrix_output.index = self.index
-        tech_coef_matrix = self[self.region_sectors] / matrix_output
-        return [tup for tup in self.region_sectors if tech_coef_matrix.loc[tup, tup] > threshold]
+        tot_outputs = self.get_total_output_per_region_sectors().to_numpy()
+        internal_flows = self.to_numpy()[self.index.get_indexer(self.region_sectors),
+                                         self.columns.get_indexer(self.region_sectors)]
+        internal_tech_coefs = internal_flows / tot_outputs
+        return [tup for tup, tech_coef in zip(self.region_sectors, internal_tech_coefs) if tech_coef > threshold]
 
     def check_square_structure(self):
         region_sectors_in_columns = [tup for tup in self.columns if tup[1] not in [final_demand_label, export_label]]
@@ -65,19 +155,44 @@ class Mrio(pd.DataFrame):
             for region_sector in unbalanced_region_sectors:
                 self.loc[region_sector, ('ROW', export_label)] += total_input[region_sector] - total_output[region_sector] + EPSILON
 
+    def get_sparse_tech_coefs(self, threshold: float = 0, block_size: int = BLOCK_SIZE) -> sparse.csc_matrix:
+        """
+        returns the technical coefficients above the threshold, as a sparse matrix, inputs (rows of the mrio) x
+        region_sectors
+
+        Columns are normalized by the total output of their region_sector by blocks, and only the nonzero flows are
+        divided, so that neither the dense coefficient matrix nor a dense divisor matrix is built.
+        The threshold should be positive or null.
+        """
+        tot_outputs = self.get_total_output_per_region_sectors().to_numpy()
+        column_positions = self.columns.get_indexer(self.region_sectors)
+        rows, columns, values = [], [], []
+        for start in range(0, len(self.region_sectors), block_size):
+            flows = self.iloc[:, column_positions[start:start + block_size]].to_numpy(dtype=float)
+            block_columns, block_rows = np.nonzero(flows.T)  # column-major, to get sorted rows within each column
+            tech_coefs = flows[block_rows, block_columns] / tot_outputs[start + block_columns]
+            kept = tech_coefs > threshold
+            rows.append(block_rows[kept])
+            columns.append(start + block_columns[kept])
+            values.append(tech_coefs[kept])
+        rows, columns, values = [np.concatenate(arrays) if arrays else np.array([], dtype=dtype)
+                                 for arrays, dtype in [(rows, int), (columns, int), (values, float)]]
+        indptr = np.searchsorted(columns, np.arange(len(self.region_sectors) + 1))
+        return sparse.csc_matrix((values, rows, indptr), shape=(len(self.index), len(self.region_sectors)))
+
     def get_tech_coef_dict(self, threshold=0):
         """
         returns a dict region_sector = {input_region_sector_1: tech_coef, ...}
         """
-        tot_outputs = self.get_total_output_per_region_sectors()
-        matrix_output = pd.concat([tot_outputs] * len(self.index), axis=1).transpose()
-        matrix_output.index = self.index
-        tech_coef_matrix = self[self.region_sectors] / matrix_output
+        tech_coefs = self.get_sparse_tech_coefs(threshold)
+        input_names = ['_'.join(tup) for tup in self.index]
+        input_positions = tech_coefs.indices.tolist()
+        values = tech_coefs.data.tolist()
+        indptr = tech_coefs.indptr.tolist()
         return {
-            '_'.join(region_sector_tuple): {
-                '_'.join(key): val
-                for key, val in sublist.items()
-                if val > threshold
+            region_sector_name: {
+                input_names[i]: value
+                for i, value in zip(input_positions[indptr[j]:indptr[j + 1]], values[indptr[j]:indptr[j + 1]])
             }
-            for region_sector_tuple, sublist in tech_coef_matrix.to_dict().items()
+            for j, region_sector_name in enumerate(self.region_sector_names)
         }
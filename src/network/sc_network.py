@@ -1,13 +1,111 @@
+import hashlib
 import logging
+from typing import TYPE_CHECKING
 
 import networkx as nx
+import numpy as np
 import pandas as pd
+from scipy import sparse
 
-from src.agents.firm import Firm
+from src.agents.firm import FirmBase
 from src.model.basic_functions import add_or_append_to_dict
 
+if TYPE_CHECKING:
+    from src.agents.agent import Agent
+    from src.agents.firm import Firms
+    from src.agents.household import Households
+    from src.agents.country import Countries
+
 
 class ScNetwork(nx.DiGraph):
+    agent_types = ("firm", "household", "country")
+
+    def build_node_index(self, firms: "Firms", households: "Households", countries: "Countries"):
+        """Assign a dense integer index to every agent and precompute the in/out adjacency in CSR form
+
+        Firms come first, in the order of `firms`, then households, then countries. `index_offsets` gives
+        the first index of each agent type, so that the firms occupy [0, len(firms)).
+        For each agent, the suppliers (resp. clients) are stored in
+        `in_indices[in_indptr[i]:in_indptr[i + 1]]` (resp. out_), in the same order as `in_edges` (resp. `out_edges`),
+        with the weight and the commercial link of each edge aligned on them.
+        The index needs to be rebuilt if edges are added or removed.
+        """
+        self.index_offsets = {}
+        self.index_to_agent = []
+        self.node_index = {}
+        for agent_type, agents in zip(self.agent_types, [firms, households, countries]):
+            self.index_offsets[agent_type] = len(self.index_to_agent)
+            for agent in agents.values():
+                self.node_index[(agent.agent_type, agent.pid)] = len(self.index_to_agent)
+                self.index_to_agent.append(agent)
+        self.index_offsets["end"] = len(self.index_to_agent)
+
+        self.in_indptr, self.in_indices, self.in_weights, self.in_agents, self.in_commercial_links = \
+            self._build_csr(self._pred)
+        self.out_indptr, self.out_indices, self.out_weights, self.out_agents, self.out_commercial_links = \
+            self._build_csr(self._succ)
+        logging.info(f"Node index built for {len(self.index_to_agent)} agents "
+                     f"and {len(self.in_commercial_links)} commercial links")
+
+    def _build_csr(self, adjacency: dict):
+        indptr = np.zeros(len(self.index_to_agent) + 1, dtype=np.int64)
+        neighbor_agents = []
+        links = []
+        weights = []
+        for i, agent in enumerate(self.index_to_agent):
+            for neighbor, data in adjacency.get(agent, {}).items():
+                neighbor_agents.append(neighbor)
+                links.append(data['object'])
+                weights.append(data.get('weight', 1))
+            indptr[i + 1] = len(links)
+        indices = np.array([self.index_of(neighbor) for neighbor in neighbor_agents], dtype=np.int64)
+        return indptr, indices, np.array(weights, dtype=float), neighbor_agents, links
+
+    def in_buyer_indices(self) -> np.ndarray:
+        """Index of the buyer of each commercial link, aligned on in_indices"""
+        return np.repeat(np.arange(len(self.index_to_agent)), np.diff(self.in_indptr))
+
+    def index_of(self, agent: "Agent") -> int:
+        return self.node_index[(agent.agent_type, agent.pid)]
+
+    def type_slice(self, agent_type: str) -> slice:
+        next_agent_type = {"firm": "household", "household": "country", "country": "end"}[agent_type]
+        return slice(self.index_offsets[agent_type], self.index_offsets[next_agent_type])
+
+    def in_links(self, agent: "Agent"):
+        """Iterate over the (supplier, commercial_link) pairs of the agent, using the CSR index"""
+        i = self.index_of(agent)
+        start, end = self.in_indptr[i], self.in_indptr[i + 1]
+        return zip(self.in_agents[start:end], self.in_commercial_links[start:end])
+
+    def out_links(self, agent: "Agent"):
+        """Iterate over the (client, commercial_link) pairs of the agent, using the CSR index"""
+        i = self.index_of(agent)
+        start, end = self.out_indptr[i], self.out_indptr[i + 1]
+        return zip(self.out_agents[start:end], self.out_commercial_links[start:end])
+
+    def firm_connectivity_matrix(self) -> np.ndarray:
+        """Dense firm x firm matrix of edge weights, rows are suppliers, columns are buyers"""
+        return self.sparse_firm_connectivity_matrix().toarray()
+
+    def sparse_firm_connectivity_matrix(self) -> sparse.csc_matrix:
+        """Sparse firm x firm matrix of edge weights, rows are suppliers, columns are buyers"""
+        firm_slice = self.type_slice("firm")
+        n = firm_slice.stop - firm_slice.start
+        buyers = self.in_buyer_indices()
+        is_firm_to_firm = (buyers < n) & (self.in_indices >= firm_slice.start) & (self.in_indices < firm_slice.stop)
+        return sparse.csc_matrix((self.in_weights[is_firm_to_firm],
+                                  (self.in_indices[is_firm_to_firm], buyers[is_firm_to_firm])), shape=(n, n))
+
+    def cache_key(self) -> str:
+        """Key identifying the firm connectivity matrix, to cache the computations that only depend on it"""
+        matrix = self.sparse_firm_connectivity_matrix()
+        matrix.sum_duplicates()
+        matrix.sort_indices()
+        key = hashlib.sha1(np.array(matrix.shape, dtype=np.int64).tobytes())
+        for array in [matrix.indptr, matrix.indices, matrix.data]:
+            key.update(np.ascontiguousarray(array).tobytes())
+        return key.hexdigest()
 
     def access_commercial_link(self, edge):
         return self[edge[0]][edge[1]]['object']
@@ -44,7 +142,7 @@ class ScNetwork(nx.DiGraph):
         return edge_list
 
     def identify_firms_without_clients(self):
-        return [node for node in self.nodes() if (self.out_degree(node) == 0) and isinstance(node, Firm)]
+        return [node for node in self.nodes() if (self.out_degree(node) == 0) and isinstance(node, FirmBase)]
 
     def remove_useless_commercial_links(self):
         firms_without_clients = self.identify_firms_without_clients()
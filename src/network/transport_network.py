@@ -14,6 +14,10 @@ if TYPE_CHECKING:
 
 
 class TransportNetwork(nx.Graph):
+    def __init__(self, incoming_graph_data=None, **attr):
+        # Index of the edges by id, edge id -> (u, v), filled as edges are added by add_transport_edge_with_nodes
+        self.edge_index = {}
+        super().__init__(incoming_graph_data, **attr)
 
     def add_transport_node(self, node_id, all_nodes_data):  # used in add_transport_edge_with_nodes
         node_attributes = ["id", "geometry", "special", "name"]
@@ -64,6 +68,30 @@ class TransportNetwork(nx.Graph):
         self[end_ids[0]][end_ids[1]]['current_load'] = 0
         self[end_ids[0]][end_ids[1]]['overused'] = False
         self[end_ids[0]][end_ids[1]]['current_capacity'] = self[end_ids[0]][end_ids[1]]['capacity']
+        self.edge_index[edge_data['id']] = (end_ids[0], end_ids[1])
+
+    def index_edges(self):
+        self.edge_index = {data['id']: (u, v) for u, v, data in self.edges(data=True)}
+
+    def get_edge_by_id(self, edge_id) -> tuple | None:
+        """The (u, v) tuple of the edge with this id, or None if there is no such edge in the network"""
+        return self.get_edges_by_id([edge_id])[edge_id]
+
+    def get_edges_by_id(self, edge_ids) -> dict:
+        """The (u, v) tuple of the edge of each id, or None if there is no such edge in the network
+
+        If some ids are not found in the index, the index is rebuilt once for all of them, since it may be outdated,
+        e.g., for a network loaded from an older cache or derived from another network.
+        """
+        edge_index = getattr(self, 'edge_index', {})
+        edges = {edge_id: edge_index.get(edge_id) for edge_id in edge_ids}
+        if not all(self.is_indexed_edge(edge, edge_id) for edge_id, edge in edges.items()):
+            self.index_edges()
+            edges = {edge_id: self.edge_index.get(edge_id) for edge_id in edge_ids}
+        return {edge_id: edge if self.is_indexed_edge(edge, edge_id) else None for edge_id, edge in edges.items()}
+
+    def is_indexed_edge(self, edge: tuple | None, edge_id) -> bool:
+        return (edge is not None) and self.has_edge(*edge) and (self[edge[0]][edge[1]]['id'] == edge_id)
 
     def define_weights(self, route_optimization_weight):
         logging.debug('Transport network: defining weights that will be used for shortest-path algorithm')
@@ -75,19 +103,21 @@ class TransportNetwork(nx.Graph):
         """The nodes of the transport network stores the list of firms located there
         using the attribute "firms_there".
         There can be several firms in one node.
-        "transport_nodes" is a geodataframe of the nodes. It also contains this list in the columns
-        "firm_there" as a comma-separated string
+        "transport_nodes" is a geodataframe of the nodes. It also contains this list in the column
+        "firms_there", as a list of firm pids
 
         This function reinitialize those fields and repopulate them with the adequate information
         """
-        # Reinitialize
-        transport_nodes['firms_there'] = ""
+        # Group the firms by node, in one pass
+        firms_there = {}
+        for pid, firm in firms.items():
+            firms_there.setdefault(firm.od_point, []).append(pid)
+        # Reinitialize and locate firms
         for node_id in self.nodes:
             self._node[node_id]['firms_there'] = []
-        # Locate firms
-        for firm in firms.values():
-            self._node[firm.od_point]['firms_there'].append(firm.pid)
-            transport_nodes.loc[transport_nodes['id'] == firm.od_point, "firms_there"] += (',' + str(firm.pid))
+        for node_id, pids in firms_there.items():
+            self._node[node_id]['firms_there'] = list(pids)
+        transport_nodes['firms_there'] = [list(firms_there.get(node_id, [])) for node_id in transport_nodes['id']]
 
     def locate_households_on_nodes(self, households, transport_nodes):
         """The nodes of the transport network stores the list of households located there
@@ -97,11 +127,10 @@ class TransportNetwork(nx.Graph):
 
         This function reinitialize those fields and repopulate them with the adequate information
         """
-        # Reinitialize
-        transport_nodes['household_there'] = None
-        for pid, household in households.items():
-            self._node[household.od_point]['household_there'] = pid
-            transport_nodes.loc[transport_nodes['id'] == household.od_point, "household_there"] = pid
+        household_there = {household.od_point: pid for pid, household in households.items()}
+        for node_id, pid in household_there.items():
+            self._node[node_id]['household_there'] = pid
+        transport_nodes['household_there'] = [household_there.get(node_id) for node_id in transport_nodes['id']]
 
     def provide_shortest_route(self, origin_node: int, destination_node: int,
                                route_weight: str, noise_level: float = 0.0) -> Route or None:
@@ -149,31 +178,34 @@ class TransportNetwork(nx.Graph):
                          ' gets disrupted for ' + str(disruption['duration']) + ' time steps')
             self._node[node_id]['disruption_duration'] = disruption['duration']
         # Disrupting edges
-        for edge in self.edges:
-            if self[edge[0]][edge[1]]['type'] == 'virtual':
+        for edge_id, edge in self.get_edges_by_id(set(disruption['edge'])).items():
+            if (edge is None) or (self[edge[0]][edge[1]]['type'] == 'virtual'):
                 continue
-            else:
-                if self[edge[0]][edge[1]]['id'] in disruption['edge']:
-                    logging.info('Road edge ' + str(self[edge[0]][edge[1]]['id']) +
-                                 ' gets disrupted for ' + str(disruption['duration']) + ' time steps')
-                    self[edge[0]][edge[1]]['disruption_duration'] = disruption['duration']
+            logging.info('Road edge ' + str(edge_id) +
+                         ' gets disrupted for ' + str(disruption['duration']) + ' time steps')
+            self[edge[0]][edge[1]]['disruption_duration'] = disruption['duration']
 
     def disrupt_one_edge(self, edge, capacity_reduction: float, duration: int):
         logging.info(f"Road edge {self[edge[0]][edge[1]]['id']} gets disrupted for {duration} time steps, "
                      f"capacity reduction is {capacity_reduction}")
         self[edge[0]][edge[1]]['disruption_duration'] = capacity_reduction
 
-    def update_road_disruption_state(self):
+    def update_road_disruption_state(self) -> list:
         """
         One time step is gone
         The remaining duration of disruption is decreased by 1
+        Returns the ids of the edges whose disruption ends now
         """
         for node in self.nodes:
             if self._node[node]['disruption_duration'] > 0:
                 self._node[node]['disruption_duration'] -= 1
+        recovered_edge_ids = []
         for edge in self.edges:
             if self[edge[0]][edge[1]]['disruption_duration'] > 0:
                 self[edge[0]][edge[1]]['disruption_duration'] -= 1
+                if self[edge[0]][edge[1]]['disruption_duration'] == 0:
+                    recovered_edge_ids.append(self[edge[0]][edge[1]]['id'])
+        return recovered_edge_ids
 
     def transport_shipment(self, commercial_link: "CommercialLink", capacity_constraint: bool):
         # Select the route to transport the shipment: main or alternative
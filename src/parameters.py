@@ -73,6 +73,23 @@ class Parameters:
     adaptive_supplier_weight: bool
     transport_cost_data: dict
     capital_to_value_added_ratio: float
+    compact_agents: bool
+    active_set_scheduling: bool
+    quiescence_window: int
+    diagnostics_frequency: str | int
+    agent_data_storage: str
+    agent_data_recording_frequency: int
+    transport_flow_export: str
+    transport_flow_time_steps: list | str
+    asynchronous_export: bool
+    ensemble_nb_workers: int
+    ensemble_seed: int
+    criticality_ranking: str
+    criticality_disruption_duration: int
+    criticality_file: Path | str | None
+    supplier_selection_seed: int | None
+    supplier_selection_nb_workers: int
+    build_agent_table: bool
     export_folder: Path | str = ""
 
     @classmethod
@@ -112,6 +129,10 @@ class Parameters:
         # Cast datatype
         parameters.epsilon_stop_condition = float(parameters.epsilon_stop_condition)
         parameters.duration_dic = {int(key): val for key, val in parameters.duration_dic.items()}
+        if parameters.nodeedge_tested_topn == "None":
+            parameters.nodeedge_tested_topn = None
+        if parameters.nodeedge_tested_skipn == "None":
+            parameters.nodeedge_tested_skipn = None
 
         return parameters
 
@@ -130,6 +151,11 @@ class Parameters:
                 self.filepaths[key] = None
             else:
                 self.filepaths[key] = self.get_full_filepath(val)
+        self.set_events(self.events)
+
+    def set_events(self, events: list | None):
+        """Replace the events, converting their filepaths, relative to the input folder of the scope"""
+        self.events = events
         if self.events:
             for event in self.events:
                 for key, item in event.items():
@@ -0,0 +1,47 @@
+# Run an ensemble of disruption scenarios against the same baseline model
+# Usage: python run_ensemble.py scope scenario_file
+# The scenario file is a yaml list of scenarios, each with a "name", "events" formatted as the events parameter,
+# and optionally a "seed"
+import logging
+import sys
+import time
+
+import yaml
+
+import paths
+from src.parameters import Parameters
+from src.model.model import Model
+from src.simulation.ensemble import EnsembleRunner
+
+# Start run
+t0 = time.time()
+
+if len(sys.argv) != 3:
+    raise ValueError('The script takes two arguments: the scope to be studied and the scenario file. '
+                     'Ex. python run_ensemble.py scope scenarios.yaml')
+scope = sys.argv[1]
+with open(sys.argv[2], 'r') as f:
+    scenarios = yaml.safe_load(f)
+
+# Import parameters
+parameters = Parameters.load_parameters(paths.PARAMETER_FOLDER, scope)
+parameters.create_export_folder()
+parameters.export()
+parameters.adjust_logging_behavior()
+logging.info(f'Ensemble of {len(scenarios)} scenarios starting for {scope}')
+logging.info(f'Output folder is {parameters.export_folder}')
+
+# Build the baseline
+model = Model(parameters)
+model.setup_transport_network(cached=False)
+model.setup_agents(cached=False)
+model.setup_sc_network(cached=False)
+model.set_initial_conditions()
+model.setup_logistic_routes(cached=False)
+
+# Run scenarios
+runner = EnsembleRunner(model, nb_workers=parameters.ensemble_nb_workers, seed=parameters.ensemble_seed)
+summary = runner.run(scenarios)
+summary.to_csv(parameters.export_folder / "ensemble_loss_summary.csv", index=False)
+
+logging.info(f"End of ensemble, which took {time.time() - t0:.1f} seconds")
@@ -0,0 +1,142 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from src.simulation.columnar_recorder import ColumnarRecorder, read_table
+
+if TYPE_CHECKING:
+    from src.agents.firm import Firms
+    from src.agents.household import Households
+    from src.agents.country import Countries
+
+
+# Columns of each table, with the type they are stored with. Ids keep the type of the agent pids,
+# except retailers, which can be firms or countries, and are stored as strings, as they are in the json outputs
+TABLES = {
+    "firm_data": {"time_step": int, "firm": None, "production": float, "profit": float, "transport_cost": float,
+                  "input_cost": float, "other_cost": float, "generalized_transport_cost": float,
+                  "usd_transported": float, "tons_transported": float, "tonkm_transported": float},
+    "firm_inventory_data": {"time_step": int, "firm": None, "input": str, "inventory_duration": float},
+    "country_data": {"time_step": int, "country": None, "generalized_transport_cost": float,
+                     "usd_transported": float, "tons_transported": float, "tonkm_transported": float,
+                     "extra_spending": float, "consumption_loss": float, "spending": float},
+    "household_data": {"time_step": int, "household": None, "extra_spending": float, "consumption_loss": float},
+    "household_retailer_data": {"time_step": int, "household": None, "retailer": str, "spending": float,
+                                "consumption": float},
+    "household_sector_data": {"time_step": int, "household": None, "sector": str, "extra_spending": float,
+                              "consumption_loss": float},
+}
+
+
+def flatten_dicts(time_step: int, agent_id, dicts: dict) -> dict:
+    """Long format of several dicts sharing (some of) their keys, missing values being NaN"""
+    keys = list(dict.fromkeys(key for values in dicts.values() for key in values.keys()))
+    columns = {"time_step": [time_step] * len(keys), "id": [agent_id] * len(keys), "key": keys}
+    for name, values in dicts.items():
+        columns[name] = [values.get(key, np.nan) for key in keys]
+    return columns
+
+
+def household_sector_losses(time_step: int, households: "Households") -> dict:
+    """Extra spending and consumption loss per household and sector, as the columns of a long table"""
+    columns = {column: [] for column in TABLES["household_sector_data"]}
+    for household in households.values():
+        for values, new_values in zip(columns.values(), flatten_dicts(time_step, household.pid, {
+            "extra_spending": household.extra_spending_per_sector,
+            "consumption_loss": household.consumption_loss_per_sector
+        }).values()):
+            values.extend(new_values)
+    return columns
+
+
+class AgentDataRecorder(ColumnarRecorder):
+    """Stream the agent data of a simulation to columnar files, as the simulation goes
+
+    The variables recorded are the same as those of `Model.store_agent_data`. Dict-valued variables, e.g.,
+    the spending per retailer of households, are stored in separate long tables.
+    The json outputs can be derived using `read_agent_data`.
+    """
+    tables = TABLES
+
+    def record(self, time_step: int, firms: "Firms", households: "Households", countries: "Countries",
+               household_losses: dict | None = None):
+        for firm in firms.values():
+            self.append("firm_data", [time_step, firm.pid, firm.production, firm.profit,
+                                      firm.finance['costs']['transport'], firm.finance['costs']['input'],
+                                      firm.finance['costs']['other'], firm.generalized_transport_cost,
+                                      firm.usd_transported, firm.tons_transported, firm.tonkm_transported])
+            self.extend("firm_inventory_data", flatten_dicts(time_step, firm.pid, {
+                "inventory_duration": firm.current_inventory_duration
+            }))
+        for country in countries.values():
+            self.append("country_data", [time_step, country.pid, country.generalized_transport_cost,
+                                         country.usd_transported, country.tons_transported,
+                                         country.tonkm_transported, country.extra_spending,
+                                         country.consumption_loss, sum(list(country.qty_purchased.values()))])
+        for household in households.values():
+            self.append("household_data", [time_step, household.pid, household.extra_spending,
+                                           household.consumption_loss])
+            self.extend("household_retailer_data", flatten_dicts(time_step, household.pid, {
+                "spending": household.spending_per_retailer,
+                "consumption": household.consumption_per_retailer
+            }))
+        self.extend("household_sector_data", household_losses or household_sector_losses(time_step, households))
+        self.flush_full_tables()
+
+
+def read_agent_table(folder: Path | str, table: str) -> pd.DataFrame:
+    """Load one of the tables written by an AgentDataRecorder, whatever its file format"""
+    return read_table(folder, table, list(TABLES[table]))
+
+
+def nest_long_table(long_table: pd.DataFrame, id_column: str, key_column: str, value_column: str,
+                    keep_missing: bool = False) -> dict:
+    """Back to one {key: value} dict per (time_step, agent)"""
+    if not keep_missing:
+        long_table = long_table.dropna(subset=[value_column])
+    values = long_table[value_column].astype(object).where(long_table[value_column].notna(), None)
+    nested = {}
+    for time_step, agent_id, key, value in zip(long_table["time_step"].tolist(), long_table[id_column].tolist(),
+                                               long_table[key_column].tolist(), values.tolist()):
+        nested.setdefault((time_step, agent_id), {})[key] = value
+    return nested
+
+
+def read_agent_data(folder: Path | str) -> dict:
+    """Rebuild the firm, country and household data as the lists of dicts stored by Simulation
+
+    Dict keys are strings, as in the json outputs.
+    """
+    firm_data = read_agent_table(folder, "firm_data").to_dict("records")
+    inventory_durations = nest_long_table(read_agent_table(folder, "firm_inventory_data"),
+                                          "firm", "input", "inventory_duration", keep_missing=True)
+    for row in firm_data:
+        inventory_duration = inventory_durations.get((row["time_step"], row["firm"]), {})
+        keys = list(row.keys())
+        row["inventory_duration"] = inventory_duration
+        for key in keys[keys.index("other_cost") + 1:]:
+            row[key] = row.pop(key)
+
+    household_data = read_agent_table(folder, "household_data").to_dict("records")
+    retailer_table = read_agent_table(folder, "household_retailer_data")
+    sector_table = read_agent_table(folder, "household_sector_data")
+    nested = {
+        "spending_per_retailer": nest_long_table(retailer_table, "household", "retailer", "spending"),
+        "consumption_per_retailer": nest_long_table(retailer_table, "household", "retailer", "consumption"),
+        "extra_spending_per_sector": nest_long_table(sector_table, "household", "sector", "extra_spending"),
+        "consumption_loss_per_sector": nest_long_table(sector_table, "household", "sector", "consumption_loss")
+    }
+    for i, row in enumerate(household_data):
+        household_data[i] = {"time_step": row["time_step"], "household": row["household"]}
+        household_data[i].update({variable: values.get((row["time_step"], row["household"]), {})
+                                  for variable, values in nested.items()})
+        household_data[i].update({"extra_spending": row["extra_spending"],
+                                  "consumption_loss": row["consumption_loss"]})
+
+    return {
+        "firm_data": firm_data,
+        "country_data": read_agent_table(folder, "country_data").to_dict("records"),
+        "household_data": household_data
+    }
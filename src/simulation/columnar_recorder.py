@@ -0,0 +1,103 @@
+import importlib
+import importlib.util
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.simulation.export_queue import ExportQueue
+
+
+class ColumnarRecorder:
+    """Stream tables to columnar files, as the simulation goes
+
+    Subclasses define `tables`, which maps each table name to its columns and the type they are stored with,
+    None meaning that the type of the values is kept.
+    Each table is buffered column by column, and written to the folder each time it holds `chunk_size` rows,
+    as a row group of `<table>.parquet` (requires pyarrow) or as a new `<table>_<chunk>.npz` file.
+    Memory use is thus bounded, whatever the number of time steps. Call `close` to write the remaining rows.
+    If an export queue is given, chunks are written by its writer thread.
+    """
+    file_formats = ["parquet", "npz"]
+    tables = {}
+
+    def __init__(self, folder: Path | str, file_format: str, chunk_size: int = 100000,
+                 export_queue: ExportQueue | None = None):
+        if file_format not in self.file_formats:
+            raise ValueError(f"Columnar file format should be one of {self.file_formats}, got {file_format}")
+        if file_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("pyarrow is required to record data as parquet, use npz instead")
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.buffers = {table: {column: [] for column in columns} for table, columns in self.tables.items()}
+        self.nb_chunks = {table: 0 for table in self.tables}
+        self.parquet_writers = {}
+        self.export_queue = export_queue or ExportQueue(asynchronous=False)
+
+    def append(self, table: str, row: list):
+        for values, value in zip(self.buffers[table].values(), row):
+            values.append(value)
+
+    def extend(self, table: str, columns: dict):
+        for values, new_values in zip(self.buffers[table].values(), columns.values()):
+            values.extend(new_values)
+
+    def flush_full_tables(self):
+        for table, buffer in self.buffers.items():
+            if len(next(iter(buffer.values()))) >= self.chunk_size:
+                self.flush(table)
+
+    def flush(self, table: str):
+        buffer = self.buffers[table]
+        if len(next(iter(buffer.values()))) == 0:
+            return
+        columns = {}
+        for column, column_type in self.tables[table].items():
+            if column_type is str:
+                columns[column] = np.array([str(value) for value in buffer[column]])
+            elif column_type is None:
+                columns[column] = np.array(buffer[column])
+            else:
+                columns[column] = np.array(buffer[column], dtype=column_type)
+        self.export_queue.submit(self.write_chunk, table, columns, self.nb_chunks[table])
+        self.nb_chunks[table] += 1
+        self.buffers[table] = {column: [] for column in self.tables[table]}
+
+    def write_chunk(self, table: str, columns: dict, chunk_number: int):
+        if self.file_format == "parquet":
+            pyarrow = importlib.import_module("pyarrow")
+            parquet = importlib.import_module("pyarrow.parquet")
+            chunk = pyarrow.table(columns)
+            if table not in self.parquet_writers:
+                self.parquet_writers[table] = parquet.ParquetWriter(self.folder / f"{table}.parquet", chunk.schema)
+            self.parquet_writers[table].write_table(chunk)
+        else:
+            np.savez(self.folder / f"{table}_{chunk_number:05d}.npz", **columns)
+
+    def close(self):
+        for table in self.tables:
+            self.flush(table)
+        self.export_queue.submit(self.close_writers)
+
+    def close_writers(self):
+        for writer in self.parquet_writers.values():
+            writer.close()
+        self.parquet_writers = {}
+        logging.info(f"Data recorded in {self.folder}")
+
+
+def read_table(folder: Path | str, table: str, columns: list | None = None) -> pd.DataFrame:
+    """Load one of the tables written by a ColumnarRecorder, whatever its file format"""
+    folder = Path(folder)
+    if (folder / f"{table}.parquet").exists():
+        return pd.read_parquet(folder / f"{table}.parquet")
+    chunks = []
+    for filepath in sorted(folder.glob(f"{table}_*.npz")):
+        with np.load(filepath) as chunk:
+            chunks.append(pd.DataFrame({column: chunk[column] for column in chunk.files}))
+    if len(chunks) == 0:
+        return pd.DataFrame({column: [] for column in columns or []})
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,85 @@
+import csv
+import logging
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pandas as pd
+
+from src.simulation.ensemble import EnsembleRunner
+from src.simulation.screening import LinearScreening
+
+if TYPE_CHECKING:
+    from src.model.model import Model
+
+
+class CriticalityAnalysis:
+    """Disrupt the transport edges one at a time and record the resulting losses
+
+    The edges are ranked by decreasing total flow at the initial state, as computed by
+    `TransportNetwork.compute_flow_per_segment` during the baseline time step, and the edges
+    ranked [skipn, topn) are tested, each in its own scenario run from the baseline of an EnsembleRunner.
+    With the "screening" ranking, edges are instead ranked by the score of the LinearScreening, so that only
+    the edges most likely to matter are simulated.
+    Each result is appended to the output file as soon as it is available. If the file already exists,
+    the edges already in it are not tested again, so that an interrupted analysis can be resumed.
+    """
+    columns = ["rank", "edge_id", "baseline_flow", "screening_score", "duration", "seed", "households", "countries"]
+    rankings = ["flow", "screening"]
+
+    def __init__(self, model: "Model", duration: int = 1, topn: int | None = None, skipn: int | None = None,
+                 nb_workers: int = 1, seed: int = 0, ranking: str = "flow"):
+        if ranking not in self.rankings:
+            raise ValueError(f"Criticality ranking should be one of {self.rankings}, got {ranking}")
+        self.duration = duration
+        self.topn = topn
+        self.skipn = skipn
+        self.seed = seed
+        self.runner = EnsembleRunner(model, nb_workers=nb_workers, seed=seed)
+        self.ranking = self.rank_edges(ranking)
+
+    def rank_edges(self, ranking: str) -> pd.DataFrame:
+        """Transport edges sorted by decreasing baseline flow, or screening score, ties broken by id"""
+        flows = pd.DataFrame([flows for flows in self.runner.baseline_simulation.transport_network_data
+                              if flows['time_step'] == 0])
+        flows = flows[['id', 'flow_total']].rename(columns={'id': "edge_id", 'flow_total': "baseline_flow"})
+        if ranking == "screening":
+            scores = LinearScreening(self.runner.model).score_edges()
+            flows = flows.merge(scores[["edge_id", "screening_score"]], on="edge_id", how="left")
+            sort_by = "screening_score"
+        else:
+            sort_by = "baseline_flow"
+        flows = flows.sort_values([sort_by, "edge_id"], ascending=[False, True], ignore_index=True)
+        flows["rank"] = flows.index
+        return flows.iloc[self.skipn:self.topn]
+
+    def get_scenario(self, edge: dict) -> dict:
+        return {
+            "name": str(edge['edge_id']),
+            "seed": self.seed + int(edge['rank']),
+            "events": [{"type": "transport_disruption", "description_type": "edge_attributes", "attribute": "id",
+                        "values": [int(edge['edge_id'])], "start_time": 1, "duration": self.duration}]
+        }
+
+    @staticmethod
+    def read_tested_edges(filepath: Path) -> set:
+        if not os.path.exists(filepath):
+            return set()
+        return set(pd.read_csv(filepath, usecols=["edge_id"])["edge_id"])
+
+    def run(self, filepath: Path | str):
+        filepath = Path(filepath)
+        tested_edges = self.read_tested_edges(filepath)
+        edges_to_test = self.ranking[~self.ranking["edge_id"].isin(tested_edges)].to_dict("records")
+        logging.info(f"Criticality analysis: {len(edges_to_test)} edges to test, "
+                     f"{len(self.ranking) - len(edges_to_test)} already in {filepath}")
+        scenarios = [self.get_scenario(edge) for edge in edges_to_test]
+        write_header = not os.path.exists(filepath)
+        with open(filepath, 'a', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=self.columns, extrasaction="ignore")
+            if write_header:
+                writer.writeheader()
+            for edge, result in zip(edges_to_test, self.runner.iterate(scenarios)):
+                writer.writerow({**edge, "duration": self.duration, **result})
+                file.flush()
+        logging.info(f"Criticality analysis written in {filepath}")
@@ -0,0 +1,113 @@
+import copy
+import logging
+import multiprocessing
+import pickle
+import random
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from src.disruption.disruption import DisruptionList
+from src.simulation.export_queue import ExportQueue
+
+if TYPE_CHECKING:
+    from src.model.model import Model
+    from src.simulation.simulation import Simulation
+
+
+# Baseline inherited by the forked workers
+_baseline = None
+
+
+def run_scenario(model: "Model", simulation: "Simulation", scenario: dict, seed: int) -> dict:
+    """Simulate the events of one scenario, from the baseline initial state, and summarize the losses"""
+    random.seed(seed)
+    np.random.seed(seed)
+    model.parameters.set_events(copy.deepcopy(scenario['events']))
+    simulation = model.run_disruption_after_initial_state(simulation)
+    return {"scenario": scenario['name'], "seed": seed, **simulation.calculate_summary_losses(model.household_table)}
+
+
+def run_scenario_in_forked_worker(scenario_and_seed: tuple) -> dict:
+    model, simulation = _baseline
+    return run_scenario(model, simulation, *scenario_and_seed)
+
+
+class EnsembleRunner:
+    """Run many disruption scenarios against the same baseline model
+
+    The baseline, i.e., the transport network, agents, supply chain network and logistic routes of the model,
+    and the initial time step, is built once. Each scenario is then simulated on a pristine copy of it:
+    - with several workers, in a process forked from the baseline, which shares its memory until modified,
+    - otherwise, in the model itself, restored from a snapshot of the baseline before each scenario.
+    Each scenario is a dict with a name, the events to simulate, and optionally a seed. By default, the seed
+    of the i-th scenario is seed + i, so that results do not depend on the number of workers.
+    Files are not exported during the scenario runs.
+    """
+
+    def __init__(self, model: "Model", nb_workers: int = 1, seed: int = 0):
+        if not model.is_initialized():
+            raise ValueError("The model should be set up before running an ensemble")
+        self.model = model
+        self.nb_workers = nb_workers
+        self.seed = seed
+        self.model.parameters = copy.copy(model.parameters)
+        self.model.parameters.export_files = False
+        # The transport flows of the initial state are always computed, e.g., to rank the transport edges
+        if self.model.parameters.transport_flow_time_steps != "all":
+            self.model.parameters.transport_flow_time_steps = \
+                [0] + [t for t in self.model.parameters.transport_flow_time_steps if t != 0]
+        self.model.export_queue.close()
+        self.model.export_queue = ExportQueue(asynchronous=False)
+
+        logging.info("Simulating the baseline initial state")
+        self.baseline_simulation = self.model.initialize_simulation("event")
+        self.model.run_one_time_step(time_step=0, current_simulation=self.baseline_simulation)
+        self.snapshot = None
+
+    def allocate_capital_destructions(self, scenarios: list[dict]) -> list[dict]:
+        """Copies of the scenarios, whose capital destruction files are read and allocated to firms in one pass"""
+        scenarios = [{**scenario, "events": copy.deepcopy(scenario['events'])} for scenario in scenarios]
+        events = [event for scenario in scenarios for event in scenario['events']]
+        capital_destructions = DisruptionList.load_capital_destructions(
+            events, self.model.parameters.monetary_units_in_model, self.model.firm_table, self.model.firms)
+        for i, capital_destruction in capital_destructions.items():
+            events[i]['destroyed_capital_per_firm'] = dict(capital_destruction)
+        return scenarios
+
+    def get_tasks(self, scenarios: list[dict]) -> list[tuple]:
+        tasks = []
+        for i, scenario in enumerate(self.allocate_capital_destructions(scenarios)):
+            scenario = {"name": str(i), **scenario}
+            tasks.append((scenario, scenario.get("seed", self.seed + i)))
+        return tasks
+
+    def run(self, scenarios: list[dict]) -> pd.DataFrame:
+        return pd.DataFrame(list(self.iterate(scenarios)))
+
+    def iterate(self, scenarios: list[dict]):
+        """Yield the summary of each scenario, in the order of the scenarios, as soon as it is available"""
+        global _baseline
+        tasks = self.get_tasks(scenarios)
+        logging.info(f"Running {len(tasks)} scenarios with {self.nb_workers} worker(s)")
+        if self.nb_workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            # A new worker is forked from the baseline for each scenario
+            _baseline = (self.model, self.baseline_simulation)
+            try:
+                with multiprocessing.get_context("fork").Pool(self.nb_workers, maxtasksperchild=1) as pool:
+                    yield from pool.imap(run_scenario_in_forked_worker, tasks, chunksize=1)
+            finally:
+                _baseline = None
+        else:
+            if self.nb_workers > 1:
+                logging.warning("Processes cannot be forked on this platform, scenarios are run sequentially")
+            if self.snapshot is None:
+                self.snapshot = self.model.take_snapshot()
+            baseline_simulation = pickle.dumps(self.baseline_simulation, protocol=pickle.HIGHEST_PROTOCOL)
+            try:
+                for scenario, seed in tasks:
+                    self.model.restore_snapshot(self.snapshot)
+                    yield run_scenario(self.model, pickle.loads(baseline_simulation), scenario, seed)
+            finally:
+                self.model.restore_snapshot(self.snapshot)
@@ -0,0 +1,59 @@
+import logging
+import queue
+import threading
+from typing import Callable
+
+
+class ExportQueue:
+    """Run export tasks in a background writer thread, while the model keeps computing
+
+    Tasks are functions with their arguments, executed in the order in which they are submitted.
+    The buffer is bounded: `submit` blocks when `max_size` tasks are waiting, so that the data waiting
+    to be written does not accumulate in memory. The objects passed to a task should not be modified
+    in place afterward. `close` waits for all tasks to be done and raises the first error which occurred.
+    If not asynchronous, tasks are run right away, in the calling thread, as are tasks submitted by a task.
+    """
+
+    def __init__(self, asynchronous: bool = True, max_size: int = 8):
+        self.asynchronous = asynchronous
+        self.errors = []
+        self.tasks = None
+        self.thread = None
+        if asynchronous:
+            self.tasks = queue.Queue(maxsize=max_size)
+            self.thread = threading.Thread(target=self.run_tasks, name="export", daemon=True)
+            self.thread.start()
+
+    def submit(self, task: Callable, *args, **kwargs):
+        if self.asynchronous and threading.current_thread() is not self.thread:
+            if not self.thread.is_alive():
+                raise RuntimeError("The export queue is closed")
+            self.tasks.put((task, args, kwargs))
+        else:
+            task(*args, **kwargs)
+
+    def run_tasks(self):
+        while True:
+            item = self.tasks.get()
+            if item is None:
+                self.tasks.task_done()
+                break
+            task, args, kwargs = item
+            try:
+                task(*args, **kwargs)
+            except Exception as error:
+                logging.error(f"Export task {getattr(task, '__name__', task)} failed: {error}")
+                self.errors.append(error)
+            self.tasks.task_done()
+
+    def wait(self):
+        """Wait for the tasks submitted so far to be done, e.g., before reading the files they write"""
+        if self.asynchronous and threading.current_thread() is not self.thread:
+            self.tasks.join()
+
+    def close(self):
+        if self.asynchronous and self.thread.is_alive():
+            self.tasks.put(None)
+            self.thread.join()
+        if len(self.errors) > 0:
+            raise self.errors[0]
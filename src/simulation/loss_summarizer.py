@@ -0,0 +1,49 @@
+import pandas as pd
+
+
+class RegionalLossSummarizer:
+    """Aggregate the losses of households per region, sector and time step
+
+    Losses are read from long tables with columns time_step, household, sector, extra_spending
+    and consumption_loss, as produced at record time. Tables can be added at each time step while
+    the simulation runs, or all at once, e.g., from the recorded agent data. Tables are buffered until they
+    hold `chunk_size` rows, then reduced with a single groupby, so that only the region x sector x time step
+    sums are kept in memory.
+    """
+
+    def __init__(self, household_table: pd.DataFrame, chunk_size: int = 100000):
+        self.household_region = pd.Series(household_table['region'].values,
+                                          index='hh_' + household_table['id'].astype(str))
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.nb_buffered_rows = 0
+        self.partial_sums = []
+
+    def add(self, household_losses: pd.DataFrame):
+        self.buffer.append(household_losses)
+        self.nb_buffered_rows += len(household_losses)
+        if self.nb_buffered_rows >= self.chunk_size:
+            self.reduce_buffer()
+
+    def reduce_buffer(self):
+        if self.nb_buffered_rows == 0:
+            return
+        household_losses = pd.concat(self.buffer, ignore_index=True)
+        self.buffer = []
+        self.nb_buffered_rows = 0
+        losses = pd.DataFrame({
+            "region": household_losses['household'].map(self.household_region),
+            "sector": household_losses['sector'],
+            "time_step": household_losses['time_step'],
+            "loss": household_losses['extra_spending'].fillna(0) + household_losses['consumption_loss'].fillna(0)
+        })
+        self.partial_sums.append(losses.groupby(['region', 'sector', 'time_step'], as_index=False)['loss'].sum())
+
+    def get_loss_per_region_sector_time(self) -> pd.DataFrame:
+        self.reduce_buffer()
+        if len(self.partial_sums) == 0:
+            return pd.DataFrame(columns=['region', 'sector', 'time_step', 'loss'])
+        if len(self.partial_sums) > 1:
+            self.partial_sums = [pd.concat(self.partial_sums, ignore_index=True)
+                                 .groupby(['region', 'sector', 'time_step'], as_index=False)['loss'].sum()]
+        return self.partial_sums[0]
@@ -0,0 +1,70 @@
+import logging
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.network.leontief_system import LeontiefSystem
+
+if TYPE_CHECKING:
+    from src.model.model import Model
+
+
+class LinearScreening:
+    """Linear estimate of the impact of disrupting each transport edge, to preselect the edges to simulate
+
+    At equilibrium, the value flowing on each commercial link is given by its order, and it travels on its main route.
+    Disrupting an edge interrupts the links whose route uses it, which hurts the buyers and everything downstream
+    of them. Each interrupted link is thus weighted by the forward multiplier of its supplier, i.e., the row sum
+    of the Ghosh inverse (I - B)^-1, B being the allocation coefficients, which measures the output of all firms
+    downstream supported by one unit of the supplier's output. A backward multiplier, the column sum of the Leontief
+    inverse, would instead measure what the supplier needs from upstream, which a cut supply link does not affect.
+    Since B = diag(x)^-1 A diag(x), with A the firm connectivity matrix and x the production of the firms,
+    the row sums are (I - A)^-1 x / x, obtained by solving (I - A) y = x with the cached LeontiefSystem,
+    without forming the inverse. Imports, and firms which do not produce, have a multiplier of 1.
+    All edges are then scored with one product of the sparse edge x link incidence matrix.
+    """
+
+    def __init__(self, model: "Model"):
+        self.sc_network = model.sc_network
+        self.edge_ids = np.array(sorted(data['id'] for _, _, data in model.transport_network.edges(data=True)))
+        self.incidence = self.build_incidence_matrix()
+        self.multipliers = self.compute_forward_multipliers()
+
+    def build_incidence_matrix(self) -> sparse.csr_matrix:
+        """Sparse matrix, edges x commercial links, with a 1 where the main route of the link uses the edge"""
+        edge_positions = {edge_id: i for i, edge_id in enumerate(self.edge_ids)}
+        rows = []
+        columns = []
+        for j, commercial_link in enumerate(self.sc_network.in_commercial_links):
+            edge_ids = set(getattr(commercial_link.route, 'transport_edge_ids', []))
+            rows += [edge_positions[edge_id] for edge_id in edge_ids]
+            columns += [j] * len(edge_ids)
+        return sparse.csr_matrix((np.ones(len(rows)), (rows, columns)),
+                                 shape=(len(self.edge_ids), len(self.sc_network.in_commercial_links)))
+
+    def compute_forward_multipliers(self) -> np.ndarray:
+        """Forward multiplier of each agent of the supply chain network, as a supplier"""
+        leontief_system = LeontiefSystem.from_sc_network(self.sc_network)
+        firm_slice = self.sc_network.type_slice("firm")
+        production = np.array([firm.production for firm in self.sc_network.index_to_agent[firm_slice]], dtype=float)
+        downstream_output = leontief_system.solve(production)
+        multipliers = np.ones(len(self.sc_network.index_to_agent))
+        multipliers[firm_slice] = np.divide(downstream_output, production, out=np.ones_like(production),
+                                            where=production > 0)
+        return multipliers
+
+    def score_edges(self) -> pd.DataFrame:
+        """Direct flow interrupted and estimated impact of each edge, sorted by decreasing impact"""
+        link_values = np.array([commercial_link.order for commercial_link in self.sc_network.in_commercial_links],
+                               dtype=float)
+        weighted_values = link_values * self.multipliers[self.sc_network.in_indices]
+        scores = pd.DataFrame({
+            "edge_id": self.edge_ids,
+            "direct_flow": self.incidence @ link_values,
+            "screening_score": self.incidence @ weighted_values
+        })
+        logging.info(f"{len(scores)} transport edges screened, "
+                     f"{(scores['screening_score'] > 0).sum()} carry supply chain flows")
+        return scores.sort_values(["screening_score", "edge_id"], ascending=[False, True], ignore_index=True)
@@ -6,6 +6,10 @@ import pandas as pd
 import geopandas as gpd
 
 from src.network.sc_network import ScNetwork
+from src.simulation.agent_data_recorder import AgentDataRecorder, read_agent_data, read_agent_table, \
+    flatten_dicts, TABLES
+from src.simulation.loss_summarizer import RegionalLossSummarizer
+from src.simulation.transport_flow_recorder import TransportFlowRecorder
 
 
 class Simulation(object):
@@ -18,8 +22,37 @@ class Simulation(object):
         self.household_data = []
         self.sc_network_data = []
         self.transport_network_data = []
+        self.diagnostic_data = []
+        self.recorder: AgentDataRecorder | None = None
+        self.loss_summarizer: RegionalLossSummarizer | None = None
+        self.country_losses: list | None = None
+        self.flow_recorder: TransportFlowRecorder | None = None
+
+    def close_recorder(self):
+        if self.recorder:
+            self.recorder.close()
+        if self.flow_recorder:
+            self.flow_recorder.close()
+
+    def store_transport_flows(self, flows_per_edge: list):
+        if self.flow_recorder:
+            self.flow_recorder.record(flows_per_edge)
+        else:
+            self.transport_network_data += flows_per_edge
+
+    def load_recorded_agent_data(self):
+        """Fill firm_data, country_data and household_data from the files written by the recorder"""
+        self.recorder.export_queue.wait()
+        agent_data = read_agent_data(self.recorder.folder)
+        self.firm_data = agent_data['firm_data']
+        self.country_data = agent_data['country_data']
+        self.household_data = agent_data['household_data']
 
     def export_agent_data(self, export_folder):
+        if self.recorder:
+            logging.info(f'Agent data was recorded in {self.recorder.folder}, '
+                         f'use load_recorded_agent_data to get the json outputs')
+            return
         logging.info(f'Exporting agent data to {export_folder}')
         with open(os.path.join(export_folder, 'firm_data.json'), 'w') as jsonfile:
             json.dump(self.firm_data, jsonfile)
@@ -28,7 +61,15 @@ class Simulation(object):
         with open(os.path.join(export_folder, 'household_data.json'), 'w') as jsonfile:
             json.dump(self.household_data, jsonfile)
 
+    def export_diagnostic_data(self, export_folder: Path):
+        if len(self.diagnostic_data) > 0:
+            logging.info(f'Exporting diagnostic data to {export_folder}')
+            pd.DataFrame(self.diagnostic_data).to_csv(os.path.join(export_folder, 'sector_balance.csv'), index=False)
+
     def export_transport_network_data(self, transport_edges: gpd.GeoDataFrame, export_folder: Path):
+        if self.flow_recorder:
+            logging.info(f'Transport flows were recorded in {self.flow_recorder.folder}')
+            return
         logging.info(f'Exporting transport network data to {export_folder}')
         flow_df = pd.DataFrame(self.transport_network_data)
         for time_step in flow_df['time_step'].unique():
@@ -50,22 +91,12 @@ class Simulation(object):
         elif self.type == "event":
             # export loss time series for households
             logging.info(f'Exporting loss time series of households per region sector to {export_folder}')
-            household_result_table = pd.DataFrame(self.household_data)
-            loss_per_region_sector_time = household_result_table.groupby('household').apply(
-                self.summarize_results_one_household).reset_index().drop(columns=['level_1'])
-            household_table['id'] = 'hh_' + household_table['id'].astype(str)
-            loss_per_region_sector_time['region'] = loss_per_region_sector_time['household'].map(
-                household_table.set_index('id')['region'])
-            loss_per_region_sector_time = \
-                loss_per_region_sector_time.groupby(['region', 'sector', 'time_step'], as_index=False)['loss'].sum()
+            loss_per_region_sector_time = self.get_loss_per_region_sector_time(household_table)
             loss_per_region_sector_time.to_csv(export_folder / "loss_per_region_sector_time.csv", index=False)
             household_loss = loss_per_region_sector_time['loss'].sum()
             logging.info(f'Exporting loss time series of countries to {export_folder}')
             # export loss time series for countries
-            country_result_table = pd.DataFrame(self.country_data)
-            country_result_table['loss'] = country_result_table['extra_spending'] \
-                                           + country_result_table['consumption_loss']
-            country_result_table = country_result_table[['time_step', 'country', 'loss']]
+            country_result_table = self.get_country_losses()
             country_loss = country_result_table['loss'].sum()
             country_result_table.to_csv(export_folder / "loss_per_country.csv", index=False)
             logging.info(f"Cumulated household loss: {household_loss:,.2f} {monetary_unit_in_model}")
@@ -74,15 +105,42 @@ class Simulation(object):
             total_loss = pd.DataFrame({"households": household_loss, "countries": country_loss}, index=[0])
             total_loss.to_csv(export_folder / "loss_summary.csv", index=False)
 
-    @staticmethod
-    def summarize_results_one_household(household_result_table_one_household):
-        extra_spending_per_sector_table = pd.DataFrame(
-            household_result_table_one_household.set_index('time_step')['extra_spending_per_sector'].to_dict()
-        ).transpose()
-        consumption_loss_per_sector_table = pd.DataFrame(
-            household_result_table_one_household.set_index('time_step')['consumption_loss_per_sector'].to_dict()
-        ).transpose()
-        loss_per_sector = extra_spending_per_sector_table + consumption_loss_per_sector_table
-        result = loss_per_sector.stack().reset_index()
-        result.columns = ['time_step', 'sector', 'loss']
-        return result
+    def get_loss_per_region_sector_time(self, household_table: pd.DataFrame) -> pd.DataFrame:
+        loss_summarizer = self.loss_summarizer
+        if loss_summarizer is None:
+            loss_summarizer = RegionalLossSummarizer(household_table)
+            loss_summarizer.add(self.get_household_sector_losses())
+        return loss_summarizer.get_loss_per_region_sector_time()
+
+    def get_country_losses(self) -> pd.DataFrame:
+        if self.country_losses is not None:
+            return pd.DataFrame(self.country_losses, columns=['time_step', 'country', 'loss'])
+        if self.recorder:
+            self.recorder.export_queue.wait()
+            country_result_table = read_agent_table(self.recorder.folder, 'country_data')
+        else:
+            country_result_table = pd.DataFrame(self.country_data)
+        country_result_table['loss'] = country_result_table['extra_spending'] \
+                                       + country_result_table['consumption_loss']
+        return country_result_table[['time_step', 'country', 'loss']]
+
+    def calculate_summary_losses(self, household_table: pd.DataFrame) -> dict:
+        """Cumulated losses of households and countries, as exported in loss_summary.csv"""
+        return {
+            "households": self.get_loss_per_region_sector_time(household_table)['loss'].sum(),
+            "countries": self.get_country_losses()['loss'].sum()
+        }
+
+    def get_household_sector_losses(self) -> pd.DataFrame:
+        """Long table of the extra spending and consumption loss per household, sector and time step"""
+        if self.recorder:
+            self.recorder.export_queue.wait()
+            return read_agent_table(self.recorder.folder, 'household_sector_data')
+        columns = {column: [] for column in TABLES['household_sector_data']}
+        for row in self.household_data:
+            for values, new_values in zip(columns.values(), flatten_dicts(row['time_step'], row['household'], {
+                "extra_spending": row['extra_spending_per_sector'],
+                "consumption_loss": row['consumption_loss_per_sector']
+            }).values()):
+                values.extend(new_values)
+        return pd.DataFrame(columns)
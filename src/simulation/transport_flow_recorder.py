@@ -0,0 +1,54 @@
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+from src.simulation.columnar_recorder import ColumnarRecorder, read_table
+from src.simulation.export_queue import ExportQueue
+
+
+class TransportFlowRecorder(ColumnarRecorder):
+    """Stream the transport flows to columnar files, as the simulation goes
+
+    The geometry of the transport edges is written once, as `transport_edges.parquet` (GeoParquet)
+    or `transport_edges.geojson`, depending on the file format.
+    The flows computed by `TransportNetwork.compute_flow_per_segment` are stored as a long table
+    with columns edge_id, time_step, flow_type and flow. Zero flows are not stored.
+    """
+    tables = {"transport_flow_data": {"edge_id": None, "time_step": int, "flow_type": str, "flow": float}}
+
+    def __init__(self, folder: Path | str, file_format: str, transport_edges: gpd.GeoDataFrame,
+                 chunk_size: int = 100000, export_queue: ExportQueue | None = None):
+        super().__init__(folder, file_format, chunk_size, export_queue)
+        edge_geometries = transport_edges[['id', 'geometry']].copy()
+        if self.file_format == "parquet":
+            self.export_queue.submit(edge_geometries.to_parquet, self.folder / "transport_edges.parquet", index=False)
+        else:
+            self.export_queue.submit(edge_geometries.to_file, self.folder / "transport_edges.geojson",
+                                     driver="GeoJSON", index=False)
+
+    def record(self, flows_per_edge: list):
+        for flows in flows_per_edge:
+            for flow_type, flow in flows.items():
+                if flow_type not in ["time_step", "id"] and flow != 0:
+                    self.append("transport_flow_data", [flows['id'], flows['time_step'], flow_type, flow])
+        self.flush_full_tables()
+
+
+def read_transport_edges_with_flows(folder: Path | str, time_step: int) -> gpd.GeoDataFrame:
+    """Rebuild, for one time step, the edges with their flows, as exported in transport_edges_with_flows_*.geojson"""
+    folder = Path(folder)
+    if (folder / "transport_edges.parquet").exists():
+        transport_edges = gpd.read_parquet(folder / "transport_edges.parquet")
+    else:
+        transport_edges = gpd.read_file(folder / "transport_edges.geojson")
+    flows = read_table(folder, "transport_flow_data", list(TransportFlowRecorder.tables["transport_flow_data"]))
+    flows = flows[flows['time_step'] == time_step].pivot(index='edge_id', columns='flow_type', values='flow')
+    transport_edges_with_flows = pd.merge(transport_edges, flows, how="left", left_on="id", right_index=True)
+    transport_edges_with_flows['time_step'] = time_step
+    for column in ['flow_total', 'flow_total_tons']:
+        if column in transport_edges_with_flows.columns:
+            transport_edges_with_flows[column] = transport_edges_with_flows[column].fillna(0)
+        else:
+            transport_edges_with_flows[column] = 0.0
+    return transport_edges_with_flows
@@ -0,0 +1,73 @@
+"""Benchmark of the active set scheduling on a localized transport disruption
+
+Disrupts a single transport edge, runs the disruption with and without active set scheduling,
+and reports, for each time step, the number of active agents out of the total number of agents,
+as well as the run times and whether both runs recorded the same firm data.
+Capacity constraints are switched off, since the active set scheduling does not support them,
+and so is the computation of the transport flows, which requires all agents to ship their products.
+
+The disruption can start after a few time steps, so that the agents still adjusting after the initial
+time step have settled, and the epsilon_stop_condition of the scope can be overridden,
+e.g. 1e-12 for Testkistan, whose flows are small.
+
+Usage: python test/benchmark_active_set.py [scope] [edge_id] [start_time] [duration] [epsilon_stop_condition]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+import paths
+
+from src.model.model import Model
+from src.parameters import Parameters
+
+
+def run(scope, edge_id, start_time, duration, epsilon, active_set_scheduling):
+    random.seed(0)
+    np.random.seed(0)
+    parameters = Parameters.load_parameters(paths.PARAMETER_FOLDER, scope)
+    parameters.export_files = False
+    parameters.simulation_type = "disruption"
+    parameters.events = [{"type": "transport_disruption", "description_type": "edge_attributes",
+                          "attribute": "id", "values": [edge_id], "start_time": start_time,
+                          "duration": duration}]
+    parameters.duration_dic = {key: value + start_time - 1 for key, value in parameters.duration_dic.items()}
+    parameters.capacity_constraint = False
+    parameters.transport_flow_time_steps = []
+    if epsilon is not None:
+        parameters.epsilon_stop_condition = epsilon
+    parameters.active_set_scheduling = active_set_scheduling
+    model = Model(parameters)
+    model.setup_transport_network(cached=False)
+    model.setup_agents(cached=False)
+    model.setup_sc_network(cached=False)
+    model.set_initial_conditions()
+    model.setup_logistic_routes(cached=False)
+    start = time.time()
+    simulation = model.run_disruption()
+    return model, simulation, time.time() - start
+
+
+def main(scope="Testkistan", edge_id=0, start_time=1, duration=2, epsilon=None):
+    model, simulation, active_set_time = run(scope, edge_id, start_time, duration, epsilon, True)
+    _, reference_simulation, full_time = run(scope, edge_id, start_time, duration, epsilon, False)
+
+    nb_agents = len(model.sc_network.index_to_agent)
+    nb_active_agents = model.scheduler.nb_active_agents
+    print(f"{'time step':<12}{'active agents':>16}{'share':>10}")
+    for time_step, nb_active in enumerate(nb_active_agents, start=1):
+        print(f"{time_step:<12}{nb_active:>8} / {nb_agents:<5}{nb_active / nb_agents:>10.0%}")
+    print(f"agent updates: {sum(nb_active_agents)} instead of {nb_agents * len(nb_active_agents)} "
+          f"({sum(nb_active_agents) / (nb_agents * len(nb_active_agents)):.0%})")
+    print(f"run time: {active_set_time:.3f}s instead of {full_time:.3f}s")
+    print(f"same firm data: {simulation.firm_data == reference_simulation.firm_data}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "Testkistan",
+         int(sys.argv[2]) if len(sys.argv) > 2 else 0,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 1,
+         int(sys.argv[4]) if len(sys.argv) > 4 else 2,
+         float(sys.argv[5]) if len(sys.argv) > 5 else None)
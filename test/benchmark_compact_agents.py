@@ -0,0 +1,82 @@
+"""Memory benchmark of the compact (slotted) agents and commercial links
+
+Builds the same number of standard and compact objects, filled with values similar to those
+of a running model, including a few clients, retailers or exporting firms per agent, and reports the memory allocated per object and the pickled size per object.
+
+Usage: python test/benchmark_compact_agents.py [nb_objects]
+"""
+import pickle
+import sys
+import tracemalloc
+
+import paths
+
+from src.agents.firm import Firm, CompactFirm
+from src.agents.household import Household, CompactHousehold
+from src.agents.country import Country, CompactCountry
+from src.network.commercial_link import CommercialLink, CompactCommercialLink
+
+# Number of clients, retailers or exporting firms given to each agent
+NB_PARTNERS = 5
+
+
+def make_firm(firm_class, i):
+    firm = firm_class(i, od_point=i % 100, sector=f"REG_SEC{i % 20}", sector_type="agriculture",
+                      name=f"firm_{i}", long=float(i), lat=float(i), production=1.5 * i)
+    firm.finance['costs']['transport'] += 0.1
+    for j in range(NB_PARTNERS):
+        firm.clients[i + j] = firm.client_info_class(sector=f"REG_SEC{j}", share=0.2, transport_share=0.2,
+                                                     distance=float(j))
+    return firm
+
+
+def make_household(household_class, i):
+    household = household_class(f"hh_{i}", od_point=i % 100, name=f"household_{i}", long=float(i), lat=float(i),
+                                population=1000, sector_consumption={})
+    for j in range(NB_PARTNERS):
+        household.retailers[i + j] = household.retailer_info_class(sector=f"REG_SEC{j}", weight=0.2)
+    return household
+
+
+def make_country(country_class, i):
+    country = country_class(pid=f"CNT{i}", od_point=i % 100, long=float(i), lat=float(i))
+    for j in range(NB_PARTNERS):
+        country.qty_purchased_perfirm[i + j] = country.supplier_info_class(sector=f"REG_SEC{j}", weight=0.2,
+                                                                           amount=1.5 * j)
+        country.clients[f"CNT{j}"] = country.client_info_class(sector=f"CNT{j}", share=0, transport_share=0)
+    return country
+
+
+def make_link(link_class, i):
+    return link_class(pid=(i, i + 1), supplier_id=i, buyer_id=i + 1, product=f"REG_SEC{i % 20}",
+                      product_type="agriculture", category="domestic_B2B")
+
+
+def measure(factory, klass, nb_objects):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(klass, i) for i in range(nb_objects)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    pickled = pickle.dumps(objects, protocol=pickle.HIGHEST_PROTOCOL)
+    return (after - before) / nb_objects, len(pickled) / nb_objects
+
+
+def main(nb_objects=10000):
+    cases = [
+        ("Firm", make_firm, Firm, CompactFirm),
+        ("Household", make_household, Household, CompactHousehold),
+        ("Country", make_country, Country, CompactCountry),
+        ("CommercialLink", make_link, CommercialLink, CompactCommercialLink)
+    ]
+    print(f"{'class':<16}{'memory (B/obj)':>24}{'pickle (B/obj)':>24}{'saving':>10}")
+    for name, factory, standard_class, compact_class in cases:
+        standard_memory, standard_pickle = measure(factory, standard_class, nb_objects)
+        compact_memory, compact_pickle = measure(factory, compact_class, nb_objects)
+        print(f"{name:<16}{standard_memory:>11.0f} -> {compact_memory:<10.0f}"
+              f"{standard_pickle:>11.0f} -> {compact_pickle:<10.0f}"
+              f"{1 - compact_memory / standard_memory:>9.0%}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)